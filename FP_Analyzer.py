@@ -0,0 +1,534 @@
+import argparse
+import bisect
+import json
+import time
+import FP_Targets
+from collections import defaultdict
+from FP_Log import get_logger
+from FP_IPIndex import AddressIndex, load_rule_files
+from FP_ObjectResolver import load_object_resolver
+from FP_Simulator import RULE_FIELDS, PolicySimulator
+
+logger = get_logger(__name__)
+
+# Dimensões em que duas regras podem diferir e ainda assim ser unidas em uma só
+MERGE_DIMENSIONS = ['source_networks', 'destination_networks', 'destination_ports']
+
+class CandidateSet:
+    """
+    Regras candidatas de uma dimensão entre as posições lo e hi (hi exclusivo), sem montar a lista:
+    trechos de listas ordenadas de posições (as regras "any" da dimensão, as de uma zona, as de um
+    intervalo de rede ou de portas). Com everything, todas as regras do intervalo são candidatas.
+    """
+
+    def __init__(self, lo, hi, everything=False):
+        self.lo = lo
+        self.hi = hi
+        self.everything = everything
+        self.runs = []
+
+    def add_run(self, positions, members):
+        """
+        Acrescenta as posições da lista ordenada positions (com o conjunto members delas) que estão no intervalo.
+        """
+        first = bisect.bisect_left(positions, self.lo)
+        last = bisect.bisect_left(positions, self.hi)
+        if first < last:
+            self.runs.append((positions, members, first, last))
+
+    def __len__(self):
+        """
+        Limite superior da quantidade de candidatas (trechos diferentes podem repetir uma regra).
+        """
+        if self.everything:
+            return self.hi - self.lo
+        return sum(last - first for _, _, first, last in self.runs)
+
+    def intersection(self, positions):
+        """
+        As posições de positions (todas dentro do intervalo) que também são candidatas aqui.
+        """
+        if self.everything:
+            return positions
+        result = set()
+        for _, members, _, _ in self.runs:
+            result |= positions & members
+        return result
+
+    def positions(self):
+        if self.everything:
+            return set(range(self.lo, self.hi))
+        result = set()
+        for positions, _, first, last in self.runs:
+            result.update(positions[first:last])
+        return result
+
+def intersect_candidates(candidate_sets):
+    """
+    Posições presentes em todos os conjuntos. Só o menor é montado; os outros só são intersectados com ele.
+    """
+    candidate_sets = sorted(candidate_sets, key=len)
+    result = candidate_sets[0].positions()
+    for candidates in candidate_sets[1:]:
+        if not result:
+            break
+        result = candidates.intersection(result)
+    return result
+
+def positions_by(rules, key):
+    """
+    {valor: (posições em ordem, conjunto das posições)} das regras, agrupadas por key(regra).
+    """
+    groups = defaultdict(list)
+    for position, rule in enumerate(rules):
+        groups[key(rule)].append(position)
+    return {value: (positions, set(positions)) for value, positions in groups.items()}
+
+class IntervalRuns:
+    """
+    Índice de intervalos (por chave: versão de IP ou protocolo) em que cada intervalo distinto guarda
+    as posições das regras que o usam, em ordem. A busca devolve essas listas inteiras, então o custo
+    não cresce com a quantidade de regras que repetem o mesmo objeto.
+    """
+
+    def __init__(self):
+        self.index = AddressIndex()
+        self.positions = defaultdict(list)
+
+    def add(self, key, start, end, position):
+        positions = self.positions[(key, start, end)]
+        if not positions or positions[-1] != position:
+            positions.append(position)
+
+    def build(self):
+        for interval, positions in self.positions.items():
+            self.index.add_interval(interval, None, (interval[2], positions, set(positions)))
+        self.index.build()
+
+    def search(self, key, start, end):
+        """
+        [(fim do intervalo, posições, conjunto das posições)] dos intervalos com interseção com (start, end).
+        """
+        return [ref for _, ref in self.index.search_interval((key, start, end))]
+
+class NetworkDimension:
+    """
+    Índice de intervalos de uma dimensão de rede (origem ou destino), com as regras de cada intervalo.
+    Regras "any" nessa dimensão ficam numa lista à parte, em ordem.
+    """
+
+    def __init__(self, rules, attribute):
+        self.attribute = attribute
+        self.index = IntervalRuns()
+        any_rules = []
+        for position, rule in enumerate(rules):
+            networks = getattr(rule, attribute)
+            if networks is None:
+                any_rules.append(position)
+                continue
+            for version, (starts, ends) in networks.ranges.items():
+                for start, end in zip(starts, ends):
+                    self.index.add(version, start, end, position)
+        self.index.build()
+        self.any_rules = (any_rules, set(any_rules))
+
+    def covering(self, networks, before):
+        """
+        Regras anteriores a before que podem conter networks: as "any" e as com um intervalo que contém
+        o primeiro intervalo de networks (os intervalos de cada regra são disjuntos, então só uma regra
+        assim pode conter networks inteiro).
+        """
+        if networks is not None and not networks.ranges:
+            return CandidateSet(0, before, everything=True)
+        candidates = CandidateSet(0, before)
+        candidates.add_run(*self.any_rules)
+        if networks is not None:
+            version = min(networks.ranges)
+            starts, ends = networks.ranges[version]
+            first, last = starts[0], ends[0]
+            for end, positions, members in self.index.search(version, first, first):
+                if end >= last:
+                    candidates.add_run(positions, members)
+        return candidates
+
+    def overlapping(self, networks, lo, hi):
+        """
+        Regras entre lo e hi com algum endereço em comum com networks.
+        """
+        if networks is None:
+            return CandidateSet(lo, hi, everything=True)
+        candidates = CandidateSet(lo, hi)
+        candidates.add_run(*self.any_rules)
+        for version, (starts, ends) in networks.ranges.items():
+            for start, end in zip(starts, ends):
+                for _, positions, members in self.index.search(version, start, end):
+                    candidates.add_run(positions, members)
+        return candidates
+
+class ZoneDimension:
+    """
+    Regras de cada zona (origem ou destino), em ordem; as regras "any" ficam numa lista à parte.
+    """
+
+    def __init__(self, rules, attribute):
+        self.attribute = attribute
+        zones = defaultdict(list)
+        any_rules = []
+        for position, rule in enumerate(rules):
+            rule_zones = getattr(rule, attribute)
+            if rule_zones is None:
+                any_rules.append(position)
+            for zone in rule_zones or ():
+                zones[zone].append(position)
+        self.zones = {zone: (positions, set(positions)) for zone, positions in zones.items()}
+        self.any_rules = (any_rules, set(any_rules))
+
+    def covering(self, zones, before):
+        """
+        Regras anteriores a before que podem conter todas as zonas em zones: as "any" e as da zona
+        de zones com menos regras.
+        """
+        if zones is not None and not zones:
+            return CandidateSet(0, before, everything=True)
+        candidates = CandidateSet(0, before)
+        candidates.add_run(*self.any_rules)
+        if zones is not None:
+            zone_candidates = []
+            for zone in zones:
+                candidates_of_zone = CandidateSet(0, before)
+                candidates_of_zone.add_run(*self.zones.get(zone, ((), set())))
+                zone_candidates.append(candidates_of_zone)
+            candidates.runs.extend(min(zone_candidates, key=len).runs)
+        return candidates
+
+    def overlapping(self, zones, lo, hi):
+        """
+        Regras entre lo e hi com alguma zona em comum com zones.
+        """
+        if zones is None:
+            return CandidateSet(lo, hi, everything=True)
+        candidates = CandidateSet(lo, hi)
+        candidates.add_run(*self.any_rules)
+        for zone in zones:
+            candidates.add_run(*self.zones.get(zone, ((), set())))
+        return candidates
+
+class PortDimension:
+    """
+    Índice de intervalos de portas (origem ou destino) por protocolo, com as regras de cada intervalo;
+    entradas sem protocolo ficam sob a chave None. Regras "any" ficam numa lista à parte, em ordem.
+    """
+
+    def __init__(self, rules, attribute):
+        self.attribute = attribute
+        self.index = IntervalRuns()
+        self.protocols = set()
+        any_rules = []
+        for position, rule in enumerate(rules):
+            ports = getattr(rule, attribute)
+            if ports is None:
+                any_rules.append(position)
+                continue
+            for proto, first, last in ports:
+                self.protocols.add(proto)
+                self.index.add(proto, first, last, position)
+        self.index.build()
+        self.any_rules = (any_rules, set(any_rules))
+
+    def covering(self, ports, before):
+        """
+        Regras anteriores a before que podem cobrir as portas em ports: as "any" e as com uma entrada
+        que cobre a primeira entrada de ports (mesmo protocolo ou sem protocolo, e intervalo que a contém).
+        """
+        if ports is not None and not ports:
+            return CandidateSet(0, before, everything=True)
+        candidates = CandidateSet(0, before)
+        candidates.add_run(*self.any_rules)
+        if ports is not None:
+            proto, first, last = ports[0]
+            for key in {proto, None}:
+                for end, positions, members in self.index.search(key, first, first):
+                    if end >= last:
+                        candidates.add_run(positions, members)
+        return candidates
+
+    def overlapping(self, ports, lo, hi):
+        """
+        Regras entre lo e hi com alguma porta em comum com ports.
+        """
+        if ports is None:
+            return CandidateSet(lo, hi, everything=True)
+        candidates = CandidateSet(lo, hi)
+        candidates.add_run(*self.any_rules)
+        for proto, first, last in ports:
+            for key in (self.protocols if proto is None else {proto, None}):
+                for _, positions, members in self.index.search(key, first, last):
+                    candidates.add_run(positions, members)
+        return candidates
+
+class RuleAnalyzer:
+    """
+    Analisa a ordem das regras de uma política (já compiladas pelo FP_Simulator) e encontra:
+    - regras sombreadas: uma regra anterior casa com tudo o que ela casaria, com outra ação;
+    - regras redundantes: idem, mas a regra anterior tem a mesma ação;
+    - candidatas a união: regras com a mesma ação que diferem em uma única dimensão
+      (origem, destino ou portas) e podem virar uma regra só sem mudar o resultado.
+    Em vez de comparar todos os pares (O(n²)), cada dimensão tem seu índice: intervalos das redes
+    de origem e destino, intervalos de portas por protocolo e as regras de cada zona. As candidatas
+    de todas as dimensões são intersectadas, a partir da dimensão com menos candidatas, e só as que
+    sobram passam pela verificação completa. Regras "any" em uma dimensão são buscadas por bisect
+    na lista ordenada delas, sem percorrê-la.
+    """
+
+    def __init__(self, rules):
+        self.rules = rules
+        self.dimensions = [
+            NetworkDimension(rules, 'source_networks'),
+            NetworkDimension(rules, 'destination_networks'),
+            PortDimension(rules, 'destination_ports'),
+            PortDimension(rules, 'source_ports'),
+            ZoneDimension(rules, 'source_zones'),
+            ZoneDimension(rules, 'destination_zones'),
+        ]
+        # Regras com condições não avaliadas não cobrem nenhuma outra (ver covers)
+        self.evaluated = positions_by(rules, lambda rule: not rule.unevaluated).get(True, ([], set()))
+        self.by_action = positions_by(rules, lambda rule: rule.action)
+
+    def _covering_candidates(self, position):
+        """
+        Regras anteriores que podem cobrir a regra position em todas as dimensões indexadas.
+        """
+        rule = self.rules[position]
+        evaluated = CandidateSet(0, position)
+        evaluated.add_run(*self.evaluated)
+        return intersect_candidates(
+            [dimension.covering(getattr(rule, dimension.attribute), position) for dimension in self.dimensions] + [evaluated]
+        )
+
+    def _conflicting_candidates(self, position, after):
+        """
+        Regras entre after e position, com outra ação, que podem ter interseção com a regra position
+        em todas as dimensões indexadas.
+        """
+        rule = self.rules[position]
+        other_actions = CandidateSet(after + 1, position)
+        for action, run in self.by_action.items():
+            if action != rule.action:
+                other_actions.add_run(*run)
+        return intersect_candidates(
+            [dimension.overlapping(getattr(rule, dimension.attribute), after + 1, position) for dimension in self.dimensions]
+            + [other_actions]
+        )
+
+    def analyze(self):
+        shadowed, redundant = [], []
+        covered = set()
+        for position, rule in enumerate(self.rules):
+            if is_empty(rule):
+                continue
+            for candidate in sorted(self._covering_candidates(position)):
+                earlier = self.rules[candidate]
+                if covers(earlier, rule):
+                    entry = dict(rule_summary(rule), by=rule_summary(earlier))
+                    (redundant if earlier.action == rule.action else shadowed).append(entry)
+                    covered.add(position)
+                    break
+        return {
+            'rules': len(self.rules),
+            'shadowed': shadowed,
+            'redundant': redundant,
+            'merge_candidates': self._merge_candidates(covered),
+        }
+
+    def _merge_candidates(self, covered):
+        """
+        Agrupa regras que só diferem em uma dimensão. Uma regra só entra no grupo se nenhuma regra
+        no meio do caminho, com outra ação, tiver interseção com ela (senão a união mudaria o resultado).
+        """
+        groups = defaultdict(list)
+        for position, rule in enumerate(self.rules):
+            if position in covered or rule.unevaluated or is_empty(rule):
+                continue
+            signature = rule_signature(rule)
+            for dimension in MERGE_DIMENSIONS:
+                key = tuple(value for name, value in signature if name != dimension)
+                groups[(dimension, key)].append(position)
+
+        candidates = []
+        for (dimension, _), positions in groups.items():
+            chain = [positions[0]]
+            for position in positions[1:]:
+                conflict = any(
+                    overlaps(self.rules[index], self.rules[position])
+                    for index in sorted(self._conflicting_candidates(position, chain[0]))
+                )
+                if conflict:
+                    if len(chain) > 1:
+                        candidates.append(self._merge_group(dimension, chain))
+                    chain = [position]
+                else:
+                    chain.append(position)
+            if len(chain) > 1:
+                candidates.append(self._merge_group(dimension, chain))
+        candidates.sort(key=lambda candidate: candidate['rules'][0]['position'])
+        return candidates
+
+    def _merge_group(self, dimension, positions):
+        return {
+            'dimension': dimension,
+            'action': self.rules[positions[0]].action,
+            'rules': [rule_summary(self.rules[position]) for position in positions],
+        }
+
+def rule_summary(rule):
+    return {'rule': rule.name, 'position': rule.position, 'action': rule.action}
+
+def rule_signature(rule):
+    """
+    Representação comparável de cada dimensão da regra, usada para achar regras que só diferem em uma.
+    """
+    return (
+        ('action', rule.action),
+        ('source_zones', tuple(sorted(rule.source_zones)) if rule.source_zones is not None else None),
+        ('destination_zones', tuple(sorted(rule.destination_zones)) if rule.destination_zones is not None else None),
+        ('source_networks', network_key(rule.source_networks)),
+        ('destination_networks', network_key(rule.destination_networks)),
+        ('source_ports', tuple(sorted(rule.source_ports, key=str)) if rule.source_ports is not None else None),
+        ('destination_ports', tuple(sorted(rule.destination_ports, key=str)) if rule.destination_ports is not None else None),
+    )
+
+def network_key(networks):
+    if networks is None:
+        return None
+    return tuple((version, tuple(starts), tuple(ends)) for version, (starts, ends) in sorted(networks.ranges.items()))
+
+def is_empty(rule):
+    """
+    Regra cuja condição de rede não resolve para nenhum IP: nunca casa, então fica fora da análise.
+    """
+    return any(networks is not None and not networks.ranges for networks in (rule.source_networks, rule.destination_networks))
+
+def covers(earlier, rule):
+    """
+    True se earlier casa com todo fluxo que rule casaria. Regras com condições não avaliadas
+    (aplicações, URLs...) não cobrem nada, pois podem deixar de casar.
+    """
+    if earlier.unevaluated:
+        return False
+    return (
+        zones_cover(earlier.source_zones, rule.source_zones)
+        and zones_cover(earlier.destination_zones, rule.destination_zones)
+        and networks_cover(earlier.source_networks, rule.source_networks)
+        and networks_cover(earlier.destination_networks, rule.destination_networks)
+        and ports_cover(earlier.destination_ports, rule.destination_ports)
+        and ports_cover(earlier.source_ports, rule.source_ports)
+    )
+
+def overlaps(first, second):
+    """
+    True se existe algum fluxo que casaria com as duas regras.
+    """
+    return (
+        zones_overlap(first.source_zones, second.source_zones)
+        and zones_overlap(first.destination_zones, second.destination_zones)
+        and networks_overlap(first.source_networks, second.source_networks)
+        and networks_overlap(first.destination_networks, second.destination_networks)
+        and ports_overlap(first.destination_ports, second.destination_ports)
+        and ports_overlap(first.source_ports, second.source_ports)
+    )
+
+def zones_cover(outer, inner):
+    if outer is None:
+        return True
+    return inner is not None and inner <= outer
+
+def zones_overlap(first, second):
+    return first is None or second is None or bool(first & second)
+
+def networks_cover(outer, inner):
+    if outer is None:
+        return True
+    if inner is None:
+        return False
+    for version, (starts, ends) in inner.ranges.items():
+        outer_starts, outer_ends = outer.ranges.get(version, ((), ()))
+        for start, end in zip(starts, ends):
+            position = bisect.bisect_right(outer_starts, start) - 1
+            if position < 0 or outer_ends[position] < end:
+                return False
+    return True
+
+def networks_overlap(first, second):
+    if first is None or second is None:
+        return True
+    for version, (starts, ends) in second.ranges.items():
+        other_starts, other_ends = first.ranges.get(version, ((), ()))
+        for start, end in zip(starts, ends):
+            # Primeiro intervalo de first que termina em ou depois de start
+            position = bisect.bisect_left(other_ends, start)
+            if position < len(other_starts) and other_starts[position] <= end:
+                return True
+    return False
+
+def ports_cover(outer, inner):
+    if outer is None:
+        return True
+    if inner is None:
+        return False
+    return all(
+        any((outer_proto is None or outer_proto == proto) and outer_first <= first and last <= outer_last
+            for outer_proto, outer_first, outer_last in outer)
+        for proto, first, last in inner
+    )
+
+def ports_overlap(first, second):
+    if first is None or second is None:
+        return True
+    return any(
+        (proto is None or other_proto is None or proto == other_proto) and start <= other_last and other_start <= last
+        for proto, start, last in first
+        for other_proto, other_start, other_last in second
+    )
+
+def analyze_policy(filename, rules, resolver):
+    """
+    Compila e analisa as regras de uma política, retornando o relatório com o tempo gasto.
+    """
+    start = time.perf_counter()
+    report = RuleAnalyzer(PolicySimulator(rules, resolver).rules).analyze()
+    report['policy'] = filename
+    report['elapsed'] = round(time.perf_counter() - start, 3)
+    logger.info(f"Análise de {filename}: {len(report['shadowed'])} sombreadas, {len(report['redundant'])} redundantes, "
+                f"{len(report['merge_candidates'])} candidatas a união em {report['elapsed']}s")
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Encontra regras sombreadas, redundantes e candidatas a união.")
+    parser.add_argument("policies", nargs="*", help="Arquivos de política em data/acp_rules (padrão: todos)")
+    parser.add_argument("--json", action="store_true", help="Saída em JSON")
+    parser.add_argument("--target", default=FP_Targets.DEFAULT_TARGET, help="Chave do FMC/domínio (ver FP_Targets.py)")
+    args = parser.parse_args()
+    if args.target != FP_Targets.DEFAULT_TARGET:
+        target = FP_Targets.get_target(args.target)
+        if target is None:
+            parser.error(f"Alvo não encontrado: {args.target}")
+        FP_Targets.bind_target(target)
+
+    resolver = load_object_resolver()
+    reports = [
+        analyze_policy(filename, rules, resolver)
+        for filename, rules in load_rule_files(fields=RULE_FIELDS)
+        if not args.policies or filename in args.policies
+    ]
+    if args.json:
+        print(json.dumps(reports, indent=4))
+    else:
+        for report in reports:
+            print(f"{report['policy']}: {report['rules']} regras analisadas")
+            for entry in report['shadowed']:
+                print(f"  sombreada  #{entry['position']} {entry['rule']} ({entry['action']}) por #{entry['by']['position']} {entry['by']['rule']} ({entry['by']['action']})")
+            for entry in report['redundant']:
+                print(f"  redundante #{entry['position']} {entry['rule']} por #{entry['by']['position']} {entry['by']['rule']}")
+            for candidate in report['merge_candidates']:
+                rules = ", ".join(f"#{rule['position']} {rule['rule']}" for rule in candidate['rules'])
+                print(f"  unir ({candidate['dimension']}): {rules}")
@@ -0,0 +1,239 @@
+import argparse
+import asyncio
+import json
+import random
+import ssl
+import time
+import requests
+import config
+import FP_Targets
+from FP_Client import get_client, MAX_RETRIES, PAGE_SIZE, POOL_SIZE
+from FP_DynamicObject import get_dynamic_objects
+from FP_StaticObject import STATIC_OBJECT_TYPES
+from FP_Log import get_logger, timed
+
+try:
+    import aiohttp
+except ImportError:  # Sem aiohttp, as chamadas usam a Session do FMCClient em threads (asyncio.to_thread)
+    aiohttp = None
+
+logger = get_logger(__name__)
+
+# Chamadas em andamento ao mesmo tempo (o FMC aceita até 10 conexões simultâneas).
+# Pode ser ajustado com async_max_concurrency no config.py.
+MAX_CONCURRENCY = POOL_SIZE
+# Back-off após 429, 5xx ou falha de conexão: espera aleatória ("full jitter") de até
+# RETRY_BASE_DELAY * 2^tentativa segundos, limitada a RETRY_MAX_DELAY
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 60.0
+# Tempo máximo de uma chamada, em segundos
+REQUEST_TIMEOUT = 120
+# Intervalo entre tentativas de pegar uma vaga de conexão do FMCClient, em segundos
+CONNECTION_POLL_INTERVAL = 0.05
+
+if aiohttp is not None:
+    RETRY_EXCEPTIONS = (aiohttp.ClientConnectionError, asyncio.TimeoutError, requests.exceptions.ConnectionError)
+else:
+    RETRY_EXCEPTIONS = (asyncio.TimeoutError, requests.exceptions.ConnectionError)
+
+class AsyncFMCClient:
+    """
+    Cliente assíncrono para leituras em massa no FMC, usado como "async with AsyncFMCClient() as client".
+    Usa o token, o orçamento de requisições (RateLimiter) e o limite de conexões do FMCClient do
+    alvo atual, então pode rodar junto com a sincronização em threads sem ultrapassar os limites do FMC.
+    """
+
+    def __init__(self, client=None, max_concurrency=None):
+        self.client = client or get_client()
+        self.max_concurrency = max_concurrency or getattr(config, 'async_max_concurrency', MAX_CONCURRENCY)
+        self._semaphore = None
+        self._session = None
+
+    async def __aenter__(self):
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        if aiohttp is not None:
+            connector = aiohttp.TCPConnector(limit=self.max_concurrency, ssl=_ssl_option(self.client.verify))
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                headers={"Content-Type": "application/json", "Accept": "application/json"},
+                timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT),
+            )
+        return self
+
+    async def __aexit__(self, *exc_info):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def _send(self, url, params, token):
+        """
+        Envia um GET e retorna (status, cabeçalhos, corpo).
+        """
+        headers = {"X-auth-access-token": token or ""}
+        if self._session is None:
+            response = await asyncio.to_thread(self._send_blocking, url, params, headers)
+            return response.status_code, response.headers, response.content
+        # Conta na mesma vaga de conexão usada pelas chamadas em threads do FMCClient. A vaga é
+        # pega sem bloquear, no próprio loop: se a tarefa for cancelada enquanto espera, nenhuma
+        # vaga fica presa (um acquire bloqueante em outra thread terminaria sem ninguém para liberar)
+        while not self.client.connections.acquire(blocking=False):
+            await asyncio.sleep(CONNECTION_POLL_INTERVAL)
+        try:
+            async with self._session.get(url, params=params, headers=headers) as response:
+                return response.status, response.headers, await response.read()
+        finally:
+            self.client.connections.release()
+
+    def _send_blocking(self, url, params, headers):
+        with self.client.connections:
+            return self.client.session.get(url, params=params, headers=headers,
+                                           verify=self.client.verify, timeout=REQUEST_TIMEOUT)
+
+    async def get(self, path, params=None):
+        """
+        Faz um GET e retorna o JSON da resposta. Renova o token uma vez em caso de 401 e repete
+        429, 5xx e falhas de conexão com back-off aleatório. Levanta requests.exceptions.HTTPError
+        para os demais erros.
+        """
+        url = self.client.url(path)
+        token = await asyncio.to_thread(self.client.token_manager.get_token)
+        token_refreshed = False
+        attempt = 0
+        while True:
+            # Espera a vez no orçamento de requisições do FMC sem bloquear o loop
+            while (wait := self.client.rate_limiter.try_acquire()) > 0:
+                await asyncio.sleep(wait)
+            self.client.count_request()
+            start = time.perf_counter()
+            try:
+                async with self._semaphore:
+                    status, headers, body = await self._send(url, params, token)
+            except RETRY_EXCEPTIONS as e:
+                if attempt >= MAX_RETRIES:
+                    raise requests.exceptions.ConnectionError(f"Falha de conexão em {url}: {e}") from e
+                delay = _retry_delay(None, attempt)
+                logger.warning(f"Falha de conexão com o FMC ({e}). Nova tentativa em {delay:.1f}s...")
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            logger.debug("GET %s -> %s em %.3fs", url, status, time.perf_counter() - start)
+            if status == 401 and not token_refreshed:
+                logger.warning("Erro 401 na chamada à API. Tentando obter um novo token.")
+                token = await asyncio.to_thread(self.client.token_manager.get_token, True, token)
+                token_refreshed = True
+                continue
+            if (status == 429 or status >= 500) and attempt < MAX_RETRIES:
+                delay = _retry_delay(headers.get("Retry-After"), attempt)
+                logger.warning(f"FMC respondeu {status}. Nova tentativa em {delay:.1f}s...")
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            if status >= 400:
+                raise requests.exceptions.HTTPError(f"{status} Error: {body[:200]!r} for url: {url}")
+            return json.loads(body)
+
+    async def get_all(self, path, expanded=True, page_size=PAGE_SIZE, params=None):
+        """
+        Retorna a lista completa de itens de um endpoint de listagem. A primeira página informa
+        paging.count; as demais são pedidas ao mesmo tempo, por offset, e juntadas em ordem.
+        """
+        base_params = dict(params or {})
+        if expanded:
+            base_params["expanded"] = "true"
+        base_params["limit"] = page_size
+        first_page = await self.get(path, params=dict(base_params, offset=0))
+        items = list(first_page.get('items', []))
+        total = (first_page.get('paging') or {}).get('count', len(items))
+        if items and len(items) < total:
+            # O FMC pode devolver menos que o limit pedido: usa o tamanho real da primeira página
+            pages = await asyncio.gather(*(
+                self.get(path, params=dict(base_params, offset=offset))
+                for offset in range(len(items), total, len(items))
+            ))
+            for page in pages:
+                items.extend(page.get('items', []))
+        return items
+
+def _ssl_option(verify):
+    """
+    Converte o verify do requests (True, False ou caminho de um CA bundle) para o parâmetro ssl do aiohttp.
+    """
+    if isinstance(verify, str):
+        return ssl.create_default_context(cafile=verify)
+    return None if verify else False
+
+def _retry_delay(retry_after, attempt):
+    """
+    Espera antes de repetir: o Retry-After do FMC, quando presente, senão back-off exponencial
+    com jitter, para que as chamadas que falharam juntas não voltem todas ao mesmo tempo.
+    """
+    if retry_after and str(retry_after).isdigit():
+        return int(retry_after) + random.uniform(0, 1)
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+
+async def _static_objects_of_type(client, object_type, description):
+    try:
+        items = await client.get_all(f"object/{object_type}")
+        logger.info(f"Encontrados {len(items)} {description}.")
+        return items
+    except requests.exceptions.RequestException as e:
+        logger.error(f"Erro ao obter {description}: {e}")
+        return None
+
+async def _collect_static_objects(object_types):
+    async with AsyncFMCClient() as client:
+        results = await asyncio.gather(*(
+            _static_objects_of_type(client, object_type, description) for object_type, description in object_types
+        ))
+    if any(items is None for items in results):
+        return None
+    return [item for items in results for item in items]
+
+def collect_static_objects(object_types=STATIC_OBJECT_TYPES):
+    """
+    Obtém os objetos estáticos de todos os tipos ao mesmo tempo, com o mesmo resultado de
+    FP_StaticObject.get_static_objects. Um tipo que falhar é registrado no log, e o resultado é None.
+    """
+    return asyncio.run(_collect_static_objects(object_types))
+
+async def _dynamic_object_content(client, item, on_done):
+    object_id = item.get('id')
+    object_name = item.get('name')
+    item_with_content = item.copy()
+    item_with_content['content'] = []
+    if item.get('objectType') == 'IP':
+        try:
+            mappings = await client.get_all(f"object/dynamicobjects/{object_id}/mappings", expanded=False)
+            item_with_content['content'] = [mapping.get('mapping') for mapping in mappings if mapping.get('mapping')]
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Erro ao obter mappings para o objeto '{object_name}' (ID: {object_id}): {e}")
+    if on_done:
+        on_done()
+    return item_with_content
+
+async def _collect_dynamic_object_content(items, on_done):
+    async with AsyncFMCClient() as client:
+        return await asyncio.gather(*(_dynamic_object_content(client, item, on_done) for item in items))
+
+def collect_dynamic_object_content(items, on_done=None):
+    """
+    Retorna cópias dos objetos dinâmicos com os IPs mapeados em 'content', na mesma ordem,
+    buscando os mappings de todos os objetos ao mesmo tempo (equivale a chamar
+    FP_DynamicObject.add_dynamic_object_content em cada um). on_done é chamado a cada objeto concluído.
+    """
+    if not items:
+        return []
+    return list(asyncio.run(_collect_dynamic_object_content(items, on_done)))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Coleta objetos estáticos e dinâmicos do FMC com chamadas assíncronas.")
+    parser.add_argument("--target", help="Chave do FMC/domínio (padrão: o do config.py)")
+    args = parser.parse_args()
+    with FP_Targets.use_target(FP_Targets.get_target(args.target) if args.target else None):
+        client = get_client()
+        start_requests = client.request_count
+        with timed(logger, "Coleta assíncrona"):
+            static_objects = collect_static_objects()
+            dynamic_objects = collect_dynamic_object_content(get_dynamic_objects() or [])
+        print(f"{len(static_objects or [])} objetos estáticos, {len(dynamic_objects)} objetos dinâmicos, "
+              f"{client.request_count - start_requests} requisições (aiohttp: {'sim' if aiohttp else 'não'})")
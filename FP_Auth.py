@@ -1,48 +1,246 @@
 import requests
 import json
 import os
-from config import fmc_host, verify_ssl, fmc_password, fmc_username
+import re
+import threading
+import time
+from contextlib import contextmanager
+import config
+from FP_Log import get_logger
 
-# Global variable to store the token
-access_token = None
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
 
-def get_valid_token(force_refresh=False):
+logger = get_logger(__name__)
+
+# O FMC invalida o access token após 30 minutos
+TOKEN_LIFETIME = 30 * 60
+# Margem para não usar um token prestes a expirar
+TOKEN_EXPIRY_MARGIN = 60
+# O refresh token pode ser usado no máximo 3 vezes antes de ser preciso autenticar de novo
+MAX_TOKEN_REFRESHES = 3
+
+DATA_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+TOKEN_CACHE_FILE = os.path.join(DATA_FOLDER, 'token_cache.json')
+
+class TokenManager:
+    """
+    Mantém o access token e o refresh token do FMC em um cache local (data/token_cache.json),
+    protegido por lock de thread e de arquivo para ser compartilhado entre threads e processos.
+    Reutiliza o token enquanto ele estiver dentro dos 30 minutos de validade, usa
+    /auth/refreshtoken quando ele expira e só autentica de novo como último recurso.
+    """
+
+    def __init__(self, host=None, username=None, password=None, verify=None, cache_file=TOKEN_CACHE_FILE):
+        self.host = host or config.fmc_host
+        self.username = username or config.fmc_username
+        self.password = password or config.fmc_password
+        self.verify = config.verify_ssl if verify is None else verify
+        self.cache_file = cache_file
+        self._lock = threading.Lock()
+        self._cache = {}
+
+    def get_token(self, force_refresh=False, stale_token=None):
+        """
+        Retorna um access token válido.
+        Com force_refresh=True (ex.: após um 401), descarta o token atual; se stale_token
+        for informado e outro processo já tiver renovado o token, o novo token é reaproveitado.
+        """
+        cache = self._cache
+        if not force_refresh and cache.get('access_token') and self._is_valid(cache):
+            return cache['access_token']
+
+        with self._lock, self._file_lock():
+            cache = self._load_cache()
+            token = cache.get('access_token')
+            if force_refresh and (stale_token is None or stale_token == token):
+                cache['generated_at'] = 0
+            elif token and self._is_valid(cache):
+                self._cache = cache
+                return token
+
+            if cache.get('refresh_token') and cache.get('refresh_count', 0) < MAX_TOKEN_REFRESHES:
+                refreshed = self._refresh(cache)
+                if refreshed:
+                    self._save_cache(refreshed)
+                    return refreshed['access_token']
+
+            generated = self._generate()
+            if generated:
+                self._save_cache(generated)
+                return generated['access_token']
+            return None
+
+    def _is_valid(self, cache):
+        age = time.time() - cache.get('generated_at', 0)
+        return age < TOKEN_LIFETIME - TOKEN_EXPIRY_MARGIN
+
+    def _refresh(self, cache):
+        """
+        Renova o access token usando o refresh token.
+        """
+        refresh_url = f"https://{self.host}/api/fmc_platform/v1/auth/refreshtoken"
+        headers = {
+            "Content-Type": "application/json",
+            "X-auth-access-token": cache['access_token'],
+            "X-auth-refresh-token": cache['refresh_token'],
+        }
+        try:
+            logger.info("Renovando o token com o refresh token.")
+            response = requests.post(refresh_url, headers=headers, verify=self.verify)
+            response.raise_for_status()
+            access_token = response.headers.get("X-auth-access-token")
+            if not access_token:
+                # Sem token na resposta: get_token gera um novo par de tokens
+                logger.error("Erro ao renovar token: Nenhum token retornado.")
+                return None
+            return {
+                'access_token': access_token,
+                'refresh_token': response.headers.get("X-auth-refresh-token", cache['refresh_token']),
+                'generated_at': time.time(),
+                'refresh_count': cache.get('refresh_count', 0) + 1,
+            }
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Erro ao renovar token: {e}")
+            return None
+
+    def _generate(self):
+        """
+        Autentica no FMC e obtém um novo par de tokens.
+        """
+        if not self.username or not self.password:
+            logger.warning("Credenciais não encontradas no arquivo config.py.")
+            return None
+
+        auth_url = f"https://{self.host}/api/fmc_platform/v1/auth/generatetoken"
+        headers = {"Content-Type": "application/json"}
+        try:
+            logger.info(f"Obtendo novo token de: {auth_url}")
+            response = requests.post(auth_url, auth=(self.username, self.password), headers=headers, verify=self.verify)
+            response.raise_for_status()
+            access_token = response.headers.get("X-auth-access-token")
+            if not access_token:
+                logger.error("Erro ao obter token: Nenhum token retornado.")
+                return None
+            return {
+                'access_token': access_token,
+                'refresh_token': response.headers.get("X-auth-refresh-token"),
+                'generated_at': time.time(),
+                'refresh_count': 0,
+            }
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Erro ao obter token: {e}")
+            return None
+
+    def _load_cache(self):
+        """
+        Lê o cache de tokens. Sem cache, aproveita o token gravado por FP_init no config.py.
+        """
+        try:
+            with open(self.cache_file, 'r') as f:
+                cache = json.load(f)
+            if cache.get('host') == self.host and cache.get('username') == self.username:
+                return cache
+            return {}
+        except (FileNotFoundError, json.JSONDecodeError):
+            if self.host == config.fmc_host and getattr(config, 'fmc_token', ''):
+                return {
+                    'access_token': config.fmc_token,
+                    'generated_at': getattr(config, 'token_generation_time', 0),
+                }
+            return {}
+
+    def _save_cache(self, cache):
+        cache = dict(cache, host=self.host, username=self.username)
+        self._cache = cache
+        tmp_file = f"{self.cache_file}.tmp"
+        # O arquivo já nasce legível só pelo dono (0600): os tokens nunca ficam expostos, nem por um instante
+        try:
+            os.remove(tmp_file)  # Sobra de uma gravação interrompida, talvez com outras permissões
+        except FileNotFoundError:
+            pass
+        fd = os.open(tmp_file, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(cache, f)
+        os.replace(tmp_file, self.cache_file)
+
+    @contextmanager
+    def _file_lock(self):
+        """
+        Lock exclusivo entre processos, usando um arquivo .lock ao lado do cache.
+        """
+        os.makedirs(os.path.dirname(self.cache_file), exist_ok=True)
+        with open(f"{self.cache_file}.lock", 'a+') as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+                else:
+                    lock_file.seek(0)
+                    msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+# Gerenciador padrão, criado a partir do config.py
+_token_manager = None
+_token_manager_lock = threading.Lock()
+
+def get_token_manager():
+    """
+    Retorna o gerenciador de tokens padrão, compartilhado por todo o processo.
+    """
+    global _token_manager
+    with _token_manager_lock:
+        if _token_manager is None:
+            _token_manager = TokenManager()
+        return _token_manager
+
+# Gerenciadores dos demais FMCs cadastrados (FP_Targets), um por host e usuário
+_token_managers = {}
+
+def get_token_manager_for(host, username, password, verify):
+    """
+    Retorna o gerenciador de tokens de um FMC. O token vale para todos os domínios do usuário,
+    então os alvos do mesmo FMC e usuário compartilham o mesmo gerenciador (e o cache em disco);
+    o FMC do config.py usa o gerenciador padrão.
+    """
+    if (host, username) == (config.fmc_host, config.fmc_username):
+        return get_token_manager()
+    with _token_manager_lock:
+        manager = _token_managers.get((host, username))
+        if manager is None:
+            cache_name = re.sub(r'[^a-z0-9._-]+', '_', f"{host}_{username}".lower())
+            cache_file = os.path.join(DATA_FOLDER, 'targets', 'tokens', f"{cache_name}.json")
+            manager = _token_managers[(host, username)] = TokenManager(host, username, password, verify, cache_file)
+        return manager
+
+def reset_token_manager():
+    """
+    Descarta os gerenciadores de tokens (ex.: após o config.py ou os alvos serem regravados).
+    """
+    global _token_manager
+    with _token_manager_lock:
+        _token_manager = None
+        _token_managers.clear()
+
+def get_valid_token(force_refresh=False, stale_token=None):
     """
     Obtém um token de acesso válido do FMC.
-    Se um token já existir, retorna o token existente.
-    Se o token não existir ou force_refresh for True, obtém um novo token.
-    """
-    global access_token
-    if access_token and not force_refresh:
-        print("Reutilizando token existente.")
-        return access_token
-
-    # Get credentials from config.py
-    fmc_user = fmc_username  # Use the correct variable name from config.py
-    fmc_pass = fmc_password  # Use the correct variable name from config.py
-
-    if not fmc_user or not fmc_pass:
-        print("Credenciais não encontradas no arquivo config.py.")
-        return None
-
-    auth_url = f"https://{fmc_host}/api/fmc_platform/v1/auth/generatetoken"
-    headers = {"Content-Type": "application/json"}
-    auth_data = json.dumps({"username": fmc_user, "password": fmc_pass})
-
-    try:
-        print(f"Obtendo novo token de: {auth_url}")  # Debugging
-        auth_response = requests.post(auth_url, auth=(fmc_username, fmc_password), headers=headers, verify=verify_ssl)
-        auth_response.raise_for_status()
-        access_token = auth_response.headers.get("X-auth-access-token")
-        print(f"Token obtido: {access_token}")  # Debugging
-        return access_token
-    except requests.exceptions.RequestException as e:
-        print(f"Erro ao obter token: {e}")
-        return None
+    Reutiliza o token em cache enquanto ele não expirar; com force_refresh=True
+    renova o token (refresh token primeiro, nova autenticação se necessário).
+    """
+    return get_token_manager().get_token(force_refresh=force_refresh, stale_token=stale_token)
 
 if __name__ == '__main__':
     token = get_valid_token()
     if token:
         print("Token obtido com sucesso:", token)
     else:
-        print("Falha ao obter o token.")
\ No newline at end of file
+        print("Falha ao obter o token.")
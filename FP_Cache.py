@@ -0,0 +1,108 @@
+import gzip
+import os
+import threading
+from collections import OrderedDict
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Quantidade padrão de entradas mantidas em memória por cache
+MAX_CACHE_ENTRIES = 16
+
+class FileCache:
+    """
+    Cache LRU em memória para dados derivados de arquivos em data/.
+    Cada entrada guarda a assinatura (mtime e tamanho) dos arquivos de origem e é
+    reconstruída automaticamente quando algum deles muda, ou seja, após uma sincronização.
+    """
+
+    def __init__(self, max_entries=MAX_CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, paths, build):
+        """
+        Retorna o valor em cache para key, ou chama build() e guarda o resultado
+        se a entrada não existir ou se os arquivos em paths tiverem mudado.
+        """
+        signature = file_signature(paths)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] == signature:
+                self._entries.move_to_end(key)
+                return entry[1]
+
+        value = build()
+        with self._lock:
+            self._entries[key] = (signature, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+# Codificações em que as respostas em cache são guardadas, em ordem de preferência
+RESPONSE_ENCODINGS = (['br'] if brotli else []) + ['gzip']
+# Respostas menores que isso não valem a compressão
+MIN_COMPRESS_SIZE = 1024
+
+class ResponseCache:
+    """
+    Cache LRU de respostas HTTP já renderizadas: corpo original e versões pré-comprimidas (gzip e,
+    se o pacote brotli estiver instalado, br). A chave inclui a geração do inventário, então as
+    entradas de gerações anteriores simplesmente deixam de ser usadas e saem pelo LRU.
+    """
+
+    def __init__(self, max_entries=MAX_CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, body, mimetype):
+        """
+        Guarda o corpo e suas versões comprimidas. Retorna a entrada: {'mimetype', 'bodies': {codificação: bytes}},
+        em que a codificação None é o corpo sem compressão.
+        """
+        bodies = {None: body}
+        if len(body) >= MIN_COMPRESS_SIZE:
+            bodies['gzip'] = gzip.compress(body, compresslevel=6)
+            if brotli:
+                bodies['br'] = brotli.compress(body, quality=5)
+        entry = {'mimetype': mimetype, 'bodies': bodies}
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+def file_signature(paths):
+    """
+    Assinatura de um conjunto de arquivos: (caminho, mtime, tamanho) de cada um.
+    Arquivos inexistentes entram com mtime e tamanho None.
+    """
+    signature = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            signature.append((path, stat.st_mtime_ns, stat.st_size))
+        except FileNotFoundError:
+            signature.append((path, None, None))
+    return tuple(signature)
@@ -0,0 +1,265 @@
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+import importlib
+import config
+import FP_Auth
+import FP_Targets
+from FP_Auth import get_token_manager
+from FP_Log import get_logger
+
+logger = get_logger(__name__)
+
+# Maior página aceita pelo FMC nas listagens
+PAGE_SIZE = 1000
+# Conexões simultâneas mantidas abertas por host (o FMC aceita até 10)
+POOL_SIZE = 10
+# Tentativas após um 429 (Too Many Requests) antes de desistir
+MAX_RETRIES = 5
+# Orçamento padrão de requisições por minuto (o FMC limita a 120 req/min por usuário).
+# Pode ser ajustado com fmc_rate_limit no config.py.
+RATE_LIMIT_PER_MINUTE = 120
+
+class RateLimiter:
+    """
+    Token bucket compartilhado entre threads: libera no máximo rate_per_minute
+    requisições por minuto, permitindo rajadas de até burst requisições.
+    """
+
+    def __init__(self, rate_per_minute=None, burst=POOL_SIZE):
+        rate_per_minute = rate_per_minute or getattr(config, 'fmc_rate_limit', RATE_LIMIT_PER_MINUTE)
+        self.rate = rate_per_minute / 60.0
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Bloqueia até haver orçamento para mais uma requisição.
+        """
+        while True:
+            wait = self.try_acquire()
+            if not wait:
+                return
+            time.sleep(wait)
+
+    def try_acquire(self):
+        """
+        Consome uma requisição do orçamento, se houver, e retorna 0. Senão não consome nada e
+        retorna quantos segundos faltam para a próxima ficha. Nunca reserva fichas futuras, então
+        o coletor assíncrono (FP_AsyncCollector), que espera com asyncio.sleep e tenta de novo,
+        disputa o orçamento em pé de igualdade com as threads que chamam acquire().
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+class FMCClient:
+    """
+    Cliente compartilhado para a API REST do FMC.
+    Mantém uma requests.Session com pool de conexões (keep-alive), respeita o orçamento
+    de requisições do RateLimiter, renova o token em caso de 401 e aguarda antes de
+    repetir a chamada em caso de 429. Pode ser usado por várias threads ao mesmo tempo.
+    """
+
+    def __init__(self, host=None, domain=None, verify=None, pool_size=POOL_SIZE,
+                 token_manager=None, rate_limiter=None):
+        self.host = host or config.fmc_host
+        self.domain_uuid = domain or config.domain_uuid
+        self.verify = config.verify_ssl if verify is None else verify
+        self.session = requests.Session()
+        self.session.headers.update({"Content-Type": "application/json"})
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        # Limita as chamadas simultâneas ao FMC (threads e coletor assíncrono) ao tamanho do pool
+        self.connections = threading.BoundedSemaphore(pool_size)
+        self.token_manager = token_manager or get_token_manager()
+        self.rate_limiter = rate_limiter or RateLimiter()
+        # Total de requisições enviadas, usado no acompanhamento da sincronização
+        self.request_count = 0
+        self._count_lock = threading.Lock()
+
+    def url(self, path):
+        """
+        Monta a URL completa. Aceita URLs absolutas (links do próprio FMC), caminhos
+        começando em /api ou caminhos relativos ao domínio (ex.: "object/networks").
+        """
+        if path.startswith("http://") or path.startswith("https://"):
+            # Usa sempre o host configurado, mesmo que o FMC devolva outro nome nos links
+            path = path[path.find("/api"):]
+        if path.startswith("/api"):
+            return f"https://{self.host}{path}"
+        return f"https://{self.host}/api/fmc_config/v1/domain/{self.domain_uuid}/{path.lstrip('/')}"
+
+    def request(self, method, path, params=None, json=None):
+        """
+        Executa uma chamada à API e retorna a resposta.
+        Renova o token uma vez em caso de 401 e respeita o Retry-After em caso de 429.
+        Levanta requests.exceptions.HTTPError para os demais erros.
+        """
+        url = self.url(path)
+        # O token é local à chamada: o cliente é compartilhado entre threads, e um atributo poderia
+        # já trazer o token renovado por outra thread, que seria tratado como vencido no 401
+        token = self.token_manager.get_token()
+        token_refreshed = False
+        attempt = 0
+        while True:
+            headers = {"X-auth-access-token": token or ""}
+            # verify é passado a cada chamada: na Session ele seria sobrescrito por REQUESTS_CA_BUNDLE
+            self.rate_limiter.acquire()
+            self.count_request()
+            start = time.perf_counter()
+            with self.connections:
+                response = self.session.request(method, url, headers=headers, params=params, json=json, verify=self.verify)
+            logger.debug("%s %s -> %s em %.3fs", method, url, response.status_code, time.perf_counter() - start)
+            if response.status_code == 401 and not token_refreshed:
+                logger.warning("Erro 401 na chamada à API. Tentando obter um novo token.")
+                token = self.token_manager.get_token(force_refresh=True, stale_token=token)
+                token_refreshed = True
+                continue
+            if response.status_code == 429 and attempt < MAX_RETRIES:
+                delay = _retry_after(response, attempt)
+                logger.warning(f"Limite de requisições do FMC atingido (429). Aguardando {delay}s...")
+                time.sleep(delay)
+                attempt += 1
+                continue
+            response.raise_for_status()
+            return response
+
+    def count_request(self):
+        with self._count_lock:
+            self.request_count += 1
+
+    def get(self, path, params=None):
+        """
+        Faz um GET e retorna o JSON da resposta.
+        """
+        return self.request("GET", path, params=params).json()
+
+    def put(self, path, json=None, params=None):
+        """
+        Faz um PUT e retorna o JSON da resposta.
+        """
+        return self.request("PUT", path, params=params, json=json).json()
+
+    def post(self, path, json=None, params=None):
+        """
+        Faz um POST e retorna o JSON da resposta.
+        """
+        return self.request("POST", path, params=params, json=json).json()
+
+    def iter_items(self, path, expanded=True, page_size=PAGE_SIZE, params=None):
+        """
+        Percorre todas as páginas de um endpoint de listagem, devolvendo um item por vez.
+        Segue paging.next e, na falta dele, avança pelo offset até paging.count.
+        """
+        base_params = dict(params or {})
+        if expanded:
+            base_params["expanded"] = "true"
+        base_params["limit"] = page_size
+        url = path
+        page_params = dict(base_params, offset=0)
+        fetched = 0
+        while url:
+            page = self.get(url, params=page_params)
+            page_items = page.get('items', [])
+            for item in page_items:
+                yield item
+            fetched += len(page_items)
+
+            paging = page.get('paging', {})
+            next_links = paging.get('next')
+            if next_links:
+                url = next_links[0] if isinstance(next_links, list) else next_links
+                page_params = None
+            elif page_items and fetched < paging.get('count', 0):
+                url = path
+                page_params = dict(base_params, offset=fetched)
+            else:
+                url = None
+
+    def get_all(self, path, expanded=True, page_size=PAGE_SIZE, params=None):
+        """
+        Retorna a lista completa de itens de um endpoint de listagem.
+        """
+        return list(self.iter_items(path, expanded=expanded, page_size=page_size, params=params))
+
+def _retry_after(response, attempt):
+    """
+    Tempo de espera após um 429: usa o cabeçalho Retry-After quando presente,
+    senão um back-off exponencial.
+    """
+    retry_after = response.headers.get("Retry-After")
+    if retry_after and retry_after.isdigit():
+        return int(retry_after)
+    return min(2 ** attempt, 60)
+
+# Cliente padrão compartilhado pelos scripts de sincronização
+_client = None
+_client_lock = threading.Lock()
+# Clientes dos demais alvos (FP_Targets), por chave, e orçamentos de requisições por FMC e usuário
+_target_clients = {}
+_rate_limiters = {}
+
+def get_client():
+    """
+    Retorna o cliente do alvo associado ao contexto atual (FP_Targets.use_target) ou,
+    sem alvo, o cliente padrão, criado a partir do config.py na primeira chamada.
+    """
+    global _client
+    target = FP_Targets.current_target()
+    if target is not None:
+        return get_target_client(target)
+    with _client_lock:
+        if _client is None:
+            _client = FMCClient(rate_limiter=_get_rate_limiter(config.fmc_host, config.fmc_username))
+        return _client
+
+def get_target_client(target):
+    """
+    Cliente de um alvo cadastrado: cada alvo tem sua Session (pool de conexões), e os alvos
+    do mesmo FMC e usuário dividem o token e o orçamento de requisições, que o FMC controla por usuário.
+    """
+    with _client_lock:
+        client = _target_clients.get(target['key'])
+        if client is None:
+            client = _target_clients[target['key']] = FMCClient(
+                host=target['host'],
+                domain=target['domain_uuid'],
+                verify=target.get('verify_ssl', False),
+                pool_size=target.get('pool_size', POOL_SIZE),
+                token_manager=FP_Auth.get_token_manager_for(
+                    target['host'], target['username'], target['password'], target.get('verify_ssl', False)),
+                rate_limiter=_get_rate_limiter(target['host'], target['username'], target.get('rate_limit')),
+            )
+        return client
+
+def _get_rate_limiter(host, username, rate_per_minute=None):
+    """
+    Orçamento de requisições de um FMC e usuário, compartilhado por todos os clientes que o usam.
+    Chamado com _client_lock já adquirido.
+    """
+    rate_limiter = _rate_limiters.get((host, username))
+    if rate_limiter is None:
+        rate_limiter = _rate_limiters[(host, username)] = RateLimiter(rate_per_minute)
+    return rate_limiter
+
+def reset_client():
+    """
+    Relê o config.py e descarta os clientes e os gerenciadores de tokens,
+    para que a próxima chamada use os firewalls cadastrados mais recentemente.
+    """
+    global _client
+    with _client_lock:
+        importlib.reload(config)
+        FP_Auth.reset_token_manager()
+        _client = None
+        _target_clients.clear()
+        _rate_limiters.clear()
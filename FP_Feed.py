@@ -0,0 +1,417 @@
+import argparse
+import csv
+import heapq
+import ipaddress
+import json
+import os
+import shutil
+import tempfile
+import time
+import config
+import FP_Store
+import FP_Targets
+from FP_Cache import file_signature
+from FP_DynamicObject import get_dynamic_object_mappings, get_dynamic_objects
+from FP_JsonStream import iter_json_array, iter_json_lines
+from FP_Log import get_logger, timed
+from FP_MappedIP import MAPPING_CHUNK_SIZE, apply_mapping_changes, mapping_key
+
+logger = get_logger(__name__)
+
+# Intervalos mantidos em memória antes de gravar uma sequência ordenada em disco
+RUN_SIZE = 200000
+# Mappings enviados ao FMC por rodada de apply_mapping_changes (cada rodada vira vários lotes)
+PUSH_BATCH_SIZE = 20 * MAPPING_CHUNK_SIZE
+# Intervalo padrão entre execuções agendadas. Pode ser ajustado com feed_interval no config.py.
+FEED_INTERVAL = 3600
+# Colunas/campos procurados nos feeds CSV e JSON quando o feed não informa qual usar
+ADDRESS_FIELDS = ['ip', 'address', 'network', 'cidr', 'indicator', 'value', 'mapping']
+
+def iter_feed_values(path, feed_format=None, column=None, field=None):
+    """
+    Lê o feed linha a linha e devolve os valores brutos (ainda não validados).
+    Formatos: txt (um endereço por linha, comentários com # ou ;), csv e json (array ou NDJSON);
+    sem feed_format, o formato vem da extensão do arquivo.
+    """
+    feed_format = (feed_format or os.path.splitext(path)[1].lstrip('.') or 'txt').lower()
+    with open(path, 'r', encoding='utf-8', errors='replace', newline='') as f:
+        if feed_format == 'csv':
+            yield from _iter_csv(f, column)
+        elif feed_format in ('json', 'ndjson', 'jsonl'):
+            items = iter_json_array(f) if feed_format == 'json' else iter_json_lines(f)
+            for item in items:
+                value = _json_value(item, field)
+                if value is not None:
+                    yield value
+        else:
+            for line in f:
+                value = line.split('#', 1)[0].split(';', 1)[0].strip()
+                if value:
+                    # Listas no formato "endereço comentário" usam só o primeiro campo
+                    yield value.split()[0]
+
+def _iter_csv(f, column):
+    reader = csv.reader(f)
+    header = next(reader, None)
+    if header is None:
+        return
+    lowered = [name.strip().lower() for name in header]
+    if column is not None and str(column).isdigit():
+        index = int(column)
+    elif column is not None:
+        index = lowered.index(str(column).lower())
+    else:
+        index = next((lowered.index(name) for name in ADDRESS_FIELDS if name in lowered), None)
+    if index is None:
+        # Sem cabeçalho reconhecido: a primeira linha já é um dado, na primeira coluna
+        index = 0
+        yield header[0]
+    for row in reader:
+        if len(row) > index:
+            yield row[index]
+
+def _json_value(item, field):
+    if isinstance(item, str):
+        return item
+    if isinstance(item, dict):
+        if field:
+            return item.get(field)
+        return next((item[name] for name in ADDRESS_FIELDS if isinstance(item.get(name), str)), None)
+    return None
+
+def parse_interval(value):
+    """
+    Converte um endereço (host, CIDR ou range "a-b") no intervalo (versão, início, fim). None se inválido.
+    """
+    value = value.strip()
+    try:
+        if '-' in value:
+            first, last = (ipaddress.ip_address(part.strip()) for part in value.split('-', 1))
+            if first.version != last.version or int(first) > int(last):
+                return None
+            return first.version, int(first), int(last)
+        network = ipaddress.ip_network(value, strict=False)
+    except ValueError:
+        return None
+    return network.version, int(network.network_address), int(network.broadcast_address)
+
+def merge_intervals(intervals):
+    """
+    Une intervalos ordenados que se sobrepõem ou são adjacentes. Recebe e devolve iteradores.
+    """
+    current = None
+    for version, start, end in intervals:
+        if current and version == current[0] and start <= current[2] + 1:
+            if end > current[2]:
+                current[2] = end
+            continue
+        if current:
+            yield tuple(current)
+        current = [version, start, end]
+    if current:
+        yield tuple(current)
+
+def interval_networks(interval):
+    """
+    Menor lista de redes CIDR que cobre exatamente o intervalo, como texto (hosts sem o /32 ou /128).
+    """
+    version, start, end = interval
+    address = ipaddress.IPv4Address if version == 4 else ipaddress.IPv6Address
+    for network in ipaddress.summarize_address_range(address(start), address(end)):
+        yield str(network.network_address) if network.prefixlen == network.max_prefixlen else str(network)
+
+class FeedNormalizer:
+    """
+    Normaliza um feed de tamanho arbitrário com memória limitada: os endereços viram intervalos,
+    que são ordenados e unidos em blocos de RUN_SIZE e gravados em sequências ordenadas em disco;
+    no fim as sequências são intercaladas (heapq.merge) e unidas de novo, produzindo as redes
+    deduplicadas e agregadas em ordem.
+    """
+
+    def __init__(self, run_size=RUN_SIZE, temp_dir=None):
+        self.run_size = run_size
+        self.temp_dir = temp_dir
+        self.values = 0
+        self.invalid = 0
+        self._buffer = []
+        self._runs = []
+
+    def add(self, value):
+        self.values += 1
+        interval = parse_interval(value)
+        if interval is None:
+            self.invalid += 1
+            return
+        self._buffer.append(interval)
+        if len(self._buffer) >= self.run_size:
+            self._flush()
+
+    def _flush(self):
+        self._buffer.sort()
+        run = tempfile.TemporaryFile('w+', dir=self.temp_dir)
+        for version, start, end in merge_intervals(self._buffer):
+            run.write(f"{version} {start:x} {end:x}\n")
+        run.seek(0)
+        self._runs.append(run)
+        self._buffer = []
+
+    def networks(self):
+        """
+        Redes normalizadas, em ordem (versão, endereço). Só pode ser percorrido uma vez.
+        """
+        if self._runs:
+            if self._buffer:
+                self._flush()
+            intervals = heapq.merge(*(_read_run(run) for run in self._runs))
+        else:
+            self._buffer.sort()
+            intervals = iter(self._buffer)
+        try:
+            for interval in merge_intervals(intervals):
+                yield from interval_networks(interval)
+        finally:
+            for run in self._runs:
+                run.close()
+            self._runs = []
+
+def _read_run(run):
+    for line in run:
+        version, start, end = line.split()
+        yield int(version), int(start, 16), int(end, 16)
+
+def network_sort_key(value):
+    """
+    Chave de ordenação e comparação dos mappings: o intervalo de IPs ("10.0.0.1" e "10.0.0.1/32"
+    são iguais). Valores que não são IPs vêm antes e são comparados pelo texto.
+    """
+    interval = parse_interval(value)
+    if interval is None:
+        return 0, 0, 0, value
+    return interval + ('',)
+
+def diff_sorted(desired, current):
+    """
+    Compara dois iteradores de mappings ordenados por network_sort_key e devolve
+    ('add', valor) ou ('remove', valor) para cada diferença, sem materializar as listas.
+    """
+    desired, current = iter(desired), iter(current)
+    new, old = next(desired, None), next(current, None)
+    while new is not None or old is not None:
+        new_key = network_sort_key(new) if new is not None else None
+        old_key = network_sort_key(old) if old is not None else None
+        if old is None or (new is not None and new_key < old_key):
+            yield 'add', new
+            new = next(desired, None)
+        elif new is None or old_key < new_key:
+            yield 'remove', old
+            old = next(current, None)
+        else:
+            new, old = next(desired, None), next(current, None)
+
+def feeds_folder():
+    """
+    Último estado enviado de cada objeto (um arquivo ordenado por objeto) e metadados das execuções,
+    em data/feeds/ na pasta do alvo atual (FP_Targets).
+    """
+    return os.path.join(FP_Targets.data_folder(), 'feeds')
+
+def load_feed_state():
+    try:
+        with open(os.path.join(feeds_folder(), 'state.json'), 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+def save_feed_state(state):
+    os.makedirs(feeds_folder(), exist_ok=True)
+    state_file = os.path.join(feeds_folder(), 'state.json')
+    tmp_file = f"{state_file}.tmp"
+    with open(tmp_file, 'w') as f:
+        json.dump(state, f, indent=4)
+    os.replace(tmp_file, state_file)
+
+def pushed_path(object_id):
+    return os.path.join(feeds_folder(), f"{object_id}.txt")
+
+def iter_pushed(object_id):
+    """
+    Último estado enviado ao objeto, em ordem (uma rede por linha no arquivo).
+    """
+    with open(pushed_path(object_id), 'r') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield line
+
+def current_mappings(object_id):
+    """
+    Mappings atuais lidos do FMC, ordenados e sem repetições, usados quando ainda não há estado enviado
+    (ou quando o último envio falhou). Mantêm o texto exato do FMC, necessário para removê-los.
+    """
+    mappings = {}
+    for value in get_dynamic_object_mappings(object_id):
+        mappings.setdefault(mapping_key(value), value)
+    return sorted(mappings.values(), key=network_sort_key)
+
+def resolve_dynamic_object(name_or_id):
+    """
+    Id do objeto dinâmico com esse nome ou id: procura no inventário local e, se não achar, no FMC.
+    """
+    for found in FP_Store.find_objects(name_or_id):
+        if found['kind'] == 'dynamic':
+            return found['object_id']
+    for item in get_dynamic_objects() or []:
+        if name_or_id in (item.get('id'), item.get('name')):
+            return item['id']
+    raise ValueError(f"Objeto dinâmico não encontrado: {name_or_id}")
+
+def feed_definitions():
+    """
+    Feeds configurados em dynamic_object_feeds no config.py: lista de dicts com object (nome ou id
+    do objeto dinâmico), path e, opcionalmente, format, column (CSV), field (JSON) e target
+    (chave do FMC/domínio em FP_Targets; padrão: o do config.py).
+    """
+    return list(getattr(config, 'dynamic_object_feeds', []))
+
+def run_feed(feed, force=False, dry_run=False):
+    """
+    Sincroniza um objeto dinâmico com seu feed: normaliza o arquivo, compara com o último estado
+    enviado (ou, na primeira vez, com os mappings atuais do FMC) e envia só a diferença, em lotes.
+    Se o arquivo não mudou desde o último envio bem-sucedido, nada é feito (a menos que force).
+    Retorna o resumo da execução.
+    """
+    target = None
+    if feed.get('target') and feed['target'] != FP_Targets.DEFAULT_TARGET:
+        target = FP_Targets.get_target(feed['target'])
+        if target is None:
+            raise ValueError(f"FMC/domínio não encontrado: {feed['target']}")
+    with FP_Targets.use_target(target):
+        return _run_feed(feed, force, dry_run)
+
+def _run_feed(feed, force, dry_run):
+    path = feed['path']
+    object_id = resolve_dynamic_object(feed['object'])
+    state = load_feed_state()
+    previous = state.get(object_id, {})
+    signature = [list(entry) for entry in file_signature([path])]
+    summary = {'object': feed['object'], 'object_id': object_id, 'path': path, 'status': 'unchanged'}
+    if not force and previous.get('signature') == signature and previous.get('status') == 'success':
+        logger.info(f"Feed {path} não mudou desde o último envio para {feed['object']}.")
+        return summary
+    if signature[0][1] is None:
+        raise FileNotFoundError(path)
+
+    with timed(logger, f"Feed {path} -> {feed['object']}"):
+        normalizer = FeedNormalizer()
+        for value in iter_feed_values(path, feed.get('format'), feed.get('column'), feed.get('field')):
+            normalizer.add(value)
+
+        os.makedirs(feeds_folder(), exist_ok=True)
+        reconcile = previous.get('status') != 'success' or not os.path.exists(pushed_path(object_id))
+        current = current_mappings(object_id) if reconcile else iter_pushed(object_id)
+        summary.update({'values': normalizer.values, 'invalid': normalizer.invalid, 'networks': 0,
+                        'added': 0, 'removed': 0, 'chunks': 0, 'failed_chunks': 0, 'reconciled': reconcile})
+
+        # O novo estado é gravado enquanto a diferença é calculada; só substitui o anterior se tudo der certo
+        new_state_file = tempfile.NamedTemporaryFile('w', dir=feeds_folder(), delete=False, suffix='.tmp')
+        pending = {'add': [], 'remove': []}
+
+        def desired():
+            for network in normalizer.networks():
+                new_state_file.write(network + "\n")
+                summary['networks'] += 1
+                yield network
+
+        try:
+            for action, value in diff_sorted(desired(), current):
+                pending[action].append(value)
+                if len(pending['add']) + len(pending['remove']) >= PUSH_BATCH_SIZE:
+                    _push(object_id, pending, summary, dry_run)
+            _push(object_id, pending, summary, dry_run)
+        finally:
+            new_state_file.close()
+
+    success = summary['failed_chunks'] == 0
+    if dry_run:
+        os.remove(new_state_file.name)
+        summary['status'] = 'dry_run'
+        return summary
+    if success:
+        shutil.move(new_state_file.name, pushed_path(object_id))
+    else:
+        # Parte dos lotes falhou: a próxima execução compara de novo com os mappings atuais do FMC
+        os.remove(new_state_file.name)
+    summary['status'] = 'success' if success else 'error'
+    state[object_id] = {
+        'object': feed['object'],
+        'path': path,
+        'signature': signature,
+        'status': summary['status'],
+        'networks': summary['networks'],
+        'pushed_at': time.time(),
+    }
+    save_feed_state(state)
+    if summary['added'] or summary['removed']:
+        FP_Store.bump_generation()
+    logger.info(f"Feed {path} -> {feed['object']}: {summary['values']} valores ({summary['invalid']} inválidos), "
+                f"{summary['networks']} redes, +{summary['added']} -{summary['removed']} em {summary['chunks']} lote(s)")
+    return summary
+
+def _push(object_id, pending, summary, dry_run):
+    """
+    Envia as alterações acumuladas e esvazia pending.
+    """
+    if not pending['add'] and not pending['remove']:
+        return
+    if dry_run:
+        summary['added'] += len(pending['add'])
+        summary['removed'] += len(pending['remove'])
+    else:
+        report = apply_mapping_changes({object_id: pending})
+        summary['added'] += report['added']
+        summary['removed'] += report['removed']
+        summary['chunks'] += len(report['chunks'])
+        summary['failed_chunks'] += sum(chunk['status'] != 'success' for chunk in report['chunks'])
+        FP_Store.update_dynamic_mappings(report['applied'])
+    pending['add'], pending['remove'] = [], []
+
+def run_all_feeds(force=False, dry_run=False):
+    """
+    Executa todos os feeds configurados; a falha de um feed não impede os demais.
+    """
+    results = []
+    for feed in feed_definitions():
+        try:
+            results.append(run_feed(feed, force=force, dry_run=dry_run))
+        except Exception as e:
+            logger.exception(f"Falha no feed {feed.get('path')} -> {feed.get('object')}")
+            results.append({'object': feed.get('object'), 'path': feed.get('path'), 'status': 'error', 'error': str(e)})
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sincroniza objetos dinâmicos com feeds de IPs (txt, csv ou json).")
+    parser.add_argument("--object", help="Nome ou id do objeto dinâmico (padrão: feeds de dynamic_object_feeds no config.py)")
+    parser.add_argument("--path", help="Arquivo do feed")
+    parser.add_argument("--format", choices=["txt", "csv", "json", "ndjson"], help="Formato (padrão: pela extensão)")
+    parser.add_argument("--column", help="Coluna do CSV com os endereços (nome ou índice)")
+    parser.add_argument("--field", help="Campo dos objetos JSON com os endereços")
+    parser.add_argument("--force", action="store_true", help="Processa mesmo se o arquivo não mudou")
+    parser.add_argument("--dry-run", action="store_true", help="Só calcula a diferença, sem enviar ao FMC")
+    parser.add_argument("--target", help="Chave do FMC/domínio do objeto (ver FP_Targets.py; padrão: o do config.py)")
+    parser.add_argument("--loop", action="store_true", help="Repete a cada feed_interval segundos (config.py, padrão 3600)")
+    args = parser.parse_args()
+
+    if bool(args.object) != bool(args.path):
+        parser.error("--object e --path devem ser usados juntos")
+
+    while True:
+        if args.object:
+            feed = {'object': args.object, 'path': args.path, 'format': args.format, 'column': args.column,
+                    'field': args.field, 'target': args.target}
+            results = [run_feed(feed, force=args.force, dry_run=args.dry_run)]
+        else:
+            results = run_all_feeds(force=args.force, dry_run=args.dry_run)
+        print(json.dumps(results, indent=4))
+        if not args.loop:
+            break
+        time.sleep(getattr(config, 'feed_interval', FEED_INTERVAL))
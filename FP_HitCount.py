@@ -0,0 +1,294 @@
+import asyncio
+import heapq
+import json
+import struct
+import time
+import requests
+import FP_Targets
+from FP_Store import get_connection, bump_generation
+from FP_Log import get_logger, timed
+
+logger = get_logger(__name__)
+
+# Cada amostra da série de uma regra: (horário da coleta em segundos, contador de hits do FMC)
+SAMPLE_FORMAT = struct.Struct('<IQ')
+# Dias de amostras mantidos por regra e dispositivo. Pode ser ajustado com hit_count_retention_days no config.py.
+HIT_COUNT_RETENTION_DAYS = 90
+# Intervalo entre coletas com --loop, em segundos. Pode ser ajustado com hit_count_interval no config.py.
+HIT_COUNT_INTERVAL = 3600
+# Regras exibidas por padrão na página de regras mais usadas
+TOP_RULES = 50
+
+def encode_samples(samples):
+    return b''.join(SAMPLE_FORMAT.pack(int(timestamp), count) for timestamp, count in samples)
+
+def decode_samples(blob):
+    return list(SAMPLE_FORMAT.iter_unpack(blob or b''))
+
+def append_sample(blob, timestamp, count, retention_days=HIT_COUNT_RETENTION_DAYS):
+    """
+    Acrescenta uma leitura do contador à série. Só as mudanças são gravadas: uma leitura igual à
+    anterior não gera amostra, então regras sem tráfego ocupam uma única amostra. Amostras mais antigas
+    que a retenção são descartadas, mantendo a última delas como base para as contas de hits por período.
+    Retorna (nova série, se houve mudança).
+    """
+    samples = decode_samples(blob)
+    changed = not samples or samples[-1][1] != count
+    if changed:
+        samples.append((int(timestamp), count))
+    cutoff = timestamp - retention_days * 86400
+    old = sum(1 for sample_time, _ in samples if sample_time < cutoff)
+    if old > 1:
+        samples = samples[old - 1:]
+    elif not changed:
+        return blob, False
+    return encode_samples(samples), changed
+
+def hits_since(samples, since):
+    """
+    Hits registrados depois de since a partir de uma série de leituras do contador acumulado.
+    Um contador menor que o anterior indica que foi zerado no FMC: conta a leitura inteira.
+    Se a série começa depois de since, a primeira leitura serve de base (o que veio antes é desconhecido).
+    """
+    hits = 0
+    previous = None
+    for timestamp, count in samples:
+        if timestamp <= since or previous is None:
+            previous = count
+            continue
+        hits += count - previous if count >= previous else count
+        previous = count
+    return hits
+
+def _hit_timestamp(value):
+    # O FMC devolve " " no lugar da data quando a regra nunca teve hits
+    if isinstance(value, str):
+        return value.strip() or None
+    return value
+
+def save_device_hits(policy_id, device, items, collected_at=None, retention_days=HIT_COUNT_RETENTION_DAYS, db_file=None):
+    """
+    Grava a leitura dos hits de uma política em um dispositivo, acrescentando uma amostra à série de cada regra.
+    As séries de regras que não vieram na leitura (apagadas da política) são removidas.
+    Retorna a quantidade de regras lidas.
+    """
+    collected_at = collected_at or time.time()
+    connection = get_connection(db_file)
+    existing = {
+        row['rule_id']: (row['samples'], row['changed_at'])
+        for row in connection.execute(
+            "SELECT rule_id, samples, changed_at FROM hit_counts WHERE policy_id = ? AND device_id = ?",
+            (policy_id, device['id']))
+    }
+    rows = []
+    for item in items:
+        rule_id = (item.get('rule') or {}).get('id')
+        if not rule_id:
+            continue
+        count = int(item.get('hitCount') or 0)
+        samples, changed_at = existing.get(rule_id, (b'', collected_at))
+        samples, changed = append_sample(samples, collected_at, count, retention_days)
+        rows.append((
+            policy_id, rule_id, device['id'], device.get('name'), count,
+            _hit_timestamp(item.get('firstHitTimeStamp')), _hit_timestamp(item.get('lastHitTimeStamp')),
+            collected_at, collected_at if changed else changed_at, samples,
+        ))
+    with connection:
+        connection.execute(
+            "DELETE FROM hit_counts WHERE policy_id = ? AND device_id = ? AND rule_id NOT IN (SELECT value FROM json_each(?))",
+            (policy_id, device['id'], json.dumps([row[1] for row in rows])))
+        connection.executemany(
+            "INSERT OR REPLACE INTO hit_counts (policy_id, rule_id, device_id, device_name, hit_count, first_hit, "
+            "last_hit, collected_at, changed_at, samples) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+    return len(rows)
+
+async def _device_hits(client, policy, device):
+    """
+    Hits das regras de uma política em um dispositivo (ou par HA/cluster), inclusive as sem hits.
+    """
+    params = {"filter": f'"deviceId:{device["id"]};fetchZeroHitCount:true"'}
+    try:
+        items = await client.get_all(f"policy/accesspolicies/{policy['id']}/operational/hitcounts", params=params)
+        return policy, device, items, None
+    except requests.exceptions.RequestException as e:
+        return policy, device, None, str(e)
+
+def _delete_unassigned(pairs, db_file=None):
+    """
+    Remove as séries de políticas que deixaram de estar atribuídas a um dispositivo.
+    """
+    connection = get_connection(db_file)
+    stored = connection.execute("SELECT DISTINCT policy_id, device_id FROM hit_counts").fetchall()
+    removed = [tuple(row) for row in stored if tuple(row) not in pairs]
+    if removed:
+        with connection:
+            connection.executemany("DELETE FROM hit_counts WHERE policy_id = ? AND device_id = ?", removed)
+        logger.info(f"{len(removed)} atribuição(ões) política/dispositivo removida(s) das séries de hits.")
+
+async def _collect(policy_ids, retention_days, summary):
+    from FP_AsyncCollector import AsyncFMCClient
+
+    async with AsyncFMCClient() as client:
+        assignments = await client.get_all("assignment/policyassignments")
+        pairs = []
+        for assignment in assignments:
+            policy = assignment.get('policy') or {}
+            if policy.get('type') != 'AccessPolicy' or (policy_ids and policy.get('id') not in policy_ids):
+                continue
+            pairs.extend((policy, device) for device in assignment.get('targets') or [])
+        if not policy_ids:
+            _delete_unassigned({(policy['id'], device['id']) for policy, device in pairs})
+        summary['policies'] = len({policy['id'] for policy, _ in pairs})
+        summary['devices'] = len({device['id'] for _, device in pairs})
+        logger.info(f"Coletando hits de {summary['policies']} política(s) em {summary['devices']} dispositivo(s)...")
+        collected_at = time.time()
+        # Todos os pares política/dispositivo são pedidos ao mesmo tempo; cada um é gravado assim que chega
+        for future in asyncio.as_completed([_device_hits(client, policy, device) for policy, device in pairs]):
+            policy, device, items, error = await future
+            if error:
+                summary['errors'].append(f"{policy.get('name')} em {device.get('name') or device['id']}: {error}")
+                logger.error(f"Falha ao obter os hits da política {policy.get('name')} no dispositivo "
+                             f"{device.get('name') or device['id']}: {error}")
+                continue
+            summary['rules'] += save_device_hits(policy['id'], device, items, collected_at, retention_days)
+
+def collect_hit_counts(policy_ids=None, bump=True):
+    """
+    Coleta os contadores de hits das regras de todas as Access Control Policies atribuídas a dispositivos
+    (ou só das políticas em policy_ids) no FMC/domínio atual e acrescenta uma amostra às séries no banco.
+    Com bump, incrementa a geração do inventário para que as páginas em cache passem a exibir os novos hits.
+    Retorna o resumo: políticas, dispositivos, regras lidas e erros.
+    """
+    import config
+
+    retention_days = getattr(config, 'hit_count_retention_days', HIT_COUNT_RETENTION_DAYS)
+    summary = {'policies': 0, 'devices': 0, 'rules': 0, 'errors': []}
+    with timed(logger, "Coleta de hits"):
+        try:
+            asyncio.run(_collect(set(policy_ids or ()), retention_days, summary))
+        except requests.exceptions.RequestException as e:
+            summary['errors'].append(f"Falha ao obter as atribuições de políticas: {e}")
+            logger.error(summary['errors'][-1])
+    connection = get_connection()
+    with connection:
+        cursor = connection.execute(
+            "INSERT INTO hit_count_collections (collected_at, policies, devices, rules, errors) VALUES (?, ?, ?, ?, ?)",
+            (time.time(), summary['policies'], summary['devices'], summary['rules'], len(summary['errors'])))
+    summary['collection'] = cursor.lastrowid
+    if bump:
+        # Mesmo sem leituras novas, séries podem ter sido removidas (atribuições desfeitas)
+        summary['generation'] = bump_generation()
+    return summary
+
+def last_collection(db_file=None):
+    row = get_connection(db_file).execute(
+        "SELECT * FROM hit_count_collections ORDER BY collection_id DESC LIMIT 1").fetchone()
+    return dict(row) if row else None
+
+def rule_hits(rule_ids, db_file=None):
+    """
+    Hits de cada regra somados entre os dispositivos: {rule_id: {'hits', 'last_hit', 'devices', 'collected_at'}}.
+    Regras sem leitura ficam de fora.
+    """
+    query = """
+        SELECT rule_id, SUM(hit_count) AS hits, MAX(last_hit) AS last_hit, COUNT(*) AS devices,
+               MAX(collected_at) AS collected_at
+        FROM hit_counts WHERE rule_id IN (SELECT value FROM json_each(?)) GROUP BY rule_id
+    """
+    rows = get_connection(db_file).execute(query, (json.dumps([rule_id for rule_id in rule_ids if rule_id]),))
+    return {row['rule_id']: dict(row) for row in rows}
+
+def _rules_by_id(rule_ids, db_file=None):
+    query = """
+        SELECT rule_id, policy, position, name, action, enabled FROM rules
+        WHERE rule_id IN (SELECT value FROM json_each(?))
+    """
+    return {row['rule_id']: dict(row) for row in get_connection(db_file).execute(query, (json.dumps(list(rule_ids)),))}
+
+def top_rules(limit=TOP_RULES, policy=None, days=None, db_file=None):
+    """
+    As regras com mais hits, somados entre os dispositivos. Sem days, pelo contador acumulado do FMC;
+    com days, pelos hits dos últimos days dias, calculados a partir das séries.
+    policy limita a uma política (nome do arquivo).
+    """
+    connection = get_connection(db_file)
+    # Só regras que ainda existem no inventário sincronizado
+    rule_filter = "rule_id IN (SELECT rule_id FROM rules WHERE ? IS NULL OR policy = ?)"
+    if days is None:
+        query = f"""
+            SELECT rule_id, SUM(hit_count) AS hits FROM hit_counts WHERE {rule_filter}
+            GROUP BY rule_id ORDER BY hits DESC LIMIT ?
+        """
+        totals = [(row['hits'], row['rule_id']) for row in connection.execute(query, (policy, policy, limit))]
+    else:
+        since = time.time() - days * 86400
+        by_rule = {}
+        for row in connection.execute(f"SELECT rule_id, samples FROM hit_counts WHERE {rule_filter}", (policy, policy)):
+            by_rule[row['rule_id']] = by_rule.get(row['rule_id'], 0) + hits_since(decode_samples(row['samples']), since)
+        totals = heapq.nlargest(limit, ((hits, rule_id) for rule_id, hits in by_rule.items()))
+    details = rule_hits([rule_id for _, rule_id in totals], db_file)
+    rules = _rules_by_id([rule_id for _, rule_id in totals], db_file)
+    return [
+        dict(rules[rule_id], hits=hits, total_hits=details[rule_id]['hits'],
+             last_hit=details[rule_id]['last_hit'], devices=details[rule_id]['devices'])
+        for hits, rule_id in totals
+    ]
+
+def zero_hit_rules(policy=None, days=None, db_file=None):
+    """
+    Regras sem nenhum hit em todos os dispositivos em que sua política está atribuída, com o horário
+    desde quando o contador está zerado ('zero_since'). Com days, só as zeradas há pelo menos days dias.
+    Regras sem leitura (política não atribuída ou não coletada) ficam de fora.
+    """
+    query = """
+        SELECT rules.policy, rules.position, rules.name, rules.action, rules.enabled, rules.rule_id,
+               totals.devices, totals.zero_since, totals.collected_at
+        FROM rules JOIN (
+            SELECT rule_id, SUM(hit_count) AS hits, COUNT(*) AS devices, MAX(changed_at) AS zero_since,
+                   MAX(collected_at) AS collected_at
+            FROM hit_counts GROUP BY rule_id
+        ) AS totals ON totals.rule_id = rules.rule_id
+        WHERE totals.hits = 0 AND (? IS NULL OR rules.policy = ?) AND totals.zero_since <= ?
+        ORDER BY rules.policy, rules.position
+    """
+    cutoff = time.time() - (days or 0) * 86400
+    return [dict(row) for row in get_connection(db_file).execute(query, (policy, policy, cutoff))]
+
+if __name__ == "__main__":
+    import argparse
+    import config
+
+    parser = argparse.ArgumentParser(description="Coleta e consulta os hits das regras (operational/hitcounts do FMC).")
+    parser.add_argument("--target", default=FP_Targets.DEFAULT_TARGET, help="Chave do FMC/domínio (ver FP_Targets.py)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    collect_parser = subparsers.add_parser("collect", help="Coleta os hits no FMC")
+    collect_parser.add_argument("--policy-id", action="append", help="Só esta política (id; pode repetir)")
+    collect_parser.add_argument("--loop", action="store_true",
+                                help="Repete a cada hit_count_interval segundos (config.py, padrão 3600)")
+    top_parser = subparsers.add_parser("top", help="Regras com mais hits")
+    top_parser.add_argument("-n", type=int, default=TOP_RULES)
+    top_parser.add_argument("--days", type=float, help="Só os hits dos últimos dias")
+    top_parser.add_argument("--policy", help="Só esta política (nome do arquivo)")
+    zero_parser = subparsers.add_parser("zero", help="Regras sem hits")
+    zero_parser.add_argument("--days", type=float, help="Zeradas há pelo menos esses dias")
+    zero_parser.add_argument("--policy", help="Só esta política (nome do arquivo)")
+    args = parser.parse_args()
+    if args.target != FP_Targets.DEFAULT_TARGET:
+        target = FP_Targets.get_target(args.target)
+        if target is None:
+            parser.error(f"Alvo não encontrado: {args.target}")
+        FP_Targets.bind_target(target)
+
+    if args.command == "collect":
+        while True:
+            print(json.dumps(collect_hit_counts(args.policy_id), indent=2, ensure_ascii=False))
+            if not args.loop:
+                break
+            time.sleep(getattr(config, 'hit_count_interval', HIT_COUNT_INTERVAL))
+    elif args.command == "top":
+        for rule in top_rules(args.n, args.policy, args.days):
+            print(f"{rule['hits']:>12} {rule['policy']} #{rule['position']} {rule['name']} ({rule['action']})")
+    else:
+        for rule in zero_hit_rules(args.policy, args.days):
+            zero_since = time.strftime('%Y-%m-%d %H:%M', time.localtime(rule['zero_since']))
+            print(f"{rule['policy']} #{rule['position']} {rule['name']} ({rule['action']}) sem hits desde {zero_since}")
@@ -0,0 +1,217 @@
+import argparse
+import ipaddress
+import json
+import os
+import FP_Store
+import FP_Targets
+from FP_Log import get_logger
+from FP_ObjectResolver import load_object_resolver, resolve_networks
+
+logger = get_logger(__name__)
+
+# Direções de rede de uma regra e o campo correspondente no JSON
+RULE_DIRECTIONS = [('source', 'sourceNetworks'), ('destination', 'destinationNetworks')]
+# Campos das regras usados pelo índice
+INDEX_FIELDS = ['name', 'sourceNetworks', 'destinationNetworks']
+
+def parse_address(value):
+    """
+    Converte um endereço do FMC (host, rede CIDR ou range "a-b") no intervalo
+    (versão, início, fim) de inteiros. Retorna None para valores que não são IPs (ex.: FQDN).
+    """
+    value = (value or '').strip()
+    try:
+        if '-' in value:
+            first, last = (ipaddress.ip_address(part.strip()) for part in value.split('-', 1))
+            if first.version != last.version:
+                return None
+            return first.version, int(first), int(last)
+        network = ipaddress.ip_network(value, strict=False)
+        return network.version, int(network.network_address), int(network.broadcast_address)
+    except ValueError:
+        return None
+
+class AddressIndex:
+    """
+    Índice de intervalos de IPs (IPv4 e IPv6) para responder "quais entradas tocam este endereço/rede".
+    Os intervalos distintos ficam num array ordenado pelo início, visto como uma árvore binária
+    balanceada em que cada nó guarda o maior fim da sua subárvore; a busca descarta subárvores
+    inteiras e custa O(log n + k), sendo k o número de intervalos encontrados.
+    Intervalos repetidos (o mesmo objeto usado em várias regras) são guardados uma única vez.
+    """
+
+    def __init__(self):
+        self.refs = []
+        self._pending = {}
+        self._trees = {}
+
+    def add(self, value, ref):
+        """
+        Associa o endereço value à referência ref. Retorna False se value não for um IP.
+        """
+        interval = parse_address(value)
+        if interval is None:
+            return False
+        self.add_interval(interval, value, ref)
+        return True
+
+    def add_interval(self, interval, value, ref):
+        """
+        Como add, mas com o intervalo (versão, início, fim) já calculado.
+        """
+        self._pending.setdefault(interval, []).append(len(self.refs))
+        self.refs.append((value, ref))
+        self._trees = {}
+
+    def build(self):
+        """
+        Ordena os intervalos e calcula o maior fim de cada subárvore. Chamado automaticamente na primeira busca.
+        """
+        by_version = {}
+        for (version, start, end), ref_ids in self._pending.items():
+            by_version.setdefault(version, []).append((start, end, ref_ids))
+        for version, intervals in by_version.items():
+            intervals.sort(key=lambda interval: (interval[0], interval[1]))
+            starts = [interval[0] for interval in intervals]
+            ends = [interval[1] for interval in intervals]
+            ref_ids = [interval[2] for interval in intervals]
+            max_ends = list(ends)
+            self._fill_max_ends(max_ends, ends, 0, len(ends))
+            self._trees[version] = (starts, ends, max_ends, ref_ids)
+
+    def _fill_max_ends(self, max_ends, ends, lo, hi):
+        stack = [(lo, hi, False)]
+        while stack:
+            lo, hi, children_done = stack.pop()
+            if lo >= hi:
+                continue
+            mid = (lo + hi) // 2
+            if not children_done:
+                stack.append((lo, hi, True))
+                stack.append((lo, mid, False))
+                stack.append((mid + 1, hi, False))
+                continue
+            best = ends[mid]
+            if lo < mid:
+                best = max(best, max_ends[(lo + mid) // 2])
+            if mid + 1 < hi:
+                best = max(best, max_ends[(mid + 1 + hi) // 2])
+            max_ends[mid] = best
+
+    def search(self, query):
+        """
+        Retorna [(endereço, ref)] de todas as entradas cujo intervalo tem interseção com query
+        (um IP, uma rede CIDR ou um range). Levanta ValueError se query não for um endereço válido.
+        """
+        interval = parse_address(query)
+        if interval is None:
+            raise ValueError(f"Endereço inválido: {query}")
+        return self.search_interval(interval)
+
+    def search_interval(self, interval):
+        """
+        Como search, mas com o intervalo (versão, início, fim) já calculado.
+        """
+        if self._pending and not self._trees:
+            self.build()
+        version, query_start, query_end = interval
+        tree = self._trees.get(version)
+        if not tree:
+            return []
+        starts, ends, max_ends, ref_ids = tree
+
+        matches = []
+        stack = [(0, len(starts))]
+        while stack:
+            lo, hi = stack.pop()
+            if lo >= hi:
+                continue
+            mid = (lo + hi) // 2
+            # Nenhum intervalo desta subárvore termina depois do início da consulta
+            if max_ends[mid] < query_start:
+                continue
+            stack.append((lo, mid))
+            # À direita os inícios são maiores ou iguais: se este já passou do fim da consulta, os de lá também
+            if starts[mid] <= query_end:
+                if ends[mid] >= query_start:
+                    matches.extend(ref_ids[mid])
+                stack.append((mid + 1, hi))
+        return [self.refs[ref_id] for ref_id in sorted(matches)]
+
+def load_rule_files(rules_directory=None, fields=None):
+    """
+    Retorna [(nome do arquivo, regras)] de todas as políticas sincronizadas em data/acp_rules
+    (por padrão, a do alvo atual). As regras vêm do banco (FP_Store), só com os campos em fields, se informado.
+    """
+    rules_directory = rules_directory or FP_Targets.rules_directory()
+    try:
+        filenames = sorted(filename for filename in os.listdir(rules_directory) if filename.endswith('.json'))
+    except FileNotFoundError:
+        logger.warning(f"Diretório não encontrado: {rules_directory}")
+        return []
+    return [(filename, FP_Store.load_policy_rules(filename, fields, rules_directory)) for filename in filenames]
+
+def build_rules_index(rules_directory=None, data_folder=None, resolver=None):
+    """
+    Monta o índice de endereços a partir dos IPs de origem e destino resolvidos de cada regra.
+    Cada referência é um dict com policy (arquivo), rule (nome), position (ordem na política) e direction.
+    Regras sem rede em uma direção (Any) não entram no índice para essa direção.
+    """
+    resolver = resolver or load_object_resolver(data_folder)
+    index = AddressIndex()
+    for filename, rules in load_rule_files(rules_directory, INDEX_FIELDS):
+        for position, rule in enumerate(rules, start=1):
+            for direction, field in RULE_DIRECTIONS:
+                ref = {
+                    'policy': filename,
+                    'rule': rule.get('name'),
+                    'position': position,
+                    'direction': direction,
+                }
+                for address in resolve_networks(resolver, rule.get(field)):
+                    index.add(address, ref)
+    index.build()
+    return index
+
+def search_rules(index, query):
+    """
+    Busca no índice de regras e agrupa o resultado por regra: uma entrada por (política, regra),
+    com os endereços que casaram em cada direção.
+    """
+    results = {}
+    for address, ref in index.search(query):
+        key = (ref['policy'], ref['position'])
+        result = results.setdefault(key, {
+            'policy': ref['policy'],
+            'rule': ref['rule'],
+            'position': ref['position'],
+            'source': [],
+            'destination': [],
+        })
+        if address not in result[ref['direction']]:
+            result[ref['direction']].append(address)
+    return [results[key] for key in sorted(results)]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Lista as regras cujos IPs de origem ou destino tocam um endereço.")
+    parser.add_argument("address", help="IP, rede CIDR ou range (ex.: 10.20.30.40, 10.20.0.0/16)")
+    parser.add_argument("--json", action="store_true", help="Saída em JSON")
+    parser.add_argument("--target", default=FP_Targets.DEFAULT_TARGET, help="Chave do FMC/domínio (ver FP_Targets.py)")
+    args = parser.parse_args()
+    if args.target != FP_Targets.DEFAULT_TARGET:
+        target = FP_Targets.get_target(args.target)
+        if target is None:
+            parser.error(f"Alvo não encontrado: {args.target}")
+        FP_Targets.bind_target(target)
+
+    try:
+        results = search_rules(build_rules_index(), args.address)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.json:
+        print(json.dumps(results, indent=4))
+    else:
+        for result in results:
+            print(f"{result['policy']} #{result['position']} {result['rule']}: "
+                  f"origem={', '.join(result['source']) or '-'} destino={', '.join(result['destination']) or '-'}")
+        print(f"{len(results)} regra(s) encontrada(s).")
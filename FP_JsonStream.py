@@ -0,0 +1,198 @@
+import filecmp
+import json
+import os
+from FP_Log import get_logger
+
+logger = get_logger(__name__)
+
+# Quantidade de caracteres lida do arquivo por vez
+READ_SIZE = 1 << 16
+WHITESPACE = ' \t\n\r'
+# Um valor ou erro de decodificação a até essa distância do fim do buffer pode ser só um literal,
+# número ou escape cortado entre dois blocos (ex.: 'tru', '1.', '\u00'); mais longe do fim é erro de sintaxe
+TRUNCATION_MARGIN = 16
+
+class _Reader:
+    """
+    Buffer sobre um arquivo texto aberto: lê em blocos e descarta o que já foi consumido,
+    então a memória usada é a do maior item, não a do arquivo.
+    """
+
+    def __init__(self, f, read_size=READ_SIZE):
+        self.f = f
+        self.read_size = read_size
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def fill(self, size=None):
+        """
+        Lê mais um bloco (de size caracteres, se informado). Retorna False no fim do arquivo.
+        """
+        if self.eof:
+            return False
+        chunk = self.f.read(size or self.read_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """
+        Próximo caractere que não é espaço (sem consumi-lo), ou '' no fim do arquivo.
+        """
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill():
+                return ''
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f"JSON inválido: esperado {char!r}, encontrado {self.peek()!r}")
+        self.pos += 1
+
+    def value(self):
+        """
+        Decodifica o próximo valor JSON completo, lendo mais blocos enquanto ele estiver incompleto.
+        """
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError as e:
+                # JSON inválido: falha logo, em vez de ler o resto do arquivo para o buffer
+                if not self.truncated(e):
+                    raise
+                # Item maior que o buffer: lê blocos cada vez maiores para não decodificar de novo a cada bloco
+                if not self.fill(max(self.read_size, len(self.buffer) - self.pos)):
+                    raise
+                continue
+            # Um número perto do fim do buffer pode continuar no próximo bloco (ex.: '1.' + '5')
+            if len(self.buffer) - end <= TRUNCATION_MARGIN and not self.eof and self.fill():
+                continue
+            self.pos = end
+            return value
+
+    def truncated(self, error):
+        """
+        Indica se o erro de decodificação pode vir só do valor estar cortado no fim do buffer:
+        uma string ainda sem as aspas finais ou um erro perto do fim do que já foi lido.
+        """
+        return error.msg.startswith('Unterminated string') or len(self.buffer) - error.pos <= TRUNCATION_MARGIN
+
+def project(item, fields):
+    """
+    Só os campos em fields de um item (os ausentes ficam de fora). Sem fields, o item inteiro.
+    """
+    if not fields or not isinstance(item, dict):
+        return item
+    return {field: item[field] for field in fields if field in item}
+
+def iter_json_array(f, key=None, read_size=READ_SIZE, fields=None):
+    """
+    Percorre, um por um, os itens de um array JSON sem carregar o arquivo inteiro.
+    Sem key, o documento deve ser o próprio array (ex.: as regras em data/acp_rules);
+    com key, um objeto cujo campo key é o array (ex.: {"items": [...]} do FP_SO.json).
+    Com fields, cada item traz só esses campos; o restante é descartado assim que o item é lido.
+    """
+    reader = _Reader(f, read_size)
+    if key is not None:
+        reader.expect('{')
+        while True:
+            if reader.peek() == '}':
+                return
+            name = reader.value()
+            reader.expect(':')
+            if name == key:
+                break
+            # Outros campos são lidos e descartados
+            reader.value()
+            if reader.peek() == ',':
+                reader.pos += 1
+    reader.expect('[')
+    if reader.peek() == ']':
+        return
+    while True:
+        yield project(reader.value(), fields)
+        char = reader.peek()
+        if char == ',':
+            reader.pos += 1
+        elif char == ']':
+            return
+        else:
+            raise ValueError(f"JSON inválido: esperado ',' ou ']', encontrado {char!r}")
+
+def iter_json_lines(f, fields=None):
+    """
+    Itens de um arquivo NDJSON (um documento JSON por linha); linhas vazias são ignoradas.
+    """
+    for number, line in enumerate(f, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield project(json.loads(line), fields)
+        except json.JSONDecodeError as e:
+            logger.warning(f"Linha {number} ignorada (JSON inválido): {e}")
+
+class JsonArrayWriter:
+    """
+    Grava um array JSON compacto item por item, sem montar a lista em memória, usado como
+    "with JsonArrayWriter(path) as writer: writer.write(item)". O arquivo é escrito em path.tmp e só
+    substitui o anterior no fim, se tudo correu bem; em caso de exceção o arquivo anterior é mantido.
+    Se o conteúdo gravado for idêntico ao do arquivo existente, este é mantido (com a data de modificação).
+    Com key, grava {"key": [...]} (formato do FP_SO.json).
+    """
+
+    def __init__(self, path, key=None):
+        self.path = path
+        self.key = key
+        self.tmp_path = f"{path}.tmp"
+        self.count = 0
+        self.changed = False
+        self._file = None
+
+    def __enter__(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self._file = open(self.tmp_path, 'w')
+        self._file.write('{' + json.dumps(self.key) + ':[' if self.key is not None else '[')
+        return self
+
+    def write(self, item):
+        if self.count:
+            self._file.write(',')
+        self._file.write(json.dumps(item, separators=(',', ':')))
+        self.count += 1
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            if exc_type is None:
+                self._file.write(']}' if self.key is not None else ']')
+        finally:
+            self._file.close()
+        if exc_type is not None:
+            os.remove(self.tmp_path)
+            return False
+        if os.path.exists(self.path) and filecmp.cmp(self.tmp_path, self.path, shallow=False):
+            os.remove(self.tmp_path)
+            logger.debug(f"{self.path} sem alterações.")
+        else:
+            os.replace(self.tmp_path, self.path)
+            self.changed = True
+        return False
+
+def write_json_array(path, items, key=None):
+    """
+    Grava os itens (qualquer iterável, ex.: FMCClient.iter_items) com JsonArrayWriter, à medida que chegam.
+    Retorna (quantidade de itens, se o arquivo mudou).
+    """
+    with JsonArrayWriter(path, key) as writer:
+        for item in items:
+            writer.write(item)
+    return writer.count, writer.changed
@@ -0,0 +1,86 @@
+import contextvars
+import logging
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+# Nível padrão dos logs; pode ser alterado com a variável de ambiente FIREWALL_VIEWER_LOG_LEVEL
+LOG_LEVEL = os.environ.get('FIREWALL_VIEWER_LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = "%(asctime)s %(levelname)s [%(request_id)s] %(name)s: %(message)s"
+
+# Identificador da requisição (ou do job de sincronização) em andamento
+request_id_var = contextvars.ContextVar('request_id', default='-')
+# Rastreamento detalhado (por regra/objeto), ligado apenas para a requisição que pediu
+trace_var = contextvars.ContextVar('trace', default=False)
+
+_configured = False
+
+class RequestIdFilter(logging.Filter):
+    """
+    Acrescenta o request_id do contexto atual a cada registro de log.
+    """
+
+    def filter(self, record):
+        record.request_id = request_id_var.get()
+        return True
+
+def setup_logging(level=None):
+    """
+    Configura o logging do projeto uma única vez: saída em stderr com nível,
+    horário, request_id e módulo de origem.
+    """
+    global _configured
+    if _configured:
+        return
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    handler.addFilter(RequestIdFilter())
+    logger = logging.getLogger('firewall_viewer')
+    logger.addHandler(handler)
+    logger.setLevel(level or LOG_LEVEL)
+    logger.propagate = False
+    _configured = True
+
+def get_logger(name):
+    """
+    Retorna o logger de um módulo, agrupado sob 'firewall_viewer'.
+    """
+    setup_logging()
+    return logging.getLogger(f'firewall_viewer.{name}')
+
+def bind_request(request_id, trace=False):
+    """
+    Associa um request_id (e o rastreamento opcional) ao contexto atual.
+    """
+    request_id_var.set(request_id)
+    trace_var.set(trace)
+
+def tracing_enabled():
+    return trace_var.get()
+
+def trace(logger, message, *args):
+    """
+    Registra uma mensagem de rastreamento por regra/objeto, apenas se o rastreamento
+    foi ligado para a requisição atual (ex.: ?trace=1).
+    """
+    if trace_var.get():
+        logger.info("[trace] " + message, *args)
+
+@contextmanager
+def timed(logger, label, level=logging.INFO):
+    """
+    Mede a duração de um trecho e registra "<label> levou Xs".
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        logger.log(level, "%s levou %.3fs", label, time.perf_counter() - start)
+
+def submit_with_context(pool, function, *args, **kwargs):
+    """
+    Envia uma tarefa ao pool de threads preservando o request_id do contexto atual.
+    """
+    context = contextvars.copy_context()
+    return pool.submit(context.run, function, *args, **kwargs)
@@ -1,99 +1,213 @@
 import requests
 import json
 import argparse
-from config import domain_uuid, fmc_username, fmc_password
+import ipaddress
+from concurrent.futures import ThreadPoolExecutor
+import config
+from FP_Client import get_client
+from FP_DynamicObject import get_dynamic_object_mappings
+from FP_Log import get_logger, submit_with_context
 
-BASE_URL = "https://fmcrestapisandbox.cisco.com"
+logger = get_logger(__name__)
 
-def obtain_auth_token(username, password):
-    """Obtains an authentication token from the FMC."""
-    url = "https://fmcrestapisandbox.cisco.com/api/fmc_platform/v1/auth/generatetoken"
-    headers = {"Content-Type": "application/json"}
-    try:
-        response = requests.post(url, headers=headers, auth=(username, password), verify=False)
-        response.raise_for_status()
-        return response.headers["X-auth-access-token"]
-    except requests.exceptions.RequestException as e:
-        print(f"Authentication Error: {e}")
-        return None
+# Endpoint de atualização em lote dos mappings de objetos dinâmicos
+BULK_MAPPINGS_PATH = "object/dynamicobjectmappings"
+# Mappings por chamada em lote. Pode ser ajustado com dynamic_mapping_chunk_size no config.py.
+MAPPING_CHUNK_SIZE = 1000
+# Chamadas em lote enviadas em paralelo (o cliente ainda respeita o limite de requisições do FMC)
+MAPPING_WORKERS = 4
 
-def get_existing_mappings(object_id, auth_token):
+def get_existing_mappings(object_id):
     """Gets the existing IP mappings for a dynamic object."""
-    url = f"{BASE_URL}/api/fmc_config/v1/domain/{domain_uuid}/object/dynamicobjects/{object_id}/mappings"
-    headers = {"X-auth-access-token": auth_token}
     try:
-        response = requests.get(url, headers=headers, verify=False)
-        response.raise_for_status()
-        return response.json().get("mappings", [])
+        return get_dynamic_object_mappings(object_id)
     except requests.exceptions.RequestException as e:
-        print(f"Error getting existing mappings: {e}")
+        logger.error(f"Error getting existing mappings: {e}")
         return []
 
-def update_mapped_ips(object_id, ip_addresses, auth_token, action):
+def update_mapped_ips(object_id, ip_addresses, action):
     """Updates the mapped IPs of an existing dynamic object."""
-    url = f"{BASE_URL}/api/fmc_config/v1/domain/{domain_uuid}/object/dynamicobjects/{object_id}/mappings?action={action}"
-    headers = {
-        "X-auth-access-token": auth_token,
-        "Content-Type": "application/json",
-    }
-    
     # If action is remove, and no ip_addresses are provided, remove all mappings.
     if action == "remove" and not ip_addresses:
-        ip_addresses = get_existing_mappings(object_id, auth_token)
-    
+        ip_addresses = get_existing_mappings(object_id)
+
     if ip_addresses:
         payload = {"mappings": ip_addresses}
     else:
         payload = {"mappings": []}  # Send empty list to remove all mappings
-    
+
     try:
-        response = requests.put(url, headers=headers, data=json.dumps(payload), verify=False)
-        response.raise_for_status()  # Raise HTTPError for bad responses (4xx or 5xx)
-        return response.json()
+        return get_client().put(f"object/dynamicobjects/{object_id}/mappings", json=payload, params={"action": action})
     except requests.exceptions.ConnectionError as e:
-        print(f"Connection Error: {e}")
+        logger.error(f"Connection Error: {e}")
         return None
     except requests.exceptions.HTTPError as e:
-        print(f"HTTP Error: {e} - {response.status_code}")
-        try:
-            error_json = response.json()
-            if "error" in error_json and "messages" in error_json["error"]:
-                for message in error_json["error"]["messages"]:
-                    print(f"  Error Description: {message.get('description', 'No description available')}")
-        except json.JSONDecodeError:
-            print(f"  Error Response (non-JSON): {response.text}")
+        response = e.response
+        logger.error(f"HTTP Error: {e} - {response.status_code}")
+        log_api_error(response)
         return None
     except Exception as e:
-        print(f"An unexpected error occurred: {e}")
+        logger.error(f"An unexpected error occurred: {e}")
         return None
 
+def log_api_error(response):
+    """
+    Registra as mensagens de erro retornadas pelo FMC e as devolve numa string.
+    """
+    try:
+        error_json = response.json()
+    except ValueError:
+        logger.error(f"Error Response (non-JSON): {response.text}")
+        return response.text
+    messages = [
+        message.get('description', 'No description available')
+        for message in (error_json.get("error") or {}).get("messages", [])
+    ]
+    for message in messages:
+        logger.error(f"Error Description: {message}")
+    return "; ".join(messages)
+
+def mapping_key(value):
+    """
+    Forma canônica de um mapping para comparação: "10.0.0.1" e "10.0.0.1/32" são o mesmo endereço.
+    Valores que não são IPs são comparados como texto.
+    """
+    value = value.strip()
+    try:
+        network = ipaddress.ip_network(value, strict=False)
+    except ValueError:
+        return value
+    if network.prefixlen == network.max_prefixlen:
+        return str(network.network_address)
+    return str(network)
+
+def diff_mappings(current, desired):
+    """
+    Compara os mappings atuais com o conjunto desejado e retorna (a adicionar, a remover).
+    Os removidos usam o texto exato que o FMC retornou.
+    """
+    current_by_key = {}
+    for value in current:
+        current_by_key.setdefault(mapping_key(value), value)
+    desired_by_key = {}
+    for value in desired:
+        if value and value.strip():
+            desired_by_key.setdefault(mapping_key(value), value.strip())
+    to_add = [desired_by_key[key] for key in sorted(desired_by_key.keys() - current_by_key.keys())]
+    to_remove = [current_by_key[key] for key in sorted(current_by_key.keys() - desired_by_key.keys())]
+    return to_add, to_remove
+
+def mapping_chunks(changes, chunk_size=MAPPING_CHUNK_SIZE):
+    """
+    Divide as alterações {object_id: {'add': [...], 'remove': [...]}} em payloads do endpoint em lote,
+    com no máximo chunk_size mappings cada; um payload pode juntar vários objetos.
+    Retorna [(ação, quantidade, payload)], primeiro as remoções e depois as adições.
+    """
+    chunks = []
+    for action in ('remove', 'add'):
+        entries, count = [], 0
+        for object_id, object_changes in changes.items():
+            mappings = list(object_changes.get(action) or [])
+            start = 0
+            while start < len(mappings):
+                part = mappings[start:start + chunk_size - count]
+                entries.append({"mappings": part, "dynamicObject": {"id": object_id}})
+                count += len(part)
+                start += len(part)
+                if count == chunk_size:
+                    chunks.append((action, count, {action: entries}))
+                    entries, count = [], 0
+        if entries:
+            chunks.append((action, count, {action: entries}))
+    return chunks
+
+def send_mapping_chunk(index, action, count, payload):
+    """
+    Envia um payload em lote e retorna o resultado desse pedaço (nunca levanta exceção).
+    """
+    result = {
+        'chunk': index,
+        'action': action,
+        'count': count,
+        'objects': [entry["dynamicObject"]["id"] for entry in payload[action]],
+        'status': 'success',
+    }
+    try:
+        get_client().post(BULK_MAPPINGS_PATH, json=payload)
+    except requests.exceptions.HTTPError as e:
+        result['status'] = 'error'
+        result['error'] = f"HTTP {e.response.status_code}: {log_api_error(e.response) or e}"
+    except requests.exceptions.RequestException as e:
+        result['status'] = 'error'
+        result['error'] = str(e)
+    if result['status'] == 'error':
+        logger.error(f"Falha no lote {index} ({action}, {count} mappings): {result['error']}")
+    return result
+
+def apply_mapping_changes(changes, chunk_size=None, max_workers=MAPPING_WORKERS):
+    """
+    Aplica no FMC as alterações {object_id: {'add': [...], 'remove': [...]}} usando o endpoint em lote (POST),
+    no processo atual e com a sessão (pool de conexões) do cliente compartilhado.
+    Os lotes de remoção são enviados (em paralelo) e concluídos antes dos lotes de adição.
+    Retorna o relatório: totais aplicados com sucesso e o resultado de cada pedaço.
+    """
+    chunk_size = chunk_size or getattr(config, 'dynamic_mapping_chunk_size', MAPPING_CHUNK_SIZE)
+    chunks = mapping_chunks(changes, chunk_size)
+    results = []
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        # Todas as remoções terminam antes de qualquer adição: um IP trocado de lugar não é removido depois de readicionado
+        for phase in ('remove', 'add'):
+            futures = [
+                submit_with_context(pool, send_mapping_chunk, index, action, count, payload)
+                for index, (action, count, payload) in enumerate(chunks, start=1) if action == phase
+            ]
+            results.extend(future.result() for future in futures)
+
+    report = {'status': 'success', 'added': 0, 'removed': 0, 'applied': {}, 'chunks': results}
+    for (action, count, payload), result in zip(chunks, results):
+        if result['status'] != 'success':
+            report['status'] = 'error'
+            continue
+        report['added' if action == 'add' else 'removed'] += count
+        for entry in payload[action]:
+            applied = report['applied'].setdefault(entry["dynamicObject"]["id"], {'add': [], 'remove': []})
+            applied[action].extend(entry["mappings"])
+    logger.info(f"Mappings atualizados em {len(chunks)} lote(s): {report['added']} adicionados, "
+                f"{report['removed']} removidos, {sum(r['status'] != 'success' for r in results)} lote(s) com erro")
+    return report
+
+def set_mapped_ips(object_id, ip_addresses, chunk_size=None):
+    """
+    Deixa o objeto dinâmico com exatamente os IPs em ip_addresses: busca os mappings atuais,
+    calcula a diferença e envia só o que mudou. Levanta RequestException se não conseguir ler os atuais.
+    """
+    to_add, to_remove = diff_mappings(get_dynamic_object_mappings(object_id), ip_addresses)
+    return apply_mapping_changes({object_id: {'add': to_add, 'remove': to_remove}}, chunk_size)
+
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description="Update mapped IPs for a dynamic object.")
     parser.add_argument("object_id", help="ID of the dynamic object")
-    parser.add_argument("action", choices=["add", "remove"], help="Action to perform: add or remove")
+    parser.add_argument("action", choices=["add", "remove", "set"],
+                        help="Action to perform: add, remove or set (replace all mappings with the given list)")
     parser.add_argument("ip_addresses", nargs="?", default="", help="Comma-separated list of IP addresses")
+    parser.add_argument("--file", help="File with one IP address per line (in addition to ip_addresses)")
 
     args = parser.parse_args()
     object_id = args.object_id
     action = args.action
     ip_addresses = [ip.strip() for ip in args.ip_addresses.split(",") if ip.strip()]
+    if args.file:
+        with open(args.file, 'r') as f:
+            ip_addresses.extend(line.strip() for line in f if line.strip())
 
-    auth_token = obtain_auth_token(fmc_username, fmc_password)
-    print(ip_addresses)
-    if not auth_token:
-        print("Failed to obtain authentication token.")
-        exit()
-
-    print("Token:", auth_token)
-
-    if action == "remove" and not ip_addresses:
-        # Remove all mappings if action is "remove" and no IPs are specified.
-        response = update_mapped_ips(object_id, [], auth_token, "remove")
+    if action == "set" or (action == "remove" and not ip_addresses):
+        # "remove" sem IPs remove todos os mappings: é o mesmo que "set" com uma lista vazia
+        report = set_mapped_ips(object_id, ip_addresses)
     else:
-        response = update_mapped_ips(object_id, ip_addresses, auth_token, action)
+        report = apply_mapping_changes({object_id: {action: ip_addresses}})
 
-    if response:
-        print(f"Successfully updated mapped IPs. Action: {action}")
-        print("Response:", json.dumps(response, indent=2))
+    print(json.dumps({key: value for key, value in report.items() if key != 'applied'}, indent=2))
+    if report['status'] == 'success':
+        print(f"Successfully updated mapped IPs: {report['added']} added, {report['removed']} removed.")
     else:
-        print(f"Failed to update mapped IPs. Action: {action}")
+        print("Failed to update some mapped IPs (see chunks above).")
@@ -0,0 +1,157 @@
+import itertools
+import os
+import threading
+import FP_Targets
+from FP_JsonStream import iter_json_array
+from FP_Log import get_logger, trace
+
+logger = get_logger(__name__)
+
+# Tipos de objeto que agrupam outros objetos
+GROUP_TYPES = {'NetworkGroup'}
+# Objetos dinâmicos: os endereços são os mappings gravados em 'content' pelo FP_DynamicObject
+DYNAMIC_TYPES = {'DynamicObject'}
+# Campos dos objetos usados pelo resolvedor e pelas portas do FP_Simulator; o restante
+# (metadata, links...) é descartado na leitura
+RESOLVER_FIELDS = ['id', 'name', 'type', 'value', 'objects', 'literals', 'content', 'protocol', 'port']
+
+class ObjectResolver:
+    """
+    Resolve objetos de rede (hosts, networks, ranges, networkgroups e objetos dinâmicos) nos
+    endereços que eles representam, a partir de uma única tabela indexada por id.
+    Grupos aninhados são achatados recursivamente e o resultado de cada grupo é memorizado,
+    de modo que membros compartilhados por vários grupos são resolvidos uma única vez.
+    Ciclos entre grupos (A contém B, que contém A) são detectados: todos os grupos do ciclo
+    recebem a união dos seus endereços e o ciclo é registrado no log.
+    """
+
+    def __init__(self, items):
+        self.objects = {}
+        for item in items or []:
+            if item.get('id'):
+                self.objects[item['id']] = item
+        self.cycles = []
+        self._resolved = {}
+        self._lock = threading.Lock()
+
+    def resolve(self, object_id):
+        """
+        Retorna a tupla de endereços de um objeto, sem repetições e na ordem em que aparecem.
+        Objetos desconhecidos resultam em uma tupla vazia.
+        """
+        addresses = self._resolved.get(object_id)
+        if addresses is not None:
+            return addresses
+        if object_id not in self.objects:
+            return ()
+        with self._lock:
+            if object_id not in self._resolved:
+                self._strongconnect(object_id, {}, {}, [], set())
+            return self._resolved[object_id]
+
+    def _member_ids(self, item):
+        if item.get('type') not in GROUP_TYPES:
+            return []
+        return [member['id'] for member in item.get('objects') or [] if member.get('id')]
+
+    def _own_addresses(self, item):
+        if item.get('type') in DYNAMIC_TYPES:
+            return [address for address in item.get('content') or [] if address]
+        if 'value' in item and item.get('type') not in GROUP_TYPES:
+            return [item['value']] if item['value'] else []
+        return [literal['value'] for literal in item.get('literals') or [] if literal.get('value')]
+
+    def _strongconnect(self, object_id, index, lowlink, stack, on_stack):
+        """
+        Busca em profundidade de Tarjan: cada componente fortemente conexo (um grupo isolado
+        ou um ciclo de grupos) é resolvido de uma vez, depois de todos os seus membros externos.
+        """
+        index[object_id] = lowlink[object_id] = len(index)
+        stack.append(object_id)
+        on_stack.add(object_id)
+
+        for member_id in self._member_ids(self.objects[object_id]):
+            if member_id in self._resolved or member_id not in self.objects:
+                continue
+            if member_id not in index:
+                self._strongconnect(member_id, index, lowlink, stack, on_stack)
+                lowlink[object_id] = min(lowlink[object_id], lowlink[member_id])
+            elif member_id in on_stack:
+                lowlink[object_id] = min(lowlink[object_id], index[member_id])
+
+        if lowlink[object_id] != index[object_id]:
+            return
+
+        component = []
+        while True:
+            member_id = stack.pop()
+            on_stack.discard(member_id)
+            component.append(member_id)
+            if member_id == object_id:
+                break
+        component.reverse()
+        component_ids = set(component)
+
+        if len(component) > 1 or object_id in self._member_ids(self.objects[object_id]):
+            names = [self.objects[member_id].get('name', member_id) for member_id in component]
+            self.cycles.append(names)
+            logger.warning("Ciclo entre grupos de objetos: %s", " -> ".join(names))
+
+        addresses = {}
+        for group_id in component:
+            item = self.objects[group_id]
+            for address in self._own_addresses(item):
+                addresses[address] = None
+            for member_id in self._member_ids(item):
+                if member_id not in component_ids:
+                    for address in self._resolved.get(member_id, ()):
+                        addresses[address] = None
+
+        resolved = tuple(addresses)
+        for group_id in component:
+            self._resolved[group_id] = resolved
+
+def object_source_paths(data_folder=None):
+    """
+    Arquivos de onde vêm os objetos resolvidos nas regras: estáticos (FP_SO.json) e dinâmicos (FP_DO.json).
+    Sem data_folder, usa a pasta de dados do alvo atual (FP_Targets).
+    """
+    data_folder = data_folder or FP_Targets.data_folder()
+    return [os.path.join(data_folder, 'FP_SO.json'), os.path.join(data_folder, 'FP_DO.json')]
+
+def load_object_resolver(data_folder=None):
+    """
+    Monta o resolvedor com os objetos estáticos e dinâmicos em uma única tabela indexada por id.
+    O FP_SO.json guarda {"items": [...]}, já o FP_DO.json é uma lista simples. Os arquivos são lidos
+    em streaming e cada objeto guarda só os campos em RESOLVER_FIELDS.
+    """
+    fp_so_path, fp_do_path = object_source_paths(data_folder)
+    return ObjectResolver(itertools.chain(_iter_json(fp_so_path, 'items'), _iter_json(fp_do_path)))
+
+def resolve_networks(resolver, networks, label="Rede"):
+    """
+    Endereços de um campo de rede da regra (sourceNetworks/destinationNetworks):
+    os objetos referenciados, resolvidos pelo id, seguidos dos literais da própria regra.
+    """
+    addresses = []
+    if not networks:
+        return addresses
+    for network_object in networks.get('objects') or []:
+        object_id = network_object.get('id')
+        resolved = resolver.resolve(object_id) if object_id else ()
+        if resolved:
+            trace(logger, "%s %s -> %s", label, object_id, resolved)
+            addresses.extend(resolved)
+    for literal in networks.get('literals') or []:
+        if literal.get('value'):
+            addresses.append(literal['value'])
+    return addresses
+
+def _iter_json(filepath, key=None):
+    try:
+        with open(filepath, 'r') as file:
+            yield from iter_json_array(file, key, fields=RESOLVER_FIELDS)
+    except FileNotFoundError:
+        logger.warning(f"Arquivo não encontrado: {filepath}")
+    except ValueError:
+        logger.error(f"Erro ao decodificar JSON de: {filepath}")
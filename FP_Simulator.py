@@ -0,0 +1,474 @@
+import argparse
+import bisect
+import csv
+import ipaddress
+import json
+import socket
+import sys
+import FP_Store
+import FP_Targets
+from collections import Counter, namedtuple
+from FP_Log import get_logger
+from FP_IPIndex import parse_address
+from FP_ObjectResolver import load_object_resolver, resolve_networks
+
+try:
+    import numpy as np
+except ImportError:  # Sem NumPy o modo em lote avalia fluxo a fluxo
+    np = None
+
+logger = get_logger(__name__)
+
+# Quantidade de fluxos lidos do CSV e avaliados de uma vez no modo em lote
+BATCH_CHUNK_SIZE = 100000
+
+PROTOCOLS = {'ICMP': 1, 'TCP': 6, 'UDP': 17, 'GRE': 47, 'ESP': 50, 'AH': 51, 'ICMPV6': 58, 'SCTP': 132}
+ALL_PORTS = (0, 65535)
+# Regras MONITOR apenas registram o tráfego; a avaliação segue para a próxima regra
+NON_TERMINAL_ACTIONS = {'MONITOR'}
+# Condições da regra que dependem de inspeção e não podem ser avaliadas só pelo tuple
+UNEVALUATED_CONDITIONS = [
+    'applications', 'urls', 'users', 'vlanTags', 'sourceSecurityGroupTags',
+    'destinationSecurityGroupTags', 'sourceDynamicAttributes', 'destinationDynamicAttributes',
+]
+
+# Campos das regras usados na compilação
+RULE_FIELDS = [
+    'name', 'action', 'enabled', 'sourceZones', 'destinationZones', 'sourceNetworks',
+    'destinationNetworks', 'sourcePorts', 'destinationPorts',
+] + UNEVALUATED_CONDITIONS
+
+# Colunas aceitas no CSV de fluxos (a primeira de cada lista é o nome padrão)
+FLOW_COLUMNS = {
+    'src': ['src', 'src_ip', 'source', 'sa', 'srcaddr'],
+    'dst': ['dst', 'dst_ip', 'destination', 'da', 'dstaddr'],
+    'proto': ['proto', 'protocol', 'pr'],
+    'dport': ['dport', 'dst_port', 'dp', 'dstport'],
+    'src_zone': ['src_zone', 'source_zone'],
+    'dst_zone': ['dst_zone', 'destination_zone'],
+    'sport': ['sport', 'src_port', 'sp', 'srcport'],
+}
+
+Flow = namedtuple('Flow', 'src_version src dst_version dst proto dport sport src_zone dst_zone')
+
+def parse_protocol(value):
+    """
+    Converte um protocolo ("TCP", "tcp", "6") no número IANA. None se vazio.
+    """
+    if value is None or str(value).strip() == '':
+        return None
+    value = str(value).strip().upper()
+    if value.isdigit():
+        return int(value)
+    if value not in PROTOCOLS:
+        raise ValueError(f"Protocolo desconhecido: {value}")
+    return PROTOCOLS[value]
+
+def parse_port_range(value):
+    """
+    Converte "443" ou "8000-8080" em (início, fim). Sem porta, todas as portas.
+    """
+    value = str(value or '').strip()
+    if not value:
+        return ALL_PORTS
+    if '-' in value:
+        first, last = value.split('-', 1)
+        return int(first), int(last)
+    return int(value), int(value)
+
+def parse_ip(value):
+    """
+    Converte um IP em (versão, inteiro). IPv4 usa inet_pton, bem mais rápido que ipaddress em lotes grandes.
+    """
+    value = str(value).strip()
+    try:
+        return 4, int.from_bytes(socket.inet_pton(socket.AF_INET, value), 'big')
+    except OSError:
+        address = ipaddress.ip_address(value)
+        return address.version, int(address)
+
+def parse_flow(src, dst, proto=None, dport=None, src_zone=None, dst_zone=None, sport=None):
+    """
+    Normaliza um fluxo: IPs viram inteiros, o protocolo vira número e as portas inteiros.
+    Zona ou porta ausentes (None) são tratadas como desconhecidas e não restringem a busca.
+    Levanta ValueError para IPs ou protocolos inválidos.
+    """
+    src_version, src_ip = parse_ip(src)
+    dst_version, dst_ip = parse_ip(dst)
+    return Flow(
+        src_version, src_ip, dst_version, dst_ip, parse_protocol(proto),
+        int(dport) if dport not in (None, '') else None,
+        int(sport) if sport not in (None, '') else None,
+        src_zone or None, dst_zone or None,
+    )
+
+class NetworkSet:
+    """
+    Conjunto de endereços de uma condição de rede, como intervalos disjuntos e ordenados por versão de IP.
+    """
+
+    def __init__(self, addresses):
+        intervals = {}
+        for address in addresses:
+            interval = parse_address(address)
+            if interval:
+                intervals.setdefault(interval[0], []).append(interval[1:])
+        self.ranges = {}
+        self._ipv4_arrays = None
+        for version, version_intervals in intervals.items():
+            version_intervals.sort()
+            merged = [list(version_intervals[0])]
+            for start, end in version_intervals[1:]:
+                if start <= merged[-1][1] + 1:
+                    merged[-1][1] = max(merged[-1][1], end)
+                else:
+                    merged.append([start, end])
+            self.ranges[version] = ([start for start, _ in merged], [end for _, end in merged])
+
+    def contains(self, version, address):
+        starts, ends = self.ranges.get(version, ((), ()))
+        position = bisect.bisect_right(starts, address) - 1
+        return position >= 0 and address <= ends[position]
+
+    def ipv4_arrays(self):
+        """
+        Intervalos IPv4 como arrays NumPy (início, fim), criados uma vez para o modo em lote.
+        """
+        if self._ipv4_arrays is None:
+            starts, ends = self.ranges.get(4, ((), ()))
+            self._ipv4_arrays = (np.asarray(starts, dtype=np.int64), np.asarray(ends, dtype=np.int64))
+        return self._ipv4_arrays
+
+class CompiledRule:
+    """
+    Uma regra da política pré-compilada para avaliação: zonas como conjuntos, redes como
+    intervalos ordenados e portas como (protocolo, início, fim). None em uma condição significa "any".
+    """
+
+    def __init__(self, rule, position, resolver, port_resolver):
+        self.name = rule.get('name')
+        self.position = position
+        self.action = rule.get('action')
+        self.source_zones = compile_zones(rule.get('sourceZones'))
+        self.destination_zones = compile_zones(rule.get('destinationZones'))
+        self.source_networks = compile_networks(resolver, rule.get('sourceNetworks'))
+        self.destination_networks = compile_networks(resolver, rule.get('destinationNetworks'))
+        self.unevaluated = [condition for condition in UNEVALUATED_CONDITIONS if rule.get(condition)]
+        self.source_ports = port_resolver.compile(rule.get('sourcePorts'), self.unevaluated)
+        self.destination_ports = port_resolver.compile(rule.get('destinationPorts'), self.unevaluated)
+
+    def matches(self, flow):
+        if not zone_matches(self.source_zones, flow.src_zone):
+            return False
+        if not zone_matches(self.destination_zones, flow.dst_zone):
+            return False
+        if self.source_networks is not None and not self.source_networks.contains(flow.src_version, flow.src):
+            return False
+        if self.destination_networks is not None and not self.destination_networks.contains(flow.dst_version, flow.dst):
+            return False
+        if not port_matches(self.destination_ports, flow.proto, flow.dport):
+            return False
+        return port_matches(self.source_ports, flow.proto, flow.sport)
+
+    def to_dict(self):
+        return {
+            'rule': self.name,
+            'position': self.position,
+            'action': self.action,
+            'unevaluated': self.unevaluated,
+        }
+
+def compile_zones(zones):
+    if not zones or not zones.get('objects'):
+        return None
+    compiled = set()
+    for zone in zones['objects']:
+        compiled.update(value for value in (zone.get('name'), zone.get('id')) if value)
+    return frozenset(compiled)
+
+def compile_networks(resolver, networks):
+    if not networks or not (networks.get('objects') or networks.get('literals')):
+        return None
+    # Uma condição que não resolve para nenhum IP (ex.: só FQDN) não casa com nenhum fluxo
+    return NetworkSet(resolve_networks(resolver, networks))
+
+def zone_matches(zones, zone):
+    return zones is None or zone is None or zone in zones
+
+def port_matches(ports, proto, port):
+    if ports is None:
+        return True
+    for entry_proto, first, last in ports:
+        if entry_proto is not None and proto is not None and entry_proto != proto:
+            continue
+        if port is None or first <= port <= last:
+            return True
+    return False
+
+class PortResolver:
+    """
+    Resolve objetos de porta (ProtocolPortObject, ICMPV4Object e PortObjectGroup) em entradas (protocolo, início, fim).
+    """
+
+    def __init__(self, objects):
+        self.objects = objects
+        self._resolved = {}
+
+    def compile(self, ports, unevaluated):
+        if not ports or not (ports.get('objects') or ports.get('literals')):
+            return None
+        entries = []
+        for port_object in ports.get('objects') or []:
+            resolved = self.resolve(port_object)
+            if resolved is None:
+                # Objeto de porta desconhecido: a condição não restringe e fica registrada como não avaliada
+                unevaluated.append(f"porta {port_object.get('name') or port_object.get('id')}")
+                return None
+            entries.extend(resolved)
+        for literal in ports.get('literals') or []:
+            entries.append(port_entry(literal))
+        return tuple(entries)
+
+    def resolve(self, port_object):
+        object_id = port_object.get('id')
+        if object_id in self._resolved:
+            return self._resolved[object_id]
+        item = self.objects.get(object_id) or port_object
+        if item.get('type') == 'PortObjectGroup':
+            entries = []
+            for member in item.get('objects') or []:
+                member_entries = self.resolve(member)
+                if member_entries is None:
+                    return None
+                entries.extend(member_entries)
+        elif item.get('protocol'):
+            entries = [port_entry(item)]
+        else:
+            return None
+        self._resolved[object_id] = entries
+        return entries
+
+def port_entry(item):
+    """
+    Entrada (protocolo, início, fim) de um objeto ou literal de porta. ICMP não tem porta: vale o protocolo todo.
+    """
+    proto = parse_protocol(item.get('protocol'))
+    if proto in (PROTOCOLS['ICMP'], PROTOCOLS['ICMPV6']):
+        return proto, ALL_PORTS[0], ALL_PORTS[1]
+    first, last = parse_port_range(item.get('port'))
+    return proto, first, last
+
+class PolicySimulator:
+    """
+    Simula a avaliação de uma Access Control Policy: a primeira regra habilitada que casa com o
+    fluxo decide a ação, como no dispositivo. Regras MONITOR são puladas, e condições que dependem
+    de inspeção (aplicações, URLs, usuários...) são consideradas satisfeitas e listadas em "unevaluated".
+    Sem nenhuma regra casando vale a ação padrão da política (rule e action None).
+    """
+
+    def __init__(self, rules, resolver):
+        port_resolver = PortResolver(resolver.objects)
+        self.rules = [
+            CompiledRule(rule, position, resolver, port_resolver)
+            for position, rule in enumerate(rules, start=1)
+            if rule.get('enabled', True) and rule.get('action') not in NON_TERMINAL_ACTIONS
+        ]
+
+    def match(self, flow):
+        """
+        Índice (em self.rules) da primeira regra que casa com o fluxo, ou -1.
+        """
+        for index, rule in enumerate(self.rules):
+            if rule.matches(flow):
+                return index
+        return -1
+
+    def simulate(self, src, dst, proto=None, dport=None, src_zone=None, dst_zone=None, sport=None):
+        """
+        Avalia um fluxo e retorna a regra que casou, sua posição na política e a ação.
+        """
+        index = self.match(parse_flow(src, dst, proto, dport, src_zone, dst_zone, sport))
+        if index < 0:
+            return {'rule': None, 'position': None, 'action': None, 'unevaluated': []}
+        return self.rules[index].to_dict()
+
+    def match_batch(self, flows):
+        """
+        Índices da primeira regra que casa com cada fluxo (-1 sem regra). Com NumPy, os fluxos IPv4
+        são avaliados de forma vetorizada, regra a regra, só sobre os fluxos que ainda não casaram.
+        """
+        if np is None:
+            return [self.match(flow) for flow in flows]
+
+        results = [-1] * len(flows)
+        ipv4 = [position for position, flow in enumerate(flows) if flow.src_version == 4 and flow.dst_version == 4]
+        ipv4_set = set(ipv4)
+        for position, flow in enumerate(flows):
+            if position not in ipv4_set:
+                results[position] = self.match(flow)
+        if ipv4:
+            for position, index in zip(ipv4, self._match_vectorized([flows[position] for position in ipv4])):
+                results[position] = int(index)
+        return results
+
+    def _match_vectorized(self, flows):
+        src = np.fromiter((flow.src for flow in flows), dtype=np.int64, count=len(flows))
+        dst = np.fromiter((flow.dst for flow in flows), dtype=np.int64, count=len(flows))
+        proto = np.fromiter((-1 if flow.proto is None else flow.proto for flow in flows), dtype=np.int64, count=len(flows))
+        dport = np.fromiter((-1 if flow.dport is None else flow.dport for flow in flows), dtype=np.int64, count=len(flows))
+        sport = np.fromiter((-1 if flow.sport is None else flow.sport for flow in flows), dtype=np.int64, count=len(flows))
+        zone_codes = {}
+        src_zone = np.fromiter((zone_codes.setdefault(flow.src_zone, len(zone_codes)) if flow.src_zone else -1 for flow in flows), dtype=np.int64, count=len(flows))
+        dst_zone = np.fromiter((zone_codes.setdefault(flow.dst_zone, len(zone_codes)) if flow.dst_zone else -1 for flow in flows), dtype=np.int64, count=len(flows))
+
+        results = np.full(len(flows), -1, dtype=np.int64)
+        pending = np.arange(len(flows))
+        for index, rule in enumerate(self.rules):
+            if not len(pending):
+                break
+            # Cada condição filtra só os candidatos que passaram pelas anteriores; redes primeiro, por serem as mais seletivas
+            candidates = pending
+            for mask_function in (
+                lambda c: _network_mask(rule.source_networks, src[c]),
+                lambda c: _network_mask(rule.destination_networks, dst[c]),
+                lambda c: _port_mask(rule.destination_ports, proto[c], dport[c]),
+                lambda c: _zone_mask(rule.source_zones, src_zone[c], zone_codes),
+                lambda c: _zone_mask(rule.destination_zones, dst_zone[c], zone_codes),
+                lambda c: _port_mask(rule.source_ports, proto[c], sport[c]),
+            ):
+                mask = mask_function(candidates)
+                if mask is not None:
+                    candidates = candidates[mask]
+                    if not len(candidates):
+                        break
+            if len(candidates):
+                results[candidates] = index
+                pending = pending[results[pending] < 0]
+        return results
+
+    def rule_result(self, index):
+        if index < 0:
+            return {'rule': None, 'position': None, 'action': None, 'unevaluated': []}
+        return self.rules[index].to_dict()
+
+def _zone_mask(zones, codes, zone_codes):
+    if zones is None:
+        return None
+    allowed = [zone_codes[zone] for zone in zones if zone in zone_codes]
+    return (codes == -1) | np.isin(codes, allowed)
+
+def _network_mask(networks, addresses):
+    if networks is None:
+        return None
+    starts, ends = networks.ipv4_arrays()
+    if not len(starts):
+        return np.zeros(len(addresses), dtype=bool)
+    positions = np.searchsorted(starts, addresses, side='right') - 1
+    inside = positions >= 0
+    inside[inside] = addresses[inside] <= ends[positions[inside]]
+    return inside
+
+def _port_mask(ports, proto, port):
+    if ports is None:
+        return None
+    mask = np.zeros(len(port), dtype=bool)
+    for entry_proto, first, last in ports:
+        if entry_proto is None:
+            proto_ok = np.ones(len(port), dtype=bool)
+        else:
+            proto_ok = (proto == -1) | (proto == entry_proto)
+        mask |= proto_ok & ((port == -1) | ((port >= first) & (port <= last)))
+    return mask
+
+def load_policy_simulator(filename, rules_directory=None, data_folder=None, resolver=None):
+    """
+    Carrega as regras de uma política (do banco, ou do JSON em data/acp_rules) e compila o simulador.
+    Sem rules_directory e data_folder, usa os do alvo atual (FP_Targets).
+    """
+    rules = FP_Store.load_policy_rules(filename, RULE_FIELDS, rules_directory)
+    return PolicySimulator(rules, resolver or load_object_resolver(data_folder))
+
+def read_flows(csv_file):
+    """
+    Lê um CSV de fluxos (com cabeçalho) em blocos de BATCH_CHUNK_SIZE, retornando (linhas, fluxos).
+    As colunas aceitam os nomes de FLOW_COLUMNS (ex.: src/dst/proto/dport ou sa/da/pr/dp do nfdump).
+    Linhas inválidas são registradas no log e ignoradas.
+    """
+    reader = csv.DictReader(csv_file)
+    columns = {}
+    for field, aliases in FLOW_COLUMNS.items():
+        columns[field] = next((name for name in reader.fieldnames or [] if name.strip().lower() in aliases), None)
+    if not columns['src'] or not columns['dst']:
+        raise ValueError("O CSV precisa das colunas de IP de origem e destino (ex.: src,dst).")
+
+    rows, flows = [], []
+    for line_number, row in enumerate(reader, start=2):
+        values = {field: row.get(column) if column else None for field, column in columns.items()}
+        try:
+            flows.append(parse_flow(**values))
+            rows.append(row)
+        except ValueError as e:
+            logger.warning(f"Linha {line_number} ignorada: {e}")
+            continue
+        if len(flows) >= BATCH_CHUNK_SIZE:
+            yield rows, flows
+            rows, flows = [], []
+    if flows:
+        yield rows, flows
+
+def simulate_csv(simulator, input_file, output_file):
+    """
+    Avalia todos os fluxos do CSV e grava cada linha com as colunas rule, position e action.
+    Retorna um Counter com quantos fluxos casaram com cada regra.
+    """
+    counts = Counter()
+    writer = None
+    for rows, flows in read_flows(input_file):
+        if writer is None:
+            writer = csv.DictWriter(output_file, fieldnames=list(rows[0].keys()) + ['rule', 'position', 'action'])
+            writer.writeheader()
+        for row, index in zip(rows, simulator.match_batch(flows)):
+            result = simulator.rule_result(index)
+            counts[result['rule']] += 1
+            writer.writerow(dict(row, rule=result['rule'] or '', position=result['position'] or '', action=result['action'] or 'DEFAULT'))
+    return counts
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simula a avaliação de fluxos contra uma Access Control Policy (primeira regra que casa).")
+    parser.add_argument("policy", help="Arquivo da política em data/acp_rules (ex.: Minha_Politica.json)")
+    parser.add_argument("--src", help="IP de origem")
+    parser.add_argument("--dst", help="IP de destino")
+    parser.add_argument("--proto", help="Protocolo (tcp, udp, icmp ou número)")
+    parser.add_argument("--dport", help="Porta de destino")
+    parser.add_argument("--sport", help="Porta de origem")
+    parser.add_argument("--src-zone", help="Zona de origem")
+    parser.add_argument("--dst-zone", help="Zona de destino")
+    parser.add_argument("--csv", help="CSV de fluxos para avaliar em lote")
+    parser.add_argument("--output", help="CSV de saída do modo em lote (padrão: stdout)")
+    parser.add_argument("--target", default=FP_Targets.DEFAULT_TARGET, help="Chave do FMC/domínio (ver FP_Targets.py)")
+    args = parser.parse_args()
+    if args.target != FP_Targets.DEFAULT_TARGET:
+        target = FP_Targets.get_target(args.target)
+        if target is None:
+            parser.error(f"Alvo não encontrado: {args.target}")
+        FP_Targets.bind_target(target)
+
+
+    simulator = load_policy_simulator(args.policy)
+    if args.csv:
+        with open(args.csv, newline='') as input_file:
+            output_file = open(args.output, 'w', newline='') if args.output else sys.stdout
+            try:
+                counts = simulate_csv(simulator, input_file, output_file)
+            finally:
+                if args.output:
+                    output_file.close()
+        for rule, count in counts.most_common():
+            logger.info(f"{rule or 'ação padrão'}: {count} fluxo(s)")
+    elif args.src and args.dst:
+        try:
+            print(json.dumps(simulator.simulate(args.src, args.dst, args.proto, args.dport, args.src_zone, args.dst_zone, args.sport), indent=4))
+        except ValueError as e:
+            parser.error(str(e))
+    else:
+        parser.error("Informe --src e --dst, ou --csv.")
@@ -0,0 +1,393 @@
+import bisect
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+import FP_Targets
+from FP_Store import get_connection, increment_generation
+from FP_Log import get_logger, timed
+
+logger = get_logger(__name__)
+
+# Snapshots mantidos por alvo. Pode ser ajustado com snapshot_retention no config.py.
+SNAPSHOT_RETENTION = 200
+# Campos que mudam sem que a regra/objeto mude (links e marcas de posição/modificação do FMC)
+VOLATILE_FIELDS = ('links',)
+VOLATILE_METADATA = ('ruleIndex', 'timestamp', 'lastUser')
+# Hashes por consulta ao ler vários blobs de uma vez (limite de parâmetros do SQLite)
+BLOB_BATCH_SIZE = 500
+# Manifests decodificados mantidos em memória (os das políticas comparadas com mais frequência)
+MANIFEST_CACHE_SIZE = 16
+
+_manifest_cache = OrderedDict()
+_manifest_lock = threading.Lock()
+
+def canonical_content(item):
+    """
+    Conteúdo de uma regra ou objeto usado no snapshot: JSON compacto com chaves ordenadas, sem os
+    campos voláteis, para que a mesma configuração sempre tenha o mesmo hash.
+    """
+    content = {key: value for key, value in item.items() if key not in VOLATILE_FIELDS}
+    metadata = content.get('metadata')
+    if isinstance(metadata, dict):
+        metadata = {key: value for key, value in metadata.items() if key not in VOLATILE_METADATA}
+        if metadata:
+            content['metadata'] = metadata
+        else:
+            del content['metadata']
+    return json.dumps(content, sort_keys=True, separators=(',', ':'))
+
+def content_hash(text):
+    return hashlib.sha1(text.encode()).hexdigest()
+
+def _add_manifest(entries, blobs):
+    """
+    Guarda a lista de entradas como um blob e retorna o hash dela: versões iguais de uma política
+    (ou do conjunto de objetos) apontam para o mesmo manifest.
+    """
+    text = json.dumps(entries, separators=(',', ':'))
+    manifest = content_hash(text)
+    blobs[manifest] = text
+    return manifest
+
+def create_snapshot(generation=None, retention=SNAPSHOT_RETENTION, db_file=None, bump=False):
+    """
+    Registra um snapshot do inventário atual (políticas e objetos) e retorna o id dele.
+    Cada regra e cada objeto é guardado uma única vez em blobs, pelo hash do conteúdo; um snapshot
+    só guarda, por política, o manifest [[rule_id, hash, nome], ...]. Políticas não regravadas
+    desde o snapshot anterior reaproveitam o manifest dele sem ler as regras.
+    Com bump, a geração do inventário é incrementada na mesma transação que grava o snapshot (e
+    registrada nele): páginas em cache da nova geração nunca ficam sem o novo snapshot.
+    """
+    connection = get_connection(db_file)
+    with timed(logger, "Snapshot do inventário"):
+        previous = {
+            row['policy']: row for row in connection.execute(
+                "SELECT policy, updated_at, manifest FROM snapshot_policies "
+                "WHERE snapshot_id = (SELECT MAX(snapshot_id) FROM snapshots)")
+        }
+        blobs = {}
+        policy_rows = []
+        total_rules = 0
+        for policy in connection.execute(
+                "SELECT filename, name, policy_id, rule_count, updated_at FROM policies ORDER BY filename").fetchall():
+            total_rules += policy['rule_count']
+            last = previous.get(policy['filename'])
+            if last is not None and last['updated_at'] == policy['updated_at']:
+                manifest = last['manifest']
+            else:
+                entries = []
+                for row in connection.execute(
+                        "SELECT rule_id, name, data FROM rules WHERE policy = ? ORDER BY position", (policy['filename'],)):
+                    text = canonical_content(json.loads(row['data']))
+                    rule_hash = content_hash(text)
+                    blobs[rule_hash] = text
+                    entries.append([row['rule_id'], rule_hash, row['name']])
+                manifest = _add_manifest(entries, blobs)
+            policy_rows.append((policy['filename'], policy['name'], policy['policy_id'], policy['updated_at'], manifest))
+
+        object_entries = []
+        for row in connection.execute("SELECT object_id, name, kind, data FROM objects ORDER BY object_id"):
+            text = canonical_content(json.loads(row['data']))
+            object_hash = content_hash(text)
+            blobs[object_hash] = text
+            object_entries.append([row['object_id'], object_hash, row['name'], row['kind']])
+        objects_manifest = _add_manifest(object_entries, blobs)
+
+        with connection:
+            if bump:
+                generation = increment_generation(connection)
+            connection.executemany("INSERT OR IGNORE INTO blobs (hash, data) VALUES (?, ?)", blobs.items())
+            cursor = connection.execute(
+                "INSERT INTO snapshots (generation, created_at, policies, rules, objects, objects_manifest) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (generation, time.time(), len(policy_rows), total_rules, len(object_entries), objects_manifest),
+            )
+            snapshot_id = cursor.lastrowid
+            connection.executemany(
+                "INSERT INTO snapshot_policies (snapshot_id, policy, name, policy_id, updated_at, manifest) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                ((snapshot_id, *row) for row in policy_rows),
+            )
+    logger.info(f"Snapshot {snapshot_id} (geração {generation}): {len(policy_rows)} políticas, "
+                f"{total_rules} regras, {len(object_entries)} objetos")
+    prune_snapshots(retention, db_file)
+    return snapshot_id
+
+def prune_snapshots(retention=SNAPSHOT_RETENTION, db_file=None):
+    """
+    Apaga os snapshots além dos retention mais recentes e os blobs que nenhum snapshot restante usa.
+    Retorna quantos snapshots foram apagados.
+    """
+    connection = get_connection(db_file)
+    old_ids = [row[0] for row in connection.execute(
+        "SELECT snapshot_id FROM snapshots ORDER BY snapshot_id DESC LIMIT -1 OFFSET ?", (retention,))]
+    if not old_ids:
+        return 0
+    with connection:
+        connection.executemany("DELETE FROM snapshot_policies WHERE snapshot_id = ?", ((i,) for i in old_ids))
+        connection.executemany("DELETE FROM snapshots WHERE snapshot_id = ?", ((i,) for i in old_ids))
+        manifests = {row[0] for row in connection.execute(
+            "SELECT manifest FROM snapshot_policies UNION SELECT objects_manifest FROM snapshots")}
+        referenced = set(manifests)
+        for manifest in manifests:
+            # Lido direto, sem passar pelo cache dos manifests usados nas comparações
+            row = connection.execute("SELECT data FROM blobs WHERE hash = ?", (manifest,)).fetchone()
+            if row:
+                referenced.update(entry[1] for entry in json.loads(row[0]))
+        connection.execute("CREATE TEMP TABLE IF NOT EXISTS referenced_blobs (hash TEXT PRIMARY KEY)")
+        connection.execute("DELETE FROM referenced_blobs")
+        connection.executemany("INSERT INTO referenced_blobs (hash) VALUES (?)", ((h,) for h in referenced))
+        deleted = connection.execute(
+            "DELETE FROM blobs WHERE hash NOT IN (SELECT hash FROM referenced_blobs)").rowcount
+        connection.execute("DELETE FROM referenced_blobs")
+    logger.info(f"{len(old_ids)} snapshot(s) antigo(s) e {deleted} blob(s) sem uso apagados.")
+    return len(old_ids)
+
+def list_snapshots(db_file=None):
+    """
+    Snapshots do alvo atual, do mais recente para o mais antigo.
+    """
+    return [dict(row) for row in get_connection(db_file).execute(
+        "SELECT snapshot_id, generation, created_at, policies, rules, objects FROM snapshots ORDER BY snapshot_id DESC")]
+
+def _load_manifest(connection, manifest):
+    """
+    Entradas de um manifest. Como o hash identifica o conteúdo, o cache não precisa de invalidação
+    e vale para qualquer banco.
+    """
+    with _manifest_lock:
+        entries = _manifest_cache.get(manifest)
+        if entries is not None:
+            _manifest_cache.move_to_end(manifest)
+            return entries
+    row = connection.execute("SELECT data FROM blobs WHERE hash = ?", (manifest,)).fetchone()
+    entries = json.loads(row[0]) if row else []
+    with _manifest_lock:
+        _manifest_cache[manifest] = entries
+        while len(_manifest_cache) > MANIFEST_CACHE_SIZE:
+            _manifest_cache.popitem(last=False)
+    return entries
+
+def _load_blobs(connection, hashes):
+    """
+    {hash: conteúdo decodificado} dos blobs pedidos, lidos em lotes.
+    """
+    hashes = list(set(hashes))
+    result = {}
+    for start in range(0, len(hashes), BLOB_BATCH_SIZE):
+        batch = hashes[start:start + BLOB_BATCH_SIZE]
+        placeholders = ", ".join("?" for _ in batch)
+        for row in connection.execute(f"SELECT hash, data FROM blobs WHERE hash IN ({placeholders})", batch):
+            result[row['hash']] = json.loads(row['data'])
+    return result
+
+def longest_increasing_subsequence(values):
+    """
+    Índices de uma maior subsequência crescente de values, em O(n log n).
+    """
+    tails, tail_indexes = [], []
+    previous = [None] * len(values)
+    for index, value in enumerate(values):
+        position = bisect.bisect_left(tails, value)
+        if position == len(tails):
+            tails.append(value)
+            tail_indexes.append(index)
+        else:
+            tails[position] = value
+            tail_indexes[position] = index
+        previous[index] = tail_indexes[position - 1] if position else None
+    result = []
+    index = tail_indexes[-1] if tail_indexes else None
+    while index is not None:
+        result.append(index)
+        index = previous[index]
+    return result[::-1]
+
+def _members(value):
+    """
+    Conjunto de membros de um campo de referências ({'objects': [...], 'literals': [...]}, lista de
+    objetos ou lista de endereços), ou None se o campo não for uma lista de membros.
+    """
+    if isinstance(value, dict) and ('objects' in value or 'literals' in value):
+        items = (value.get('objects') or []) + (value.get('literals') or [])
+    elif isinstance(value, list):
+        items = value
+    else:
+        return None
+    members = set()
+    for item in items:
+        if isinstance(item, dict):
+            members.add(item.get('name') or item.get('value') or item.get('id') or
+                        json.dumps(item, sort_keys=True, separators=(',', ':')))
+        else:
+            members.add(str(item))
+    return members
+
+def field_changes(old, new):
+    """
+    Campos que mudaram entre duas versões de uma regra ou objeto. Listas de membros (redes, portas,
+    zonas, membros de grupos, IPs de objetos dinâmicos) trazem só os membros adicionados e removidos.
+    """
+    changes = []
+    for field in sorted(old.keys() | new.keys()):
+        old_value, new_value = old.get(field), new.get(field)
+        if old_value == new_value:
+            continue
+        old_members, new_members = _members(old_value), _members(new_value)
+        if old_members is not None or new_members is not None:
+            old_members, new_members = old_members or set(), new_members or set()
+            changes.append({'field': field, 'added': sorted(new_members - old_members),
+                            'removed': sorted(old_members - new_members)})
+        else:
+            changes.append({'field': field, 'old': old_value, 'new': new_value})
+    return changes
+
+def diff_rules(connection, old_entries, new_entries):
+    """
+    Compara dois manifests de uma política. As regras são pareadas pelo id (pelo hash, se não houver id):
+    adicionadas, removidas, modificadas (hash diferente, com os campos alterados) e movidas. Movidas são
+    as regras fora de uma maior subsequência que manteve a ordem relativa, então inserir ou remover uma
+    regra não faz as seguintes aparecerem como movidas.
+    """
+    old_by_key = {(entry[0] or entry[1]): (position, entry) for position, entry in enumerate(old_entries, start=1)}
+    new_by_key = {(entry[0] or entry[1]): (position, entry) for position, entry in enumerate(new_entries, start=1)}
+    added = [{'position': position, 'id': entry[0], 'name': entry[2]}
+             for key, (position, entry) in new_by_key.items() if key not in old_by_key]
+    removed = [{'position': position, 'id': entry[0], 'name': entry[2]}
+               for key, (position, entry) in old_by_key.items() if key not in new_by_key]
+
+    common = [key for key in new_by_key if key in old_by_key]  # Na ordem da versão nova
+    kept = set(longest_increasing_subsequence([old_by_key[key][0] for key in common]))
+    moved, modified_pairs = [], []
+    for index, key in enumerate(common):
+        old_position, old_entry = old_by_key[key]
+        new_position, new_entry = new_by_key[key]
+        if index not in kept:
+            moved.append({'position': new_position, 'old_position': old_position, 'id': new_entry[0], 'name': new_entry[2]})
+        if old_entry[1] != new_entry[1]:
+            modified_pairs.append((old_position, old_entry, new_position, new_entry))
+
+    # Só as regras modificadas têm o conteúdo lido
+    contents = _load_blobs(connection, [h for _, old_entry, _, new_entry in modified_pairs
+                                        for h in (old_entry[1], new_entry[1])])
+    modified = [
+        {'position': new_position, 'old_position': old_position, 'id': new_entry[0], 'name': new_entry[2],
+         'changes': field_changes(contents.get(old_entry[1], {}), contents.get(new_entry[1], {}))}
+        for old_position, old_entry, new_position, new_entry in modified_pairs
+    ]
+    return {'added': added, 'removed': removed, 'modified': modified, 'moved': moved}
+
+def diff_objects(connection, old_manifest, new_manifest):
+    """
+    Objetos adicionados, removidos e modificados entre dois snapshots; nos modificados, os campos
+    alterados, incluindo os membros de grupos e os IPs de objetos dinâmicos que entraram ou saíram.
+    """
+    if old_manifest == new_manifest:
+        return {'added': [], 'removed': [], 'modified': []}
+    old = {entry[0]: entry for entry in _load_manifest(connection, old_manifest)}
+    new = {entry[0]: entry for entry in _load_manifest(connection, new_manifest)}
+    added = [{'id': entry[0], 'name': entry[2], 'kind': entry[3]} for key, entry in new.items() if key not in old]
+    removed = [{'id': entry[0], 'name': entry[2], 'kind': entry[3]} for key, entry in old.items() if key not in new]
+    pairs = [(old[key], entry) for key, entry in new.items() if key in old and old[key][1] != entry[1]]
+    contents = _load_blobs(connection, [h for old_entry, new_entry in pairs for h in (old_entry[1], new_entry[1])])
+    modified = []
+    for old_entry, new_entry in pairs:
+        changes = field_changes(contents.get(old_entry[1], {}), contents.get(new_entry[1], {}))
+        modified.append({'id': new_entry[0], 'name': new_entry[2], 'kind': new_entry[3], 'changes': changes,
+                         'membership': any('added' in change for change in changes)})
+    return {'added': added, 'removed': removed, 'modified': modified}
+
+def get_snapshot(snapshot_id, db_file=None):
+    row = get_connection(db_file).execute(
+        "SELECT snapshot_id, generation, created_at, policies, rules, objects, objects_manifest FROM snapshots "
+        "WHERE snapshot_id = ?", (snapshot_id,)).fetchone()
+    return dict(row) if row else None
+
+def diff_snapshots(old_id, new_id, policy=None, db_file=None):
+    """
+    Diferenças entre dois snapshots: por política (adicionada, removida ou alterada, com as regras
+    adicionadas, removidas, modificadas e movidas) e nos objetos. Com policy, só essa política
+    (e sem os objetos). Políticas são pareadas pelo id do FMC, então uma política renomeada
+    aparece como alterada. Levanta ValueError se algum snapshot não existir.
+    """
+    connection = get_connection(db_file)
+    old, new = get_snapshot(old_id, db_file), get_snapshot(new_id, db_file)
+    if old is None or new is None:
+        raise ValueError(f"Snapshot não encontrado: {old_id if old is None else new_id}")
+
+    def policies_of(snapshot_id):
+        rows = connection.execute(
+            "SELECT policy, name, policy_id, manifest FROM snapshot_policies WHERE snapshot_id = ?", (snapshot_id,))
+        return {(row['policy_id'] or row['policy']): dict(row) for row in rows}
+
+    old_policies, new_policies = policies_of(old_id), policies_of(new_id)
+    policies = []
+    for key in sorted(old_policies.keys() | new_policies.keys(),
+                      key=lambda key: (new_policies.get(key) or old_policies.get(key))['policy']):
+        old_policy, new_policy = old_policies.get(key), new_policies.get(key)
+        current = new_policy or old_policy
+        if policy and policy not in (current['policy'], (old_policy or {}).get('policy')):
+            continue
+        if old_policy and new_policy and old_policy['manifest'] == new_policy['manifest'] \
+                and old_policy['policy'] == new_policy['policy']:
+            continue
+        entry = {
+            'policy': current['policy'],
+            'name': current['name'],
+            'status': 'changed' if old_policy and new_policy else ('added' if new_policy else 'removed'),
+            'old_policy': old_policy['policy'] if old_policy and new_policy and old_policy['policy'] != new_policy['policy'] else None,
+        }
+        entry.update(diff_rules(
+            connection,
+            _load_manifest(connection, old_policy['manifest']) if old_policy else [],
+            _load_manifest(connection, new_policy['manifest']) if new_policy else [],
+        ))
+        policies.append(entry)
+
+    objects = {'added': [], 'removed': [], 'modified': []}
+    if not policy:
+        objects = diff_objects(connection, old['objects_manifest'], new['objects_manifest'])
+    summary = {
+        'policies_added': sum(entry['status'] == 'added' for entry in policies),
+        'policies_removed': sum(entry['status'] == 'removed' for entry in policies),
+        'policies_changed': sum(entry['status'] == 'changed' for entry in policies),
+    }
+    for change in ('added', 'removed', 'modified', 'moved'):
+        summary[f'rules_{change}'] = sum(len(entry[change]) for entry in policies)
+    for change in ('added', 'removed', 'modified'):
+        summary[f'objects_{change}'] = len(objects[change])
+    summary['membership_changes'] = sum(obj['membership'] for obj in objects['modified'])
+    for snapshot in (old, new):
+        del snapshot['objects_manifest']
+    return {'old': old, 'new': new, 'summary': summary, 'policies': policies, 'objects': objects}
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Snapshots do inventário e diferenças entre sincronizações.")
+    parser.add_argument("--target", default=FP_Targets.DEFAULT_TARGET, help="Chave do FMC/domínio (ver FP_Targets.py)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("list", help="Lista os snapshots")
+    subparsers.add_parser("create", help="Registra um snapshot do inventário atual")
+    diff_parser = subparsers.add_parser("diff", help="Diferenças entre dois snapshots")
+    diff_parser.add_argument("old", type=int)
+    diff_parser.add_argument("new", type=int)
+    diff_parser.add_argument("--policy", help="Só esta política (nome do arquivo)")
+    args = parser.parse_args()
+    if args.target != FP_Targets.DEFAULT_TARGET:
+        target = FP_Targets.get_target(args.target)
+        if target is None:
+            parser.error(f"Alvo não encontrado: {args.target}")
+        FP_Targets.bind_target(target)
+
+    if args.command == "list":
+        for snapshot in list_snapshots():
+            created_at = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(snapshot['created_at']))
+            print(f"{snapshot['snapshot_id']:6} {created_at} geração {snapshot['generation']}: "
+                  f"{snapshot['policies']} políticas, {snapshot['rules']} regras, {snapshot['objects']} objetos")
+    elif args.command == "create":
+        print(create_snapshot())
+    else:
+        print(json.dumps(diff_snapshots(args.old, args.new, args.policy), indent=2, ensure_ascii=False))
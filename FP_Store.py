@@ -0,0 +1,602 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import FP_Targets
+from FP_JsonStream import iter_json_array
+from FP_Log import get_logger
+
+logger = get_logger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS policies (
+    filename TEXT PRIMARY KEY,
+    name TEXT,
+    policy_id TEXT,
+    rule_count INTEGER NOT NULL DEFAULT 0,
+    updated_at REAL
+);
+CREATE TABLE IF NOT EXISTS rules (
+    policy TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    rule_id TEXT,
+    name TEXT,
+    action TEXT,
+    enabled INTEGER,
+    data TEXT NOT NULL,
+    PRIMARY KEY (policy, position)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS rules_by_id ON rules(rule_id);
+CREATE INDEX IF NOT EXISTS rules_by_name ON rules(policy, name);
+CREATE TABLE IF NOT EXISTS rule_refs (
+    policy TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    field TEXT NOT NULL,
+    object_id TEXT,
+    object_name TEXT,
+    object_type TEXT
+);
+CREATE INDEX IF NOT EXISTS rule_refs_by_object ON rule_refs(object_id);
+CREATE INDEX IF NOT EXISTS rule_refs_by_name ON rule_refs(object_name, field);
+CREATE INDEX IF NOT EXISTS rule_refs_by_rule ON rule_refs(policy, position);
+CREATE TABLE IF NOT EXISTS objects (
+    object_id TEXT PRIMARY KEY,
+    name TEXT,
+    type TEXT,
+    kind TEXT NOT NULL,
+    value TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS objects_by_name ON objects(name);
+CREATE INDEX IF NOT EXISTS objects_by_kind ON objects(kind, type);
+CREATE TABLE IF NOT EXISTS group_members (
+    group_id TEXT NOT NULL,
+    member_id TEXT NOT NULL,
+    PRIMARY KEY (group_id, member_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS group_members_by_member ON group_members(member_id);
+CREATE TABLE IF NOT EXISTS dynamic_mappings (
+    object_id TEXT NOT NULL,
+    address TEXT NOT NULL,
+    PRIMARY KEY (object_id, address)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS dynamic_mappings_by_address ON dynamic_mappings(address);
+CREATE TABLE IF NOT EXISTS object_usage (
+    object_id TEXT NOT NULL,
+    policy TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    field TEXT NOT NULL,
+    via_id TEXT NOT NULL,
+    via_name TEXT,
+    PRIMARY KEY (object_id, policy, position, field, via_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS object_usage_counts (
+    object_id TEXT PRIMARY KEY,
+    rules INTEGER NOT NULL,
+    policies INTEGER NOT NULL,
+    direct_rules INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS blobs (
+    hash TEXT PRIMARY KEY,
+    data TEXT NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS snapshots (
+    snapshot_id INTEGER PRIMARY KEY,
+    generation INTEGER,
+    created_at REAL NOT NULL,
+    policies INTEGER NOT NULL,
+    rules INTEGER NOT NULL,
+    objects INTEGER NOT NULL,
+    objects_manifest TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS snapshot_policies (
+    snapshot_id INTEGER NOT NULL,
+    policy TEXT NOT NULL,
+    name TEXT,
+    policy_id TEXT,
+    updated_at REAL,
+    manifest TEXT NOT NULL,
+    PRIMARY KEY (snapshot_id, policy)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS hit_counts (
+    policy_id TEXT NOT NULL,
+    rule_id TEXT NOT NULL,
+    device_id TEXT NOT NULL,
+    device_name TEXT,
+    hit_count INTEGER NOT NULL,
+    first_hit TEXT,
+    last_hit TEXT,
+    collected_at REAL NOT NULL,
+    changed_at REAL NOT NULL,
+    samples BLOB NOT NULL,
+    PRIMARY KEY (policy_id, device_id, rule_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS hit_counts_by_rule ON hit_counts(rule_id);
+CREATE TABLE IF NOT EXISTS hit_count_collections (
+    collection_id INTEGER PRIMARY KEY,
+    collected_at REAL NOT NULL,
+    policies INTEGER NOT NULL,
+    devices INTEGER NOT NULL,
+    rules INTEGER NOT NULL,
+    errors INTEGER NOT NULL
+);
+"""
+# Versão do schema (PRAGMA user_version); a 2 introduziu as referências das regras aos objetos
+SCHEMA_VERSION = 2
+
+# Campos das regras cujos objetos referenciados entram em rule_refs
+REFERENCE_FIELDS = [
+    'sourceZones', 'destinationZones', 'sourceInterfaces', 'destinationInterfaces', 'sourceNetworks',
+    'destinationNetworks', 'sourcePorts', 'destinationPorts',
+]
+
+_local = threading.local()
+
+def get_connection(db_file=None):
+    """
+    Conexão SQLite da thread atual (uma por thread e por arquivo), com o schema já criado.
+    Sem db_file, usa o banco do alvo atual (FP_Targets): data/inventory.db para o alvo padrão.
+    """
+    db_file = db_file or FP_Targets.db_file()
+    connections = getattr(_local, 'connections', None)
+    if connections is None:
+        connections = _local.connections = {}
+    connection = connections.get(db_file)
+    if connection is None:
+        os.makedirs(os.path.dirname(db_file), exist_ok=True)
+        connection = sqlite3.connect(db_file, timeout=30)
+        connection.row_factory = sqlite3.Row
+        # WAL permite que o app leia enquanto a sincronização grava
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.executescript(SCHEMA)
+        _migrate(connection)
+        connections[db_file] = connection
+    return connection
+
+def _migrate(connection):
+    """
+    Atualiza bancos criados por versões anteriores: preenche rule_refs a partir das regras já gravadas.
+    """
+    version = connection.execute("PRAGMA user_version").fetchone()[0]
+    if version >= SCHEMA_VERSION:
+        return
+    with connection:
+        connection.execute("DELETE FROM rule_refs")
+        rows = connection.execute("SELECT policy, position, data FROM rules").fetchall()
+        connection.executemany(
+            "INSERT INTO rule_refs (policy, position, field, object_id, object_name, object_type) VALUES (?, ?, ?, ?, ?, ?)",
+            (ref for policy, position, data in rows for ref in rule_references(policy, position, json.loads(data))),
+        )
+        connection.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+def rule_references(policy, position, rule):
+    """
+    Linhas de rule_refs de uma regra: um objeto referenciado por campo (zonas, interfaces, redes e portas).
+    """
+    for field in REFERENCE_FIELDS:
+        value = rule.get(field)
+        # Em algumas versões do FMC sourceInterfaces/destinationInterfaces vêm como lista de objetos
+        objects = value if isinstance(value, list) else (value or {}).get('objects') or []
+        for item in objects:
+            if isinstance(item, dict) and (item.get('id') or item.get('name')):
+                yield policy, position, field, item.get('id'), item.get('name'), item.get('type')
+
+def compact_json(data):
+    return json.dumps(data, separators=(',', ':'))
+
+def save_policy_rules(filename, rules, name=None, policy_id=None, db_file=None):
+    """
+    Grava (substitui) as regras de uma política, na ordem, numa única transação.
+    Cada regra é guardada como JSON compacto, com as colunas mais consultadas à parte.
+    rules pode ser qualquer iterável (ex.: FP_JsonStream.iter_json_array): é percorrido uma única vez.
+    """
+    connection = get_connection(db_file)
+    count = 0
+    with connection:
+        connection.execute("DELETE FROM rules WHERE policy = ?", (filename,))
+        connection.execute("DELETE FROM rule_refs WHERE policy = ?", (filename,))
+        for position, rule in enumerate(rules, start=1):
+            connection.execute(
+                "INSERT INTO rules (policy, position, rule_id, name, action, enabled, data) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (filename, position, rule.get('id'), rule.get('name'), rule.get('action'),
+                 int(bool(rule.get('enabled', True))), compact_json(rule)),
+            )
+            connection.executemany(
+                "INSERT INTO rule_refs (policy, position, field, object_id, object_name, object_type) VALUES (?, ?, ?, ?, ?, ?)",
+                rule_references(filename, position, rule),
+            )
+            count = position
+        connection.execute(
+            "INSERT INTO policies (filename, name, policy_id, rule_count, updated_at) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT(filename) DO UPDATE SET name = COALESCE(excluded.name, policies.name), "
+            "policy_id = COALESCE(excluded.policy_id, policies.policy_id), "
+            "rule_count = excluded.rule_count, updated_at = excluded.updated_at",
+            (filename, name, policy_id, count, time.time()),
+        )
+        _mark_usage_stale(connection)
+    return count
+
+def delete_policy(filename, db_file=None):
+    connection = get_connection(db_file)
+    with connection:
+        connection.execute("DELETE FROM rules WHERE policy = ?", (filename,))
+        connection.execute("DELETE FROM rule_refs WHERE policy = ?", (filename,))
+        connection.execute("DELETE FROM policies WHERE filename = ?", (filename,))
+        _mark_usage_stale(connection)
+
+def has_policy(filename, db_file=None):
+    row = get_connection(db_file).execute("SELECT 1 FROM policies WHERE filename = ?", (filename,)).fetchone()
+    return row is not None
+
+def _projection(fields):
+    """
+    Expressão SELECT (e seus parâmetros) que extrai só os campos pedidos do JSON de cada regra.
+    """
+    if not fields:
+        return "data", []
+    # Com vários caminhos, json_extract decodifica o JSON uma vez e retorna uma lista com os valores
+    paths = ", ".join("?" for _ in fields)
+    select = f"json_extract(data, {paths})" if len(fields) > 1 else "json_array(json_extract(data, ?))"
+    return select, [f'$.{field}' for field in fields]
+
+def load_rules(filename, fields=None, offset=0, limit=None, db_file=None):
+    """
+    Lê as regras de uma política na ordem. Com fields, só esses campos de cada regra são
+    extraídos (pelo próprio SQLite), sem decodificar o restante do JSON.
+    Retorna None se a política não estiver no banco.
+    """
+    connection = get_connection(db_file)
+    if not has_policy(filename, db_file):
+        return None
+    select, params = _projection(fields)
+    query = f"SELECT {select} FROM rules WHERE policy = ? ORDER BY position LIMIT ? OFFSET ?"
+    params += [filename, -1 if limit is None else limit, offset]
+    rules = []
+    for (data,) in connection.execute(query, params):
+        if fields:
+            rules.append({field: value for field, value in zip(fields, json.loads(data)) if value is not None})
+        else:
+            rules.append(json.loads(data))
+    return rules
+
+# Colunas pelas quais query_rules pode ordenar
+SORT_COLUMNS = {'position': 'position', 'name': 'name COLLATE NOCASE', 'action': 'action', 'enabled': 'enabled'}
+
+def query_rules(filename, fields=None, action=None, enabled=None, zone=None, name=None, positions=None,
+                sort='position', descending=False, offset=0, limit=None, db_file=None):
+    """
+    Uma página das regras de uma política, filtrada e ordenada pelo próprio SQLite.
+    Filtros: action, enabled (bool), zone (nome ou id, de origem ou destino), name (trecho do nome,
+    sem diferenciar maiúsculas) e positions (posições permitidas, ex.: as que casaram numa busca por IP).
+    Retorna (total de regras que passam nos filtros, regras da página); cada regra traz sua 'position'.
+    """
+    if sort not in SORT_COLUMNS:
+        raise ValueError(f"Ordenação inválida: {sort}")
+    conditions, params = ["policy = ?"], [filename]
+    if action:
+        conditions.append("action = ?")
+        params.append(action.upper())
+    if enabled is not None:
+        conditions.append("enabled = ?")
+        params.append(int(bool(enabled)))
+    if name:
+        conditions.append("instr(lower(name), lower(?)) > 0")
+        params.append(name)
+    if zone:
+        conditions.append(
+            "position IN (SELECT position FROM rule_refs WHERE policy = ? "
+            "AND field IN ('sourceZones', 'destinationZones') AND (object_name = ? OR object_id = ?))")
+        params += [filename, zone, zone]
+    if positions is not None:
+        conditions.append("position IN (SELECT value FROM json_each(?))")
+        params.append(json.dumps(sorted(positions)))
+    where = " AND ".join(conditions)
+
+    connection = get_connection(db_file)
+    total = connection.execute(f"SELECT COUNT(*) FROM rules WHERE {where}", params).fetchone()[0]
+    select, select_params = _projection(fields)
+    order = f"{SORT_COLUMNS[sort]} {'DESC' if descending else 'ASC'}, position"
+    query = f"SELECT position, {select} FROM rules WHERE {where} ORDER BY {order} LIMIT ? OFFSET ?"
+    rules = []
+    for position, data in connection.execute(query, select_params + params + [-1 if limit is None else limit, offset]):
+        values = json.loads(data)
+        if fields:
+            rule = {field: value for field, value in zip(fields, values) if value is not None}
+        else:
+            rule = values
+        rule['position'] = position
+        rules.append(rule)
+    return total, rules
+
+def load_policy_rules(filename, fields=None, rules_directory=None, db_file=None):
+    """
+    Lê as regras de uma política do banco. Se ela ainda não estiver lá (dados sincronizados antes
+    do banco existir), importa o JSON exportado em data/acp_rules e então lê do banco.
+    Retorna [] se a política não existir em nenhum dos dois.
+    """
+    rules = load_rules(filename, fields, db_file=db_file)
+    if rules is not None:
+        return rules
+    file_path = os.path.join(rules_directory or FP_Targets.rules_directory(), filename)
+    try:
+        with open(file_path, 'r') as f:
+            save_policy_rules(filename, iter_json_array(f), db_file=db_file)
+    except FileNotFoundError:
+        logger.warning(f"Arquivo não encontrado: {file_path}")
+        return []
+    except ValueError:
+        logger.error(f"Erro ao decodificar JSON de: {file_path}")
+        return []
+    logger.info(f"Política {filename} importada do JSON para o banco.")
+    return load_rules(filename, fields, db_file=db_file) or []
+
+def _mark_usage_stale(connection):
+    connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('object_usage', 'stale')")
+
+def build_object_usage(db_file=None):
+    """
+    Monta o índice reverso objeto -> regras (object_usage), já expandindo os grupos: um objeto é usado
+    por toda regra que o referencia diretamente ou que referencia algum grupo (em qualquer nível) que o contém.
+    Também grava os totais por objeto (object_usage_counts). Chamado uma vez ao fim de cada sincronização.
+    """
+    connection = get_connection(db_file)
+    start = time.perf_counter()
+    with connection:
+        connection.execute("DELETE FROM object_usage")
+        connection.execute("DELETE FROM object_usage_counts")
+        # containers: (objeto, grupo que o contém direta ou indiretamente, incluindo o próprio objeto).
+        # UNION descarta pares repetidos, então ciclos entre grupos não fazem a recursão girar para sempre.
+        connection.execute("""
+            INSERT INTO object_usage (object_id, policy, position, field, via_id, via_name)
+            WITH RECURSIVE containers(object_id, container_id) AS (
+                SELECT object_id, object_id FROM objects
+                UNION
+                SELECT containers.object_id, group_members.group_id
+                FROM containers JOIN group_members ON group_members.member_id = containers.container_id
+            )
+            SELECT DISTINCT containers.object_id, rule_refs.policy, rule_refs.position, rule_refs.field,
+                   rule_refs.object_id, rule_refs.object_name
+            FROM containers JOIN rule_refs ON rule_refs.object_id = containers.container_id
+        """)
+        connection.execute("""
+            INSERT INTO object_usage_counts (object_id, rules, policies, direct_rules)
+            SELECT object_id, COUNT(*), COUNT(DISTINCT policy), SUM(direct)
+            FROM (
+                SELECT object_id, policy, position, MAX(via_id = object_id) AS direct
+                FROM object_usage GROUP BY object_id, policy, position
+            )
+            GROUP BY object_id
+        """)
+        connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('object_usage', 'fresh')")
+    rows = connection.execute("SELECT COUNT(*) FROM object_usage").fetchone()[0]
+    logger.info(f"Índice de uso de objetos: {rows} referências em {time.perf_counter() - start:.3f}s")
+
+def ensure_object_usage(db_file=None):
+    """
+    Reconstrói o índice de uso de objetos se o inventário mudou desde a última construção.
+    """
+    row = get_connection(db_file).execute("SELECT value FROM meta WHERE key = 'object_usage'").fetchone()
+    if row is None or row[0] != 'fresh':
+        build_object_usage(db_file)
+
+def get_generation(db_file=None):
+    """
+    Geração do inventário: (número, horário em que mudou). Incrementada a cada sincronização,
+    identifica a versão dos dados exibidos (usada nos ETags das páginas). (0, None) antes da primeira.
+    """
+    rows = dict(get_connection(db_file).execute(
+        "SELECT key, value FROM meta WHERE key IN ('generation', 'generation_at')").fetchall())
+    if 'generation' not in rows:
+        return 0, None
+    return int(rows['generation']), float(rows['generation_at'])
+
+def bump_generation(db_file=None):
+    connection = get_connection(db_file)
+    with connection:
+        generation = increment_generation(connection)
+    logger.info(f"Inventário na geração {generation}")
+    return generation
+
+def increment_generation(connection):
+    """
+    Incrementa a geração dentro da transação em andamento em connection (o commit fica com quem chamou),
+    para que ela mude junto com o que foi gravado na mesma transação. Retorna a nova geração.
+    """
+    row = connection.execute("SELECT value FROM meta WHERE key = 'generation'").fetchone()
+    generation = int(row[0]) + 1 if row else 1
+    connection.executemany(
+        "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+        [('generation', str(generation)), ('generation_at', repr(time.time()))],
+    )
+    return generation
+
+def list_policies(rules_directory=None, db_file=None):
+    """
+    Políticas no banco (filename, name, rule_count), em ordem de nome de arquivo.
+    Políticas que só existem como JSON em data/acp_rules são importadas antes.
+    """
+    connection = get_connection(db_file)
+    rules_directory = rules_directory or FP_Targets.rules_directory()
+    try:
+        exported = {filename for filename in os.listdir(rules_directory) if filename.endswith('.json')}
+    except FileNotFoundError:
+        exported = set()
+    stored = {row[0] for row in connection.execute("SELECT filename FROM policies")}
+    for filename in sorted(exported - stored):
+        load_policy_rules(filename, ['name'], rules_directory, db_file)
+    return [dict(row) for row in connection.execute(
+        "SELECT filename, name, rule_count FROM policies ORDER BY filename")]
+
+def save_objects(static_objects=None, dynamic_objects=None, db_file=None):
+    """
+    Substitui os objetos estáticos e/ou dinâmicos do banco, com a composição dos grupos e os
+    mappings dos objetos dinâmicos. Uma lista None mantém o que já estava gravado para aquele tipo.
+    As listas podem ser quaisquer iteráveis (ex.: FP_JsonStream.iter_json_array): cada uma é percorrida uma única vez.
+    """
+    connection = get_connection(db_file)
+    with connection:
+        for kind, items in (('static', static_objects), ('dynamic', dynamic_objects)):
+            if items is None:
+                continue
+            connection.execute(
+                "DELETE FROM group_members WHERE group_id IN (SELECT object_id FROM objects WHERE kind = ?)", (kind,))
+            connection.execute(
+                "DELETE FROM dynamic_mappings WHERE object_id IN (SELECT object_id FROM objects WHERE kind = ?)", (kind,))
+            connection.execute("DELETE FROM objects WHERE kind = ?", (kind,))
+            for item in items:
+                if not item.get('id'):
+                    continue
+                connection.execute(
+                    "INSERT OR REPLACE INTO objects (object_id, name, type, kind, value, data) VALUES (?, ?, ?, ?, ?, ?)",
+                    (item['id'], item.get('name'), item.get('type'), kind, item.get('value'), compact_json(item)),
+                )
+                connection.executemany(
+                    "INSERT OR IGNORE INTO group_members (group_id, member_id) VALUES (?, ?)",
+                    ((item['id'], member['id']) for member in item.get('objects') or [] if member.get('id')),
+                )
+                if kind == 'dynamic':
+                    connection.executemany(
+                        "INSERT OR IGNORE INTO dynamic_mappings (object_id, address) VALUES (?, ?)",
+                        ((item['id'], address) for address in item.get('content') or [] if address),
+                    )
+        _mark_usage_stale(connection)
+
+def update_dynamic_mappings(changes, db_file=None):
+    """
+    Aplica no banco alterações de mappings já feitas no FMC ({object_id: {'add': [...], 'remove': [...]}}),
+    para que as páginas reflitam a mudança antes da próxima sincronização.
+    """
+    connection = get_connection(db_file)
+    with connection:
+        for object_id, object_changes in changes.items():
+            connection.executemany(
+                "DELETE FROM dynamic_mappings WHERE object_id = ? AND address = ?",
+                ((object_id, address) for address in object_changes.get('remove') or []),
+            )
+            connection.executemany(
+                "INSERT OR IGNORE INTO dynamic_mappings (object_id, address) VALUES (?, ?)",
+                ((object_id, address) for address in object_changes.get('add') or []),
+            )
+
+def has_objects(kind, db_file=None):
+    row = get_connection(db_file).execute("SELECT 1 FROM objects WHERE kind = ? LIMIT 1", (kind,)).fetchone()
+    return row is not None
+
+def list_dynamic_objects(db_file=None):
+    """
+    Objetos dinâmicos com seus IPs mapeados: [{'id', 'name', 'ips'}], em ordem de nome.
+    """
+    connection = get_connection(db_file)
+    objects = {}
+    for row in connection.execute("SELECT object_id, name FROM objects WHERE kind = 'dynamic' ORDER BY name"):
+        objects[row['object_id']] = {'name': row['name'], 'ips': [], 'id': row['object_id']}
+    for row in connection.execute("SELECT object_id, address FROM dynamic_mappings ORDER BY object_id, address"):
+        if row['object_id'] in objects:
+            objects[row['object_id']]['ips'].append(row['address'])
+    return list(objects.values())
+
+def find_objects(name_or_id, db_file=None):
+    """
+    Objetos (estáticos ou dinâmicos) com esse id ou nome.
+    """
+    return [dict(row) for row in get_connection(db_file).execute(
+        "SELECT object_id, name, type, kind FROM objects WHERE object_id = ? OR name = ?", (name_or_id, name_or_id))]
+
+def where_used(object_id, db_file=None):
+    """
+    Regras que usam o objeto, diretamente ou por meio de grupos (em qualquer nível) que o contêm.
+    Cada resultado traz a política, a posição, o nome da regra, o campo e o objeto referenciado na regra (via).
+    """
+    ensure_object_usage(db_file)
+    query = """
+        SELECT object_usage.policy, object_usage.position, rules.name AS rule, rules.action, object_usage.field,
+               object_usage.via_id, object_usage.via_name AS via
+        FROM object_usage
+        JOIN rules ON rules.policy = object_usage.policy AND rules.position = object_usage.position
+        WHERE object_usage.object_id = ?
+        ORDER BY object_usage.policy, object_usage.position, object_usage.field
+    """
+    return [dict(row) for row in get_connection(db_file).execute(query, (object_id,))]
+
+def usage_counts(kind=None, db_file=None):
+    """
+    Totais de uso por objeto: {id: {'rules', 'policies', 'direct_rules'}}. Objetos sem uso ficam de fora.
+    """
+    ensure_object_usage(db_file)
+    query = """
+        SELECT object_usage_counts.* FROM object_usage_counts
+        JOIN objects ON objects.object_id = object_usage_counts.object_id
+        WHERE ? IS NULL OR objects.kind = ?
+    """
+    return {
+        row['object_id']: {'rules': row['rules'], 'policies': row['policies'], 'direct_rules': row['direct_rules']}
+        for row in get_connection(db_file).execute(query, (kind, kind))
+    }
+
+def rules_by_zone(zone, direction=None, db_file=None):
+    """
+    Regras que têm a zona (nome ou id) como zona de origem e/ou destino.
+    direction: 'source', 'destination' ou None para as duas.
+    """
+    fields = {'source': ['sourceZones'], 'destination': ['destinationZones']}.get(direction, ['sourceZones', 'destinationZones'])
+    placeholders = ", ".join("?" for _ in fields)
+    query = f"""
+        SELECT DISTINCT rule_refs.policy, rule_refs.position, rules.name AS rule, rules.action, rule_refs.field
+        FROM rule_refs
+        JOIN rules ON rules.policy = rule_refs.policy AND rules.position = rule_refs.position
+        WHERE rule_refs.field IN ({placeholders}) AND (rule_refs.object_name = ? OR rule_refs.object_id = ?)
+        ORDER BY rule_refs.policy, rule_refs.position
+    """
+    return [dict(row) for row in get_connection(db_file).execute(query, fields + [zone, zone])]
+
+def unused_objects(kind=None, db_file=None):
+    """
+    Objetos que nenhuma regra usa, nem diretamente nem por meio de um grupo usado.
+    """
+    ensure_object_usage(db_file)
+    query = """
+        SELECT object_id, name, type, kind, value FROM objects
+        WHERE object_id NOT IN (SELECT object_id FROM object_usage_counts) AND (? IS NULL OR kind = ?)
+        ORDER BY kind, type, name
+    """
+    return [dict(row) for row in get_connection(db_file).execute(query, (kind, kind))]
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Consultas ao inventário local (data/inventory.db).")
+    parser.add_argument("--target", default=FP_Targets.DEFAULT_TARGET, help="Chave do FMC/domínio (ver FP_Targets.py)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    where_used_parser = subparsers.add_parser("where-used", help="Regras que usam um objeto (id ou nome)")
+    where_used_parser.add_argument("object")
+    zone_parser = subparsers.add_parser("rules-by-zone", help="Regras que usam uma zona")
+    zone_parser.add_argument("zone")
+    zone_parser.add_argument("--direction", choices=["source", "destination"])
+    unused_parser = subparsers.add_parser("unused", help="Objetos sem uso")
+    unused_parser.add_argument("--kind", choices=["static", "dynamic"])
+    args = parser.parse_args()
+    if args.target != FP_Targets.DEFAULT_TARGET:
+        target = FP_Targets.get_target(args.target)
+        if target is None:
+            parser.error(f"Alvo não encontrado: {args.target}")
+        FP_Targets.bind_target(target)
+
+    if args.command == "where-used":
+        for found in find_objects(args.object) or [{'object_id': args.object, 'name': args.object}]:
+            results = where_used(found['object_id'])
+            print(f"{found['name']} ({found['object_id']}): {len(results)} referência(s)")
+            for result in results:
+                via = f" via {result['via']}" if result['via_id'] != found['object_id'] else ""
+                print(f"  {result['policy']} #{result['position']} {result['rule']} [{result['field']}]{via}")
+    elif args.command == "rules-by-zone":
+        for result in rules_by_zone(args.zone, args.direction):
+            print(f"{result['policy']} #{result['position']} {result['rule']} [{result['field']}]")
+    else:
+        for result in unused_objects(args.kind):
+            print(f"{result['kind']:8} {result['type'] or '':20} {result['name']} ({result['object_id']})")
@@ -0,0 +1,477 @@
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import config
+import FP_ACP
+import FP_AsyncCollector
+import FP_DynamicObject
+import FP_HitCount
+import FP_Snapshot
+import FP_StaticObject
+import FP_Store
+import FP_Targets
+from FP_Client import get_client
+from FP_Log import get_logger, bind_request, submit_with_context, timed
+
+logger = get_logger(__name__)
+
+# Threads usadas na sincronização (o FMC aceita até 10 conexões simultâneas).
+# Pode ser ajustado com sync_max_workers no config.py.
+SYNC_MAX_WORKERS = 8
+# Quantidade de jobs concluídos mantidos em memória para consulta
+MAX_FINISHED_JOBS = 20
+# Mesmo no modo incremental, faz uma sincronização completa a cada 24 horas.
+# Pode ser ajustado com full_sync_interval (em segundos) no config.py.
+FULL_SYNC_INTERVAL = 24 * 60 * 60
+
+# Busca os objetos estáticos e os mappings dos objetos dinâmicos com o coletor assíncrono
+# (FP_AsyncCollector). Pode ser desligado com async_collector = False no config.py.
+ASYNC_COLLECTOR = True
+
+# Coleta também os hits das regras (FP_HitCount) em cada sincronização. Desligado por padrão porque
+# faz uma chamada por política e dispositivo; pode ser ligado com sync_hit_counts = True no config.py.
+SYNC_HIT_COUNTS = False
+
+# FMCs/domínios sincronizados ao mesmo tempo, cada um com seu pool de threads.
+# Pode ser ajustado com sync_max_targets no config.py.
+SYNC_MAX_TARGETS = 4
+
+class SyncEngine:
+    """
+    Sincroniza políticas, objetos dinâmicos e objetos estáticos dentro do próprio processo.
+    Os três coletores rodam ao mesmo tempo em um pool de threads limitado, assim como as
+    regras de cada política e os mappings de cada objeto dinâmico. Todas as chamadas passam
+    pelo cliente compartilhado (FP_Client), que respeita o orçamento de requisições do FMC.
+    Com o coletor assíncrono, os objetos estáticos e os mappings são buscados por FP_AsyncCollector,
+    que usa o mesmo orçamento e o mesmo limite de conexões do cliente.
+    Com target, sincroniza esse FMC/domínio (FP_Targets) e grava os dados na pasta dele.
+    """
+
+    def __init__(self, max_workers=None, incremental=False, target=None):
+        self.target = target
+        self.max_workers = max_workers or (target or {}).get('max_workers') or \
+            getattr(config, 'sync_max_workers', SYNC_MAX_WORKERS)
+        self.incremental = incremental
+        self.async_collector = getattr(config, 'async_collector', ASYNC_COLLECTOR)
+        self.hit_counts = getattr(config, 'sync_hit_counts', SYNC_HIT_COUNTS)
+        self.summary = {
+            'mode': 'incremental' if incremental else 'full',
+            'policies': 0,
+            'policies_unchanged': 0,
+            'policies_deleted': 0,
+            'rules': 0,
+            'dynamic_objects': 0,
+            'static_objects': 0,
+            'hit_counts': 0,
+            'generation': None,
+            'snapshot': None,
+            'errors': [],
+        }
+        # Atualizado durante a execução e lido pelo job em segundo plano
+        self.progress = {
+            'policies_total': 0,
+            'policies_done': 0,
+            'rules_fetched': 0,
+            'objects_resolved': 0,
+            'requests': 0,
+            'requests_per_second': 0.0,
+        }
+        self._progress_lock = threading.Lock()
+        self._client = None
+        self._start_requests = 0
+        self._start_time = None
+
+    def run(self):
+        """
+        Executa a sincronização e retorna o resumo (quantidades e erros).
+        No modo incremental, só busca as regras das políticas cuja marca de modificação mudou
+        desde a última sincronização, e remove os arquivos das políticas que deixaram de existir
+        no FMC. Os mappings dos objetos dinâmicos são sempre buscados: mudar os IPs mapeados não
+        altera a marca de modificação do objeto.
+        """
+        with FP_Targets.use_target(self.target), timed(logger, "Sincronização"):
+            return self._run()
+
+    def _run(self):
+        self._client = get_client()
+        self._start_requests = self._client.request_count
+        self._start_time = time.monotonic()
+
+        state = load_sync_state()
+        full_sync_interval = getattr(config, 'full_sync_interval', FULL_SYNC_INTERVAL)
+        if self.incremental and time.time() - state.get('last_full_sync', 0) > full_sync_interval:
+            logger.info("Última sincronização completa é antiga; executando sincronização completa.")
+            self.incremental = False
+            self.summary['mode'] = 'full'
+        previous_policies = state.get('policies', {}) if self.incremental else {}
+        new_state = {
+            'last_sync': time.time(),
+            'last_full_sync': state.get('last_full_sync', 0) if self.incremental else time.time(),
+            'policies': {},
+        }
+
+        os.makedirs(FP_Targets.data_folder(), exist_ok=True)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            policies_future = submit_with_context(pool, FP_ACP.get_access_control_policies)
+            dynamic_future = submit_with_context(pool, FP_DynamicObject.get_dynamic_objects)
+            # A geração é incrementada uma vez só, no fim da sincronização
+            hits_future = submit_with_context(pool, FP_HitCount.collect_hit_counts, bump=False) if self.hit_counts else None
+            if self.async_collector:
+                static_futures = [submit_with_context(pool, FP_AsyncCollector.collect_static_objects)]
+            else:
+                static_futures = [
+                    submit_with_context(pool, FP_StaticObject.get_static_objects_of_type, object_type, description)
+                    for object_type, description in FP_StaticObject.STATIC_OBJECT_TYPES
+                ]
+
+            # Assim que a lista de políticas chega, as regras de cada uma são buscadas em paralelo
+            rules_futures = {}
+            policies = policies_future.result()
+            if policies is None:
+                self.summary['errors'].append("Falha ao obter as Access Control Policies.")
+                # Sem a lista não há como saber o que foi removido: mantém o estado anterior
+                new_state['policies'] = state.get('policies', {})
+            for policy in policies or []:
+                if not (policy.get('id') and policy.get('name')):
+                    continue
+                entry = {
+                    'name': policy['name'],
+                    'filename': FP_ACP.policy_filename(policy['name']),
+                    'modified': modified_marker(policy),
+                }
+                if self._is_unchanged(entry, previous_policies.get(policy['id'])) and \
+                        os.path.exists(os.path.join(FP_Targets.rules_directory(), entry['filename'])):
+                    new_state['policies'][policy['id']] = entry
+                    self.summary['policies_unchanged'] += 1
+                    continue
+                # As regras vão direto do FMC para o arquivo da política, página por página (FP_ACP.fetch_policy_rules)
+                rules_futures[submit_with_context(pool, FP_ACP.fetch_policy_rules, policy['id'], policy['name'])] = (policy, entry)
+            self.progress['policies_total'] = len(rules_futures)
+
+            # O mesmo vale para os mappings de cada objeto dinâmico. Eles são buscados de novo mesmo
+            # no modo incremental, porque a marca de modificação do objeto não muda com os mappings
+            # None é falha na listagem; uma lista vazia é um domínio sem objetos dinâmicos
+            dynamic_objects = dynamic_future.result()
+            if self.async_collector:
+                content_future = submit_with_context(pool, FP_AsyncCollector.collect_dynamic_object_content,
+                                                     dynamic_objects or [], self._object_resolved)
+            else:
+                content_futures = [
+                    submit_with_context(pool, self._count_resolved, FP_DynamicObject.add_dynamic_object_content, item)
+                    for item in dynamic_objects or []
+                ]
+
+            for future in as_completed(rules_futures):
+                policy, entry = rules_futures[future]
+                rule_count = future.result()
+                self.progress['policies_done'] += 1
+                self.update_request_rate()
+                if rule_count is None:
+                    self.summary['errors'].append(f"Falha ao obter as regras da política {policy['name']}.")
+                    # Mantém o arquivo anterior, mas força nova busca na próxima sincronização
+                    new_state['policies'][policy['id']] = dict(entry, modified=None)
+                    continue
+                new_state['policies'][policy['id']] = entry
+                self.progress['rules_fetched'] += rule_count
+                self.summary['policies'] += 1
+                self.summary['rules'] += rule_count
+
+            # Mantém a ordem original dos objetos no arquivo
+            if self.async_collector:
+                dynamic_objects_with_content = content_future.result()
+            else:
+                dynamic_objects_with_content = [future.result() for future in content_futures]
+            # Um inventário vazio também é gravado, para que os objetos apagados no FMC saiam do app
+            if dynamic_objects is not None:
+                FP_DynamicObject.save_to_json_file("FP_DO.json", dynamic_objects_with_content)
+                FP_Store.save_objects(dynamic_objects=dynamic_objects_with_content)
+                self.summary['dynamic_objects'] = len(dynamic_objects_with_content)
+            else:
+                self.summary['errors'].append("Falha ao extrair os objetos dinâmicos.")
+
+            # Se algum tipo falhar, mantém os objetos estáticos anteriores em vez de gravar uma lista parcial
+            static_objects = []
+            for future in static_futures:
+                items = future.result()
+                if items is None:
+                    static_objects = None
+                    break
+                static_objects.extend(items)
+            if static_objects is not None:
+                with self._progress_lock:
+                    self.progress['objects_resolved'] += len(static_objects)
+                FP_StaticObject.save_to_json_file("FP_SO.json", {"items": static_objects})
+                FP_Store.save_objects(static_objects=static_objects)
+                self.summary['static_objects'] = len(static_objects)
+            else:
+                self.summary['errors'].append("Falha ao extrair os objetos estáticos.")
+
+            if hits_future is not None:
+                hit_summary = hits_future.result()
+                self.summary['hit_counts'] = hit_summary['rules']
+                self.summary['errors'].extend(f"Hits: {error}" for error in hit_summary['errors'])
+
+        if policies is not None:
+            self._delete_removed_policies(state.get('policies', {}), new_state['policies'])
+        # Índice reverso objeto -> regras, montado uma vez com o inventário já completo
+        FP_Store.build_object_usage()
+        # Versão do inventário desta sincronização, comparável com as anteriores (FP_Snapshot), e nova
+        # geração, que invalida as páginas em cache (ETag) do app. A geração só muda junto com o snapshot:
+        # antes disso, /snapshots ficaria em cache na nova geração sem ele até a próxima sincronização
+        self.summary['snapshot'] = FP_Snapshot.create_snapshot(
+            retention=getattr(config, 'snapshot_retention', FP_Snapshot.SNAPSHOT_RETENTION), bump=True)
+        self.summary['generation'] = FP_Snapshot.get_snapshot(self.summary['snapshot'])['generation']
+        save_sync_state(new_state)
+        self.update_request_rate()
+        return self.summary
+
+    def _is_unchanged(self, current, previous):
+        """
+        No modo incremental, indica se o item não mudou desde a última sincronização.
+        Itens sem marca de modificação são sempre buscados de novo.
+        """
+        if not self.incremental or previous is None:
+            return False
+        if isinstance(current, dict):
+            return current['modified'] is not None and current == previous
+        return current is not None and current == previous
+
+    def _delete_removed_policies(self, previous_policies, current_policies):
+        """
+        Remove as regras (banco e arquivo JSON) de políticas apagadas (ou renomeadas) no FMC.
+        """
+        current_filenames = {entry['filename'] for entry in current_policies.values()}
+        for entry in previous_policies.values():
+            if entry['filename'] in current_filenames:
+                continue
+            FP_Store.delete_policy(entry['filename'])
+            file_path = os.path.join(FP_Targets.rules_directory(), entry['filename'])
+            if os.path.exists(file_path):
+                os.remove(file_path)
+                logger.info(f"Política removida do FMC: {entry['name']} ({file_path} apagado)")
+                self.summary['policies_deleted'] += 1
+
+    def _count_resolved(self, function, item):
+        result = function(item)
+        self._object_resolved()
+        return result
+
+    def _object_resolved(self):
+        with self._progress_lock:
+            self.progress['objects_resolved'] += 1
+        self.update_request_rate()
+
+    def update_request_rate(self):
+        """
+        Atualiza o total de requisições feitas nesta sincronização e a taxa por segundo.
+        """
+        if self._client is None:
+            return
+        requests_made = self._client.request_count - self._start_requests
+        elapsed = time.monotonic() - self._start_time
+        self.progress['requests'] = requests_made
+        self.progress['requests_per_second'] = round(requests_made / elapsed, 2) if elapsed > 0 else 0.0
+
+def run_sync(max_workers=None, incremental=False, target=None):
+    """
+    Executa uma sincronização (completa ou incremental) e retorna o resumo.
+    """
+    return SyncEngine(max_workers=max_workers, incremental=incremental, target=target).run()
+
+def modified_marker(item):
+    """
+    Marca de modificação de um item do FMC: metadata.lastUser.modifiedOn, ou
+    metadata.timestamp quando o primeiro não existe. None se nenhum estiver presente.
+    """
+    metadata = item.get('metadata') or {}
+    last_user = metadata.get('lastUser') or {}
+    return last_user.get('modifiedOn') or metadata.get('timestamp')
+
+def sync_state_file():
+    return os.path.join(FP_Targets.data_folder(), 'sync_state.json')
+
+def load_sync_state():
+    """
+    Lê o estado da última sincronização do alvo atual (marcas de modificação por política).
+    """
+    try:
+        with open(sync_state_file(), 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+def save_sync_state(state):
+    state_file = sync_state_file()
+    tmp_file = f"{state_file}.tmp"
+    with open(tmp_file, 'w') as f:
+        json.dump(state, f)
+    os.replace(tmp_file, state_file)
+
+class SyncJob:
+    """
+    Uma sincronização executada em segundo plano, identificada por um job_id.
+    Cada FMC/domínio (FP_Targets) tem seu próprio SyncEngine, e os alvos rodam em paralelo:
+    cada um grava seus dados e gera uma nova geração assim que termina, sem esperar pelos demais.
+    """
+
+    def __init__(self, incremental=False, targets=None):
+        self.job_id = uuid.uuid4().hex
+        self.status = 'running'
+        self.message = 'Sincronização em andamento.'
+        self.started_at = time.time()
+        self.finished_at = None
+        self.summary = None
+        targets = FP_Targets.all_targets() if targets is None else targets
+        self.engines = {target['key']: SyncEngine(incremental=incremental, target=target) for target in targets}
+        self.results = {key: {'status': 'running', 'errors': [], 'finished_at': None} for key in self.engines}
+
+    @property
+    def target_keys(self):
+        return set(self.engines)
+
+    def run(self):
+        # Os logs da sincronização (inclusive das threads do pool) levam o id do job
+        bind_request(self.job_id[:12])
+        max_targets = getattr(config, 'sync_max_targets', SYNC_MAX_TARGETS)
+        with ThreadPoolExecutor(max_workers=max(1, min(max_targets, len(self.engines)))) as pool:
+            for future in [submit_with_context(pool, self._run_target, key) for key in self.engines]:
+                future.result()
+
+        errors = []
+        for key, result in self.results.items():
+            errors.extend(f"[{key}] {error}" if len(self.results) > 1 else error for error in result['errors'])
+        if len(self.engines) == 1:
+            self.summary = next(iter(self.results.values())).get('summary')
+        else:
+            self.summary = combine_summaries({key: result.get('summary') for key, result in self.results.items()})
+        if errors:
+            self.status = 'error'
+            self.message = "Erro durante a sincronização: " + " ".join(errors)
+        else:
+            self.status = 'success'
+            self.message = 'Sincronização concluída com sucesso!'
+        self.finished_at = time.time()
+        logger.info(f"Sincronização {self.job_id} finalizada: {self.message}")
+
+    def _run_target(self, key):
+        """
+        Sincroniza um alvo; uma falha fica registrada no resultado dele e não interrompe os demais.
+        """
+        if len(self.engines) > 1:
+            bind_request(f"{self.job_id[:12]}/{key}")
+        engine, result = self.engines[key], self.results[key]
+        try:
+            result['summary'] = engine.run()
+            result['errors'] = list(result['summary']['errors'])
+        except Exception as e:
+            logger.exception(f"Falha inesperada na sincronização de {key}")
+            result['errors'] = [str(e)]
+        finally:
+            engine.update_request_rate()
+            result['status'] = 'error' if result['errors'] else 'success'
+            result['finished_at'] = time.time()
+            logger.info(f"Sincronização de {key} finalizada ({result['status']}).")
+
+    @property
+    def done(self):
+        return self.status != 'running'
+
+    def to_dict(self):
+        finished_at = self.finished_at or time.time()
+        progress = {}
+        for engine in self.engines.values():
+            for name, value in engine.progress.items():
+                progress[name] = progress.get(name, 0) + value
+        if 'requests_per_second' in progress:
+            progress['requests_per_second'] = round(progress['requests_per_second'], 2)
+        return {
+            'job_id': self.job_id,
+            'status': self.status,
+            'message': self.message,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'elapsed_seconds': round(finished_at - self.started_at, 2),
+            'progress': progress,
+            'targets': {
+                key: {
+                    'status': result['status'],
+                    'errors': result['errors'],
+                    'elapsed_seconds': round((result['finished_at'] or time.time()) - self.started_at, 2),
+                    'progress': dict(self.engines[key].progress),
+                }
+                for key, result in self.results.items()
+            },
+            'summary': self.summary,
+        }
+
+def combine_summaries(summaries):
+    """
+    Resumo de uma sincronização de vários alvos: os totais somados e o resumo de cada alvo em targets.
+    """
+    combined = {'targets': summaries}
+    for summary in summaries.values():
+        for name, value in (summary or {}).items():
+            if isinstance(value, int) and name not in ('generation', 'snapshot'):
+                combined[name] = combined.get(name, 0) + value
+    return combined
+
+class SyncJobManager:
+    """
+    Controla os jobs de sincronização do processo. Um alvo que já está sendo sincronizado
+    não é disparado de novo contra o FMC: o pedido é agrupado ao job em andamento.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._jobs = {}
+
+    def start(self, incremental=False, targets=None):
+        """
+        Inicia em segundo plano a sincronização dos alvos (padrão: todos os cadastrados).
+        Os alvos já em sincronização ficam de fora; se não sobrar nenhum, retorna o job em andamento.
+        Retorna (job, created).
+        """
+        targets = FP_Targets.all_targets() if targets is None else targets
+        if not targets:
+            raise ValueError("Nenhum firewall cadastrado.")
+        with self._lock:
+            running = [job for job in self._jobs.values() if not job.done]
+            busy = {key for job in running for key in job.target_keys}
+            pending = [target for target in targets if target['key'] not in busy]
+            if not pending:
+                keys = {target['key'] for target in targets}
+                return next(job for job in running if job.target_keys & keys), False
+            job = SyncJob(incremental=incremental, targets=pending)
+            self._jobs[job.job_id] = job
+            self._discard_old_jobs()
+        threading.Thread(target=job.run, name=f"sync-{job.job_id}", daemon=True).start()
+        return job, True
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _discard_old_jobs(self):
+        finished = [job for job in self._jobs.values() if job.done]
+        finished.sort(key=lambda job: job.started_at)
+        for job in finished[:-MAX_FINISHED_JOBS]:
+            del self._jobs[job.job_id]
+
+job_manager = SyncJobManager()
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Sincroniza os FMCs/domínios cadastrados.")
+    parser.add_argument("--incremental", action="store_true")
+    parser.add_argument("--target", action="append", help="Chave do alvo (padrão: todos; pode repetir)")
+    args = parser.parse_args()
+    targets = FP_Targets.all_targets()
+    if args.target:
+        targets = [target for target in targets if target['key'] in args.target]
+    job = SyncJob(incremental=args.incremental, targets=targets)
+    job.run()
+    print(json.dumps(job.to_dict(), indent=2))
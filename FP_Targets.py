@@ -0,0 +1,174 @@
+import contextvars
+import json
+import os
+import re
+import threading
+from contextlib import contextmanager
+from FP_Log import get_logger
+
+logger = get_logger(__name__)
+
+DATA_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+# FMCs/domínios cadastrados além do config.py
+TARGETS_FILE = os.path.join(DATA_FOLDER, 'targets.json')
+# Dados de cada alvo adicional: data/targets/<chave>/ (o alvo padrão continua em data/)
+TARGETS_FOLDER = os.path.join(DATA_FOLDER, 'targets')
+DEFAULT_TARGET = 'default'
+
+# Alvo do contexto atual (None = o FMC/domínio do config.py). Propagado às threads por submit_with_context.
+current_target_var = contextvars.ContextVar('fmc_target', default=None)
+_lock = threading.Lock()
+
+def target_key(host, domain_name):
+    """
+    Chave do alvo, usada no nome da pasta de dados: host e domínio, só com caracteres seguros.
+    """
+    return re.sub(r'[^a-z0-9._-]+', '_', f"{host}_{domain_name or 'Global'}".lower()).strip('_')
+
+def load_targets():
+    """
+    Alvos cadastrados em data/targets.json: lista de dicts com key, host, username, password,
+    verify_ssl, domain_uuid, domain_name e, opcionalmente, rate_limit, pool_size e max_workers.
+    """
+    try:
+        with open(TARGETS_FILE, 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return []
+
+def save_targets(targets):
+    os.makedirs(DATA_FOLDER, exist_ok=True)
+    tmp_file = f"{TARGETS_FILE}.tmp"
+    with open(tmp_file, 'w') as f:
+        json.dump(targets, f, indent=4)
+    os.replace(tmp_file, TARGETS_FILE)
+
+def register_target(host, username, password, verify_ssl, domain_uuid, domain_name):
+    """
+    Cadastra (ou atualiza) um FMC/domínio em data/targets.json e retorna a chave do alvo.
+    """
+    key = target_key(host, domain_name)
+    target = {
+        'key': key,
+        'host': host,
+        'username': username,
+        'password': password,
+        'verify_ssl': verify_ssl,
+        'domain_uuid': domain_uuid,
+        'domain_name': domain_name,
+    }
+    with _lock:
+        targets = load_targets()
+        for index, existing in enumerate(targets):
+            if existing['key'] == key:
+                # Mantém os ajustes feitos à mão (rate_limit, pool_size, max_workers)
+                targets[index] = dict(existing, **target)
+                break
+        else:
+            targets.append(target)
+        save_targets(targets)
+    logger.info(f"Alvo {key} cadastrado ({host}, domínio {domain_name}).")
+    return key
+
+def default_target():
+    """
+    O FMC/domínio do config.py, ou None se ainda não houver firewall cadastrado.
+    """
+    try:
+        import config
+    except ImportError:
+        return None
+    return {
+        'key': DEFAULT_TARGET,
+        'host': config.fmc_host,
+        'username': config.fmc_username,
+        'domain_uuid': config.domain_uuid,
+        'domain_name': getattr(config, 'domain_name', 'Global'),
+    }
+
+def all_targets():
+    """
+    Todos os alvos: o do config.py primeiro, seguido dos cadastrados em data/targets.json
+    (ignorando um que repita o FMC/domínio do config.py).
+    """
+    default = default_target()
+    targets = [default] if default else []
+    for target in load_targets():
+        if default and (target['host'], target['domain_uuid']) == (default['host'], default['domain_uuid']):
+            continue
+        targets.append(target)
+    return targets
+
+def targets_version():
+    """
+    Versão atual de data/targets.json (mtime e tamanho), que muda a cada alvo cadastrado ou editado.
+    """
+    try:
+        stat = os.stat(TARGETS_FILE)
+    except FileNotFoundError:
+        return None
+    return f"{stat.st_mtime_ns}-{stat.st_size}"
+
+def get_target(key):
+    """
+    Alvo com essa chave, ou None se não existir.
+    """
+    for target in all_targets():
+        if target['key'] == key:
+            return target
+    return None
+
+def current_target():
+    """
+    Alvo do contexto atual, ou None para o alvo padrão (config.py).
+    """
+    return current_target_var.get()
+
+def current_key():
+    target = current_target()
+    return target['key'] if target else DEFAULT_TARGET
+
+def bind_target(target):
+    """
+    Associa o alvo ao contexto atual e retorna o token para desfazer com reset_target.
+    O alvo padrão é representado por None.
+    """
+    if target is not None and target['key'] == DEFAULT_TARGET:
+        target = None
+    return current_target_var.set(target)
+
+def reset_target(token):
+    current_target_var.reset(token)
+
+@contextmanager
+def use_target(target):
+    """
+    Executa o bloco com o alvo associado: o cliente (FP_Client.get_client) e os arquivos de dados
+    (data_folder, rules_directory, db_file) passam a ser os desse alvo.
+    """
+    token = bind_target(target)
+    try:
+        yield target
+    finally:
+        reset_target(token)
+
+def target_folder(target=None):
+    if target is None or target['key'] == DEFAULT_TARGET:
+        return DATA_FOLDER
+    return os.path.join(TARGETS_FOLDER, target['key'])
+
+def data_folder():
+    """
+    Pasta de dados do alvo atual.
+    """
+    return target_folder(current_target())
+
+def rules_directory():
+    return os.path.join(data_folder(), 'acp_rules')
+
+def db_file():
+    return os.path.join(data_folder(), 'inventory.db')
+
+if __name__ == "__main__":
+    for target in all_targets():
+        print(f"{target['key']:40} {target['host']:30} {target['domain_name']:20} {target_folder(target)}")
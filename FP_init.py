@@ -3,31 +3,39 @@ import json
 import requests
 import time
 import sys
+import FP_Targets
+from FP_Log import get_logger
 
-def get_domain_uuid_once(fmc_host, token, verify_ssl):
+logger = get_logger(__name__)
+
+def get_domains(fmc_host, token, verify_ssl):
     """
-    Obtém o UUID do domínio usando o endpoint correto para a versão 7.2.5.
+    Lista os domínios do FMC acessíveis ao usuário: [{'uuid': ..., 'name': ...}] ('Global' primeiro).
+    Retorna None em caso de erro.
     """
     url = f"{fmc_host}/api/fmc_platform/v1/info/domain"
     headers = {"Content-Type": "application/json", "X-auth-access-token": token}
     try:
-        response = requests.get(url, headers=headers, verify=verify_ssl)
+        response = requests.get(url, headers=headers, verify=verify_ssl, params={"limit": 1000})
         response.raise_for_status()
-        domain_info = response.json()
-        if 'items' in domain_info and domain_info['items']:
-            domain_uuid = domain_info['items'][0].get('uuid')
-            if domain_uuid:
-                print(f"UUID do domínio obtido: {domain_uuid}")
-                return domain_uuid
-            else:
-                print("UUID do domínio não encontrado no item da resposta da API.")
-                return None
-        else:
-            print("A lista 'items' não foi encontrada ou está vazia na resposta da API.")
-            return None
+        items = response.json().get('items') or []
     except requests.exceptions.RequestException as e:
-        print(f"Erro ao obter informações do domínio: {e}")
+        logger.error(f"Erro ao obter informações do domínio: {e}")
+        return None
+    domains = [{'uuid': item['uuid'], 'name': item.get('name') or item['uuid']} for item in items if item.get('uuid')]
+    if not domains:
+        logger.info("A lista 'items' não foi encontrada ou está vazia na resposta da API.")
+    return domains
+
+def get_domain_uuid_once(fmc_host, token, verify_ssl):
+    """
+    Obtém o UUID do domínio usando o endpoint correto para a versão 7.2.5.
+    """
+    domains = get_domains(fmc_host, token, verify_ssl)
+    if not domains:
         return None
+    logger.info(f"UUID do domínio obtido: {domains[0]['uuid']}")
+    return domains[0]['uuid']
 
 def get_firepower_token(fmc_host, fmc_username, fmc_password, verify_ssl):
     """
@@ -42,20 +50,25 @@ def get_firepower_token(fmc_host, fmc_username, fmc_password, verify_ssl):
         if token:
             return token
         else:
-            print("Erro ao obter token: Nenhum token retornado.")
+            logger.error("Erro ao obter token: Nenhum token retornado.")
             return None
     except requests.exceptions.RequestException as e:
-        print(f"Erro ao obter token do Firepower: {e}")
+        logger.error(f"Erro ao obter token do Firepower: {e}")
         return None
 
 def create_config_file(fmc_host_input, fmc_username_input, fmc_password_input, verify_ssl=False):
+    """
+    Grava o config.py com o FMC padrão e o primeiro domínio do usuário.
+    Retorna todos os domínios encontrados (lista vazia se não foi possível obtê-los).
+    """
     # Remove o https:// caso o usuário tenha digitado
     fmc_host_without_prefix = fmc_host_input.replace("https://", "").replace("http://", "")
 
     token = get_firepower_token(f"https://{fmc_host_without_prefix}", fmc_username_input, fmc_password_input, verify_ssl)
-    domain_uuid = None
+    domains = []
     if token:
-        domain_uuid = get_domain_uuid_once(f"https://{fmc_host_without_prefix}", token, verify_ssl)
+        domains = get_domains(f"https://{fmc_host_without_prefix}", token, verify_ssl) or []
+    domain = domains[0] if domains else {'uuid': None, 'name': 'Global'}
 
     config_data = {
         "fmc_host": fmc_host_without_prefix,
@@ -63,9 +76,12 @@ def create_config_file(fmc_host_input, fmc_username_input, fmc_password_input, v
         "fmc_password": fmc_password_input,
         "verify_ssl": verify_ssl,
         "device_uuids": {},
-        "domain_uuid": domain_uuid if domain_uuid else None,
+        "domain_uuid": domain['uuid'],
+        "domain_name": domain['name'],
         "fmc_token": token if token else '',
-        "token_generation_time": int(time.time()) if token else 0
+        "token_generation_time": int(time.time()) if token else 0,
+        "fmc_rate_limit": 120,  # Requisições por minuto permitidas pelo FMC
+        "sync_max_workers": 8  # Threads usadas pela sincronização
     }
     with open("config.py", "w") as f:
         f.write(f"fmc_host = '{config_data['fmc_host']}'\n")
@@ -74,9 +90,42 @@ def create_config_file(fmc_host_input, fmc_username_input, fmc_password_input, v
         f.write(f"verify_ssl = {config_data['verify_ssl']}\n")
         f.write(f"device_uuids = {json.dumps(config_data['device_uuids'], indent=4)}\n")
         f.write(f"domain_uuid = '{config_data['domain_uuid']}'\n")
+        f.write(f"domain_name = '{config_data['domain_name']}'\n")
         f.write(f"fmc_token = '{config_data['fmc_token']}'\n")
         f.write(f"token_generation_time = {config_data['token_generation_time']}\n")
-    print("Arquivo config.py criado com as informações do FMC, UUID do domínio e token inicial.")
+        f.write(f"fmc_rate_limit = {config_data['fmc_rate_limit']}\n")
+        f.write(f"sync_max_workers = {config_data['sync_max_workers']}\n")
+    logger.info("Arquivo config.py criado com as informações do FMC, UUID do domínio e token inicial.")
+    return domains
+
+def register_firewall(fmc_host_input, fmc_username_input, fmc_password_input, verify_ssl=False):
+    """
+    Cadastra um FMC com todos os seus domínios. O primeiro FMC (ou um novo cadastro do mesmo host)
+    grava o config.py e vira o alvo padrão; os demais domínios e FMCs vão para data/targets.json
+    (FP_Targets). Retorna as chaves dos alvos cadastrados.
+    """
+    fmc_host = fmc_host_input.replace("https://", "").replace("http://", "")
+    try:
+        import config
+        default_host = config.fmc_host
+    except ImportError:
+        default_host = None
+
+    if default_host in (None, fmc_host):
+        domains = create_config_file(fmc_host, fmc_username_input, fmc_password_input, verify_ssl)
+        keys, extra_domains = [FP_Targets.DEFAULT_TARGET], domains[1:]
+    else:
+        token = get_firepower_token(f"https://{fmc_host}", fmc_username_input, fmc_password_input, verify_ssl)
+        if not token:
+            raise ValueError(f"Não foi possível autenticar no FMC {fmc_host}.")
+        extra_domains = get_domains(f"https://{fmc_host}", token, verify_ssl)
+        if not extra_domains:
+            raise ValueError(f"Nenhum domínio encontrado no FMC {fmc_host}.")
+        keys = []
+    for domain in extra_domains:
+        keys.append(FP_Targets.register_target(fmc_host, fmc_username_input, fmc_password_input, verify_ssl,
+                                               domain['uuid'], domain['name']))
+    return keys
 
 
 # Obtém o diretório onde o script está localizado
@@ -85,8 +134,8 @@ script_directory = os.path.dirname(os.path.abspath(__file__))
 # Muda o diretório de trabalho atual para o diretório do script
 os.chdir(script_directory)
 
-print(f"Diretório do script: {script_directory}")
-print(f"Diretório de trabalho atual: {os.getcwd()}")
+logger.info(f"Diretório do script: {script_directory}")
+logger.info(f"Diretório de trabalho atual: {os.getcwd()}")
 
 if not os.path.exists("config.py"):
     fmc_host_input = input("Por favor, digite o IP ou FQDN do seu Firepower Management Center (FMC): ")
@@ -94,4 +143,4 @@ if not os.path.exists("config.py"):
     fmc_password_input = input("Por favor, digite sua senha do FMC: ")
     create_config_file(fmc_host_input, fmc_username_input, fmc_password_input)
 else:
-    print("Arquivo config.py já existe. Se precisar atualizar as configurações, apague este arquivo e execute novamente.")
\ No newline at end of file
+    logger.info("Arquivo config.py já existe. Se precisar atualizar as configurações, apague este arquivo e execute novamente.")
\ No newline at end of file
@@ -1,74 +1,189 @@
-from flask import Flask, render_template, redirect, url_for, flash, jsonify, request
+from flask import Flask, abort, render_template, redirect, url_for, flash, jsonify, request, Response, make_response, session
+import functools
+import hashlib
 import json
+import logging
 import os
-import subprocess
-import sys  # Import the sys module
-from FP_init import get_firepower_token, get_domain_uuid_once, create_config_file  # Importa as funções
-from flask_wtf.csrf import CSRFProtect  # Add this line
+import time
+import requests
+import uuid
+import FP_HitCount
+import FP_Log
+import FP_Snapshot
+import FP_Store
+import FP_Targets
+from FP_init import get_firepower_token, get_domain_uuid_once, register_firewall  # Importa as funções
+from flask_wtf.csrf import CSRFProtect, generate_csrf  # Add this line
+from werkzeug.http import http_date
+from FP_Analyzer import analyze_policy
+from FP_Cache import RESPONSE_ENCODINGS, FileCache, ResponseCache
+from FP_IPIndex import build_rules_index, search_rules
+from FP_JsonStream import iter_json_array
+from FP_Simulator import RULE_FIELDS, PolicySimulator
+from FP_ObjectResolver import load_object_resolver, object_source_paths, resolve_networks
+from FP_Log import get_logger, trace, timed
+
+logger = get_logger(__name__)
 
 
 app = Flask(__name__)
 app.secret_key = "uma_chave_secreta"  # Necessário para o flash()
 csrf = CSRFProtect(app)  # Add this line
-DATA_FOLDER = os.path.join(app.root_path, 'data')
-ACP_RULES_FOLDER = os.path.join(DATA_FOLDER, 'acp_rules')
+
+# Campos das regras exibidos em policy_details.html (o id liga a regra aos seus hits)
+POLICY_VIEW_FIELDS = [
+    'id', 'name', 'action', 'enabled', 'sourceInterfaces', 'destinationInterfaces', 'sourceZones', 'destinationZones',
+    'sourceNetworks', 'destinationNetworks', 'sourcePorts', 'destinationPorts', 'logConfig', 'commentHistoryList',
+]
+
+# Tamanho padrão e máximo das páginas da tabela de regras
+RULES_PAGE_SIZE = 100
+MAX_RULES_PAGE_SIZE = 1000
+
+# Índices e resultados já calculados (por FMC/domínio), reconstruídos só quando os arquivos mudam
+object_index_cache = FileCache(max_entries=8)
+rules_index_cache = FileCache(max_entries=8)
+simulator_cache = FileCache(max_entries=8)
+analysis_cache = FileCache(max_entries=32)
+# Páginas já renderizadas (e comprimidas), por geração do inventário, lista de alvos e URL
+page_cache = ResponseCache(max_entries=64)
+
+@app.before_request
+def start_request():
+    """
+    Associa um request_id a cada requisição (reaproveitando o cabeçalho X-Request-ID, se houver).
+    O rastreamento detalhado só é ligado com ?trace=1 ou o cabeçalho X-Debug-Trace: 1.
+    """
+    request_id = request.headers.get('X-Request-ID') or uuid.uuid4().hex[:12]
+    trace_enabled = request.args.get('trace') == '1' or request.headers.get('X-Debug-Trace') == '1'
+    FP_Log.bind_request(request_id, trace=trace_enabled)
+    request.environ['request_id'] = request_id
+    request.environ['request_start'] = time.perf_counter()
+    bind_request_target()
+
+def bind_request_target():
+    """
+    Associa à requisição o FMC/domínio (FP_Targets) pedido em ?target= ou escolhido na sessão:
+    o banco, os arquivos de dados e o cliente do FMC passam a ser os desse alvo.
+    Um ?target= desconhecido responde 404, em vez de mostrar os dados do alvo padrão.
+    """
+    key = request.args.get('target') or session.get('target')
+    target = None
+    if key and key != FP_Targets.DEFAULT_TARGET:
+        target = FP_Targets.get_target(key)
+        if target is None:
+            if 'target' in request.args:
+                abort(404, description=f"FMC/domínio não encontrado: {key}")
+            session.pop('target', None)  # Alvo removido de data/targets.json
+    request.environ['target_token'] = FP_Targets.bind_target(target)
+
+@app.teardown_request
+def reset_request_target(exception=None):
+    token = request.environ.pop('target_token', None)
+    if token is not None:
+        FP_Targets.reset_target(token)
+
+@app.context_processor
+def inject_targets():
+    return {'targets': FP_Targets.all_targets(), 'current_target': FP_Targets.current_key()}
+
+@app.template_filter('datetime')
+def format_datetime(timestamp):
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(timestamp)) if timestamp else ''
+
+@app.after_request
+def finish_request(response):
+    response.headers['X-Request-ID'] = request.environ.get('request_id', '-')
+    elapsed = time.perf_counter() - request.environ.get('request_start', time.perf_counter())
+    logger.info("%s %s -> %s em %.3fs", request.method, request.full_path.rstrip('?'), response.status_code, elapsed)
+    return response
+
+def cached_page(view):
+    """
+    Cache HTTP de páginas que só mudam com uma nova sincronização. O ETag (forte) e o Last-Modified
+    vêm da geração do inventário (FP_Store.get_generation) do alvo atual: a página é renderizada e
+    pré-comprimida uma vez por geração, e requisições condicionais recebem 304.
+    Só respostas 200 entram no cache; com ?trace=1 a página é sempre renderizada.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if FP_Log.tracing_enabled():
+            return view(*args, **kwargs)
+        generation, generation_at = FP_Store.get_generation()
+        # Cada alvo tem seu banco e sua própria sequência de gerações. As páginas também listam os
+        # alvos (inject_targets), então cadastrar um novo FMC/domínio muda a chave e o ETag
+        key = f"{FP_Targets.current_key()}:{FP_Targets.targets_version()}:{request.full_path}"
+        entry = page_cache.get((generation, key))
+        if entry is None:
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+            entry = page_cache.put((generation, key), response.get_data(), response.mimetype)
+
+        encoding = request.accept_encodings.best_match([name for name in RESPONSE_ENCODINGS if name in entry['bodies']])
+        # Cada codificação é uma representação diferente, com seu próprio ETag forte
+        etag = f"g{generation}-{hashlib.sha1(key.encode()).hexdigest()[:16]}" + (f"-{encoding}" if encoding else "")
+        headers = {'ETag': f'"{etag}"', 'Cache-Control': 'no-cache', 'Vary': 'Accept-Encoding'}
+        if generation_at is not None:
+            headers['Last-Modified'] = http_date(generation_at)
+
+        if request.if_none_match:
+            not_modified = request.if_none_match.contains(etag)
+        else:
+            since = request.if_modified_since
+            not_modified = generation_at is not None and since is not None and int(generation_at) <= since.timestamp()
+        if not_modified:
+            return Response(status=304, headers=headers)
+        if encoding:
+            headers['Content-Encoding'] = encoding
+        return Response(entry['bodies'][encoding], mimetype=entry['mimetype'], headers=headers)
+    return wrapper
 
 def get_policy_filenames():
     """
-    Retorna uma lista de nomes de arquivos de política no diretório ACP_RULES_FOLDER.
+    Retorna os nomes de arquivo das políticas sincronizadas, lidos do banco (FP_Store).
     """
-    try:
-        return [filename for filename in os.listdir(ACP_RULES_FOLDER) if filename.endswith('.json')]
-    except FileNotFoundError:
-        print(f"Diretório não encontrado: {ACP_RULES_FOLDER}")
-        return []
+    return [policy['filename'] for policy in FP_Store.list_policies()]
 
-def load_policy_rules(filename):
+def load_policy_rules(filename, fields=None):
     """
-    Carrega as regras de política de um arquivo JSON.
+    Carrega as regras de uma política do banco (FP_Store); com fields, só esses campos de cada regra.
     """
-    file_path = os.path.join(ACP_RULES_FOLDER, filename)
-    try:
-        with open(file_path, 'r') as file:
-            return json.load(file)
-    except FileNotFoundError:
-        print(f"Arquivo não encontrado: {file_path}")
-        return []
-    except json.JSONDecodeError:
-        print(f"Erro ao decodificar JSON de: {file_path}")
-        return []
+    return FP_Store.load_policy_rules(filename, fields)
 
-def load_json_data(filepath):
+def load_json_data(filepath, key=None, fields=None):
     """
-    Carrega dados de um arquivo JSON.
+    Percorre, um por um, os itens de um array JSON (com key, o array do campo key, como no FP_SO.json),
+    sem carregar o arquivo inteiro; com fields, cada item traz só esses campos.
+    Um arquivo ausente ou inválido é registrado no log e não produz itens.
     """
     try:
         with open(filepath, 'r') as file:
-            return json.load(file)
+            yield from iter_json_array(file, key, fields=fields)
     except FileNotFoundError:
-        print(f"Arquivo não encontrado: {filepath}")
-        return None
-    except json.JSONDecodeError:
-        print(f"Erro ao decodificar JSON de: {filepath}")
-        return None
+        logger.warning(f"Arquivo não encontrado: {filepath}")
+    except ValueError:
+        logger.error(f"Erro ao decodificar JSON de: {filepath}")
 
 def get_dynamic_objects():
-    fp_do_path = os.path.join(DATA_FOLDER, 'FP_DO.json')
-    try:
-        with open(fp_do_path, 'r') as f:
-            data = json.load(f)
-            objects = []
-            for item in data:
-                object_info = {'name': item['name'], 'ips': [], 'id': item['id']}  # Added 'id' here
-                if 'content' in item and isinstance(item['content'], list):
-                    object_info['ips'].extend(item['content'])
-                objects.append(object_info)
-            return objects
-    except FileNotFoundError:
-        return None
+    """
+    Retorna os objetos dinâmicos com seus IPs, lidos do banco (FP_Store).
+    Se o banco ainda não os tiver (sincronizados antes do banco existir), importa o FP_DO.json.
+    """
+    if not FP_Store.has_objects('dynamic'):
+        fp_do_path = os.path.join(FP_Targets.data_folder(), 'FP_DO.json')
+        if not os.path.exists(fp_do_path):
+            return None
+        FP_Store.save_objects(dynamic_objects=load_json_data(fp_do_path))
+    return FP_Store.list_dynamic_objects()
     
 @app.route('/update_dynamic_object_ips', methods=['PUT'])
 def update_dynamic_object_ips():
+    """
+    Atualiza os IPs de um objeto dinâmico com chamadas em lote ao FMC (FP_MappedIP), no próprio processo.
+    Aceita ips_to_add/ips_to_remove ou ips (lista completa desejada; só a diferença é enviada).
+    A resposta traz o resultado de cada lote.
+    """
     data = request.get_json()
     object_id = data.get('object_id')
     ips_to_add = data.get('ips_to_add', [])
@@ -77,28 +192,24 @@ def update_dynamic_object_ips():
     if not object_id:
         return jsonify({'status': 'error', 'message': 'Object ID is required'}), 400
 
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    fp_mapped_ip_path = os.path.join(script_dir, "FP_MappedIP.py")
-
-    output = ""  # Initialize an empty string to store the output
-
-    if ips_to_remove:
-        remove_command = ['python', fp_mapped_ip_path, object_id, 'remove', ','.join(ips_to_remove)]
-        try:
-            remove_result = subprocess.run(remove_command, capture_output=True, text=True, check=True)
-            output += f"Remove command output:\n{remove_result.stdout}\n"
-        except subprocess.CalledProcessError as e:
-            return jsonify({'status': 'error', 'message': f'Error removing IPs: {e.stderr}', 'output': e.stderr}), 500
-
-    if ips_to_add:
-        add_command = ['python', fp_mapped_ip_path, object_id, 'add', ','.join(ips_to_add)]
-        try:
-            add_result = subprocess.run(add_command, capture_output=True, text=True, check=True)
-            output += f"Add command output:\n{add_result.stdout}\n"
-        except subprocess.CalledProcessError as e:
-            return jsonify({'status': 'error', 'message': f'Error adding IPs: {e.stderr}', 'output': e.stderr}), 500
-
-    return jsonify({'status': 'success', 'message': 'IPs updated successfully', 'output': output})
+    # Importado aqui porque FP_MappedIP depende do config.py criado em /save_firewall
+    from FP_MappedIP import apply_mapping_changes, set_mapped_ips
+    try:
+        if 'ips' in data:
+            report = set_mapped_ips(object_id, data['ips'])
+        else:
+            report = apply_mapping_changes({object_id: {'add': ips_to_add, 'remove': ips_to_remove}})
+    except requests.exceptions.RequestException as e:
+        return jsonify({'status': 'error', 'message': f'Error reading current mappings: {e}'}), 502
+
+    # Reflete no banco o que foi aplicado, e uma nova geração invalida as páginas em cache
+    FP_Store.update_dynamic_mappings(report['applied'])
+    FP_Store.bump_generation()
+    result = {key: value for key, value in report.items() if key != 'applied'}
+    if report['status'] != 'success':
+        failed = sum(chunk['status'] != 'success' for chunk in report['chunks'])
+        return jsonify(dict(result, message=f'{failed} of {len(report["chunks"])} batches failed')), 502
+    return jsonify(dict(result, message=f'IPs updated successfully ({report["added"]} added, {report["removed"]} removed)'))
 
 @app.route('/')
 def homepage():
@@ -113,164 +224,423 @@ def save_firewall():
     fmc_host = request.form['fmc_host']
     fmc_username = request.form['fmc_username']
     fmc_password = request.form['fmc_password']
-    create_config_file(fmc_host, fmc_username, fmc_password)
-    flash('Firewall added successfully!', 'success')
+    try:
+        # Cada domínio do FMC vira um alvo (FP_Targets); o primeiro FMC cadastrado é o padrão (config.py)
+        keys = register_firewall(fmc_host, fmc_username, fmc_password)
+    except ValueError as e:
+        flash(str(e), 'error')
+        return redirect(url_for('add_firewall'))
+    import FP_Client
+    FP_Client.reset_client()  # Os próximos syncs passam a usar os firewalls recém-cadastrados
+    page_cache.clear()  # As páginas em cache listam os alvos antigos
+    flash(f'Firewall added successfully! ({len(keys)} domain(s): {", ".join(keys)})', 'success')
+    return redirect(url_for('homepage'))
+
+@app.route('/select_target', methods=['POST'])
+def select_target():
+    """
+    Escolhe o FMC/domínio exibido nas páginas (guardado na sessão).
+    """
+    key = request.form.get('target', FP_Targets.DEFAULT_TARGET)
+    if key != FP_Targets.DEFAULT_TARGET and FP_Targets.get_target(key) is None:
+        flash(f"FMC/domínio não encontrado: {key}", 'error')
+    else:
+        session['target'] = key
     return redirect(url_for('homepage'))
 
 @app.route('/policies')
+@cached_page
 def policies():
-    policy_files = get_policy_filenames()
-    return render_template('policies.html', policy_files=policy_files)
+    return render_template('policies.html', policies=FP_Store.list_policies())
+
+def get_object_resolver():
+    """
+    Retorna o resolvedor de objetos, compartilhado por todas as páginas.
+    É reconstruído apenas quando o FP_SO.json ou o FP_DO.json mudam, ou seja, uma vez por sincronização;
+    os grupos já achatados ficam memorizados nele.
+    """
+    data_folder = FP_Targets.data_folder()
+    return object_index_cache.get(('object_resolver', data_folder), object_source_paths(data_folder),
+                                  lambda: load_object_resolver(data_folder))
+
+def parse_rules_query(args):
+    """
+    Lê dos parâmetros da requisição a página, os filtros e a ordenação da tabela de regras.
+    Levanta ValueError para valores inválidos.
+    """
+    try:
+        per_page = min(max(int(args.get('per_page', RULES_PAGE_SIZE)), 1), MAX_RULES_PAGE_SIZE)
+        if 'offset' in args:
+            offset = max(int(args['offset']), 0)
+        else:
+            offset = (max(int(args.get('page', 1)), 1) - 1) * per_page
+    except ValueError:
+        raise ValueError("page, per_page e offset devem ser números inteiros")
+    enabled = args.get('enabled', '').lower()
+    if enabled not in ('', 'true', 'false'):
+        raise ValueError("enabled deve ser true ou false")
+    sort = args.get('sort', 'position')
+    return {
+        'offset': offset,
+        'per_page': per_page,
+        'action': args.get('action', '').strip() or None,
+        'enabled': None if not enabled else enabled == 'true',
+        'zone': args.get('zone', '').strip() or None,
+        'name': args.get('name', '').strip() or None,
+        'ip': args.get('ip', '').strip() or None,
+        'sort': sort.lstrip('-'),
+        'descending': sort.startswith('-'),
+    }
+
+def get_rules_page(filename, args):
+    """
+    Uma página das regras de uma política, já filtrada e ordenada no banco; só as regras
+    da página têm os IPs de origem e destino resolvidos e os hits (FP_HitCount) anexados.
+    """
+    query = parse_rules_query(args)
+    positions = None
+    if query['ip']:
+        positions = {result['position'] for result in search_rules(get_rules_index(), query['ip']) if result['policy'] == filename}
+    total, rules = FP_Store.query_rules(
+        filename, POLICY_VIEW_FIELDS, action=query['action'], enabled=query['enabled'], zone=query['zone'],
+        name=query['name'], positions=positions, sort=query['sort'], descending=query['descending'],
+        offset=query['offset'], limit=query['per_page'])
+    resolver = get_object_resolver()
+    hits = FP_HitCount.rule_hits([rule.get('id') for rule in rules])
+    for rule in rules:
+        trace(logger, "Processando regra: %s", rule.get('name'))
+        rule['source_ips'] = resolve_networks(resolver, rule.get('sourceNetworks'), "Origem")
+        rule['destination_ips'] = resolve_networks(resolver, rule.get('destinationNetworks'), "Destino")
+        rule['hits'] = hits.get(rule.get('id'))
+    return {
+        'policy': filename,
+        'total': total,
+        'offset': query['offset'],
+        'page': query['offset'] // query['per_page'] + 1,
+        'per_page': query['per_page'],
+        'pages': max((total + query['per_page'] - 1) // query['per_page'], 1),
+        'rules': rules,
+    }
 
 @app.route('/policy/<filename>')
+@cached_page
 def show_policy(filename):
-    rules = load_policy_rules(filename)
-    fp_do_path = os.path.join(DATA_FOLDER, 'FP_DO.json')
-    fp_so_path = os.path.join(DATA_FOLDER, 'FP_SO.json')
-    dynamic_objects_data = load_json_data(fp_do_path)
-    static_objects_data = load_json_data(fp_so_path)
-
-    dynamic_objects = {}
-    if dynamic_objects_data and 'items' in dynamic_objects_data:
-        for item in dynamic_objects_data['items']:
-            dynamic_objects[item['name']] = item.get('content')
-
-    static_objects_by_id = {}
-    if static_objects_data and 'items' in static_objects_data:
-        for item in static_objects_data['items']:
-            ips = []
-            if 'literals' in item:
-                for literal in item['literals']:
-                    if literal.get('value'):
-                        ips.append(literal['value'])
-            elif 'value' in item:
-                ips.append(item['value'])
-            static_objects_by_id[item['id']] = ips
-
-    print("Conteúdo de static_objects_by_id:", static_objects_by_id)
-    for rule in rules:
-        print(f"Processando regra: {rule.get('name')}")
-        rule['source_ips'] = []
-        if rule.get('sourceNetworks') and rule['sourceNetworks'].get('objects'):
-            print("  Source Networks:", rule.get('sourceNetworks'))
-            for source_object in rule['sourceNetworks']['objects']:
-                object_id = source_object.get('id')
-                print(f"    ID do objeto de origem encontrado: {object_id}")
-                if object_id and object_id in static_objects_by_id:
-                    print(f"    IPs correspondentes (origem):", static_objects_by_id[object_id])
-                    rule['source_ips'].extend(static_objects_by_id[object_id])
-
-        rule['destination_ips'] = []
-        if rule.get('destinationNetworks') and rule['destinationNetworks'].get('objects'):
-            print("  Destination Networks:", rule.get('destinationNetworks'))
-            for destination_object in rule['destinationNetworks']['objects']:
-                object_id = destination_object.get('id')
-                print(f"    ID do objeto de destino encontrado: {object_id}")
-                if object_id and object_id in static_objects_by_id:
-                    print(f"    IPs correspondentes (destino):", static_objects_by_id[object_id])
-                    rule['destination_ips'].extend(static_objects_by_id[object_id])
-
-    return render_template('policy_details.html', filename=filename, rules=rules)
+    """
+    Tabela paginada das regras de uma política, com filtros (action, enabled, zone, name, ip) e ordenação (sort).
+    """
+    if filename not in get_policy_filenames():
+        flash(f"Política não encontrada: {filename}", 'error')
+        return redirect(url_for('homepage'))
+    page, error = None, None
+    try:
+        with timed(logger, f"Página da política {filename}", level=logging.INFO if FP_Log.tracing_enabled() else logging.DEBUG):
+            page = get_rules_page(filename, request.args)
+    except ValueError as e:
+        error = str(e)
+    filters = {key: value for key, value in request.args.items() if key not in ('page', 'offset') and value}
+    return render_template('policy_details.html', filename=filename, page=page, error=error, filters=filters)
+
+@app.route('/api/policy/<filename>/rules')
+def policy_rules_api(filename):
+    """
+    Mesma consulta de show_policy, em JSON: ?page=&per_page= (ou offset=), filtros e sort (prefixo - para decrescente).
+    """
+    if filename not in get_policy_filenames():
+        return jsonify({'status': 'error', 'message': f'Política não encontrada: {filename}'}), 404
+    try:
+        return jsonify(get_rules_page(filename, request.args))
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+
+def get_rules_index():
+    """
+    Retorna o índice de endereços das regras de todas as políticas.
+    É reconstruído apenas quando algum arquivo de regras ou de objetos muda.
+    """
+    data_folder, rules_directory = FP_Targets.data_folder(), FP_Targets.rules_directory()
+    paths = [os.path.join(rules_directory, filename) for filename in sorted(get_policy_filenames())]
+    paths += object_source_paths(data_folder)
+    return rules_index_cache.get(('rules_index', data_folder), paths, lambda: build_rules_index(
+        rules_directory, data_folder, resolver=get_object_resolver()))
+
+@app.route('/search')
+def search():
+    """
+    Lista as regras cujos IPs de origem ou destino tocam um IP, rede CIDR ou range (?q=).
+    Com format=json, retorna o resultado em JSON.
+    """
+    query = request.args.get('q', '').strip()
+    results, error = [], None
+    if query:
+        try:
+            with timed(logger, f"Busca por {query}", level=logging.DEBUG):
+                results = search_rules(get_rules_index(), query)
+        except ValueError as e:
+            error = str(e)
+    if request.args.get('format') == 'json':
+        if error:
+            return jsonify({'status': 'error', 'message': error}), 400
+        return jsonify({'query': query, 'results': results})
+    return render_template('search.html', query=query, results=results, error=error)
+
+@app.route('/policy/<filename>/simulate')
+def simulate_policy(filename):
+    """
+    Avalia um fluxo (src, dst, proto, dport, sport, src_zone, dst_zone) contra a política e
+    retorna em JSON a primeira regra que casa e a ação.
+    """
+    rules_path = os.path.join(FP_Targets.rules_directory(), filename)
+    if filename not in get_policy_filenames():
+        return jsonify({'status': 'error', 'message': f'Política não encontrada: {filename}'}), 404
+    simulator = simulator_cache.get(rules_path, [rules_path] + object_source_paths(FP_Targets.data_folder()),
+                                    lambda: PolicySimulator(load_policy_rules(filename, RULE_FIELDS), get_object_resolver()))
+    args = request.args
+    try:
+        result = simulator.simulate(args.get('src', ''), args.get('dst', ''), args.get('proto'), args.get('dport'),
+                                    args.get('src_zone'), args.get('dst_zone'), args.get('sport'))
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    return jsonify(dict(result, policy=filename))
+
+def get_policy_analysis(filename):
+    """
+    Relatório de regras sombreadas, redundantes e candidatas a união de uma política.
+    Calculado uma vez por sincronização: fica em cache até o arquivo de regras ou os objetos mudarem.
+    """
+    rules_path = os.path.join(FP_Targets.rules_directory(), filename)
+    return analysis_cache.get(rules_path, [rules_path] + object_source_paths(FP_Targets.data_folder()),
+                              lambda: analyze_policy(filename, load_policy_rules(filename, RULE_FIELDS), get_object_resolver()))
+
+@app.route('/analysis')
+def analysis():
+    reports = [get_policy_analysis(filename) for filename in sorted(get_policy_filenames())]
+    return render_template('analysis.html', reports=reports)
+
+@app.route('/analysis/<filename>')
+def policy_analysis(filename):
+    if filename not in get_policy_filenames():
+        flash(f"Política não encontrada: {filename}", 'error')
+        return redirect(url_for('homepage'))
+    return render_template('policy_analysis.html', filename=filename, report=get_policy_analysis(filename))
+
+def get_sync_job_manager():
+    """
+    Retorna o gerenciador de jobs de sincronização.
+    Importado aqui porque FP_Sync depende do config.py criado em /save_firewall.
+    """
+    import FP_Sync
+    return FP_Sync.job_manager
 
 @app.route('/sync', methods=['POST'])
 def sync_data():
-    if request.headers.get('X-Requested-With') == 'XMLHttpRequest':  # Verifica o cabeçalho AJAX
-        try:
-            print("Iniciando sincronização...")
-
-            # Construct absolute paths to the scripts
-            script_dir = os.path.dirname(os.path.abspath(__file__))  # Get directory of app.py
-            fp_acp_path = os.path.join(script_dir, "FP_ACP.py")
-            fp_do_path = os.path.join(script_dir, "FP_DynamicObject.py")
-            fp_so_path = os.path.join(script_dir, "FP_StaticObject.py")
-
-            # Get the current environment
-            current_env = os.environ.copy()
-
-            # Print environment variables from Flask for debugging
-            #print("Environment variables from Flask:")
-            #for key, value in current_env.items():
-            #    print(f"{key}: {value}")
-
-            # Print Python version for debugging
-            print(f"Python version from Flask: {sys.version}")
-
-            # Execute FP_ACP.py with explicit environment
-            subprocess.run(['python', fp_acp_path], check=True, env=current_env)
-            print("FP_ACP.py concluído.")
-            #flash("Regras de Access Control Policies sincronizadas com sucesso!", 'success')
-            
-            # Execute FP_DynamicObjects.py with explicit environment
-            subprocess.run(['python', fp_do_path], check=True, env=current_env)
-            print("FP_DynamicObject.py concluído.")
-            #flash("Objetos dinâmicos sincronizados com sucesso!", 'success')
-            
-            # Execute FP_StaticObjects.py with explicit environment
-            subprocess.run(['python', fp_so_path], check=True, env=current_env)
-            print("FP_StaticObject.py concluído.")
-            #flash("Objetos estáticos sincronizados com sucesso!", 'success')
-            
-            return jsonify({'status': 'success', 'message': 'Sincronização concluída com sucesso!'})
-        except subprocess.CalledProcessError as e:
-            error_message = f"Erro durante a sincronização: {e}"
-            print(error_message)
-            #flash(error_message, 'error')
-            return jsonify({'status': 'error', 'message': error_message})
-        except FileNotFoundError:
-            error_message = "Erro: Um ou mais scripts de sincronização não foram encontrados."
-            print(error_message)
-            #flash(error_message, 'error')
+    is_ajax = request.headers.get('X-Requested-With') == 'XMLHttpRequest'  # Verifica o cabeçalho AJAX
+    # Por padrão a sincronização é incremental; mode=full força a busca de tudo
+    incremental = request.values.get('mode', 'incremental') != 'full'
+    # Sem sync_target, todos os FMCs/domínios cadastrados são sincronizados em paralelo
+    sync_target = request.values.get('sync_target')
+    targets = None
+    if sync_target:
+        target = FP_Targets.get_target(sync_target)
+        if target is None:
+            return jsonify({'status': 'error', 'message': f'FMC/domínio não encontrado: {sync_target}'}), 404
+        targets = [target]
+    try:
+        job, created = get_sync_job_manager().start(incremental=incremental, targets=targets)
+    except (ImportError, ValueError) as e:
+        error_message = f"Erro: Nenhum firewall cadastrado. Adicione um firewall antes de sincronizar. ({e})"
+        logger.error(error_message)
+        if is_ajax:
             return jsonify({'status': 'error', 'message': error_message})
+        flash(error_message, 'error')
+        return redirect(url_for('homepage'))
+
+    if created:
+        logger.info(f"Iniciando sincronização {job.job_id}...")
+        message = 'Sincronização iniciada.'
     else:
-        try:
-            print("Iniciando sincronização...")
-
-            # Construct absolute paths to the scripts
-            script_dir = os.path.dirname(os.path.abspath(__file__))  # Get directory of app.py
-            fp_acp_path = os.path.join(script_dir, "FP_ACP.py")
-            fp_do_path = os.path.join(script_dir, "FP_DynamicObject.py")
-            fp_so_path = os.path.join(script_dir, "FP_StaticObject.py")
-
-            # Get the current environment
-            current_env = os.environ.copy()
-
-            # Print environment variables from Flask for debugging
-            #print("Environment variables from Flask:")
-            #for key, value in current_env.items():
-            #    print(f"{key}: {value}")
-
-            # Print Python version for debugging
-            print(f"Python version from Flask: {sys.version}")
-
-            # Execute FP_ACP.py with explicit environment
-            subprocess.run(['python', fp_acp_path], check=True, env=current_env)
-            print("FP_ACP.py concluído.")
-            flash("Regras de Access Control Policies sincronizadas com sucesso!", 'success')
-            # Execute FP_DynamicObjects.py with explicit environment
-            subprocess.run(['python', fp_do_path], check=True, env=current_env)
-            print("FP_DynamicObjects.py concluído.")
-            flash("Objetos dinâmicos sincronizados com sucesso!", 'success')
-            # Execute FP_StaticObjects.py with explicit environment
-            subprocess.run(['python', fp_so_path], check=True, env=current_env)
-            print("FP_StaticObjects.py concluído.")
-            flash("Objetos estáticos sincronizados com sucesso!", 'success')
-            return redirect(url_for('homepage'))
-        except subprocess.CalledProcessError as e:
-            flash(f"Erro durante a sincronização: {e}", 'error')
-            return redirect(url_for('homepage'))
-        except FileNotFoundError:
-            flash("Erro: Um ou mais scripts de sincronização não foram encontrados.", 'error')
-            return redirect(url_for('homepage'))
+        logger.info(f"Sincronização {job.job_id} já em andamento; pedido agrupado.")
+        message = 'Já existe uma sincronização em andamento; acompanhando a mesma.'
+
+    if is_ajax:
+        return jsonify({
+            'status': 'started',
+            'message': message,
+            'job_id': job.job_id,
+            'status_url': url_for('sync_status', job_id=job.job_id),
+            'stream_url': url_for('sync_stream', job_id=job.job_id),
+        }), 202
+    flash(message, 'info')
+    return redirect(url_for('homepage'))
+
+@app.route('/sync/<job_id>')
+def sync_status(job_id):
+    job = get_sync_job_manager().get(job_id)
+    if job is None:
+        return jsonify({'status': 'error', 'message': 'Job de sincronização não encontrado.'}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/sync/<job_id>/events')
+def sync_stream(job_id):
+    """
+    Transmite o progresso da sincronização via Server-Sent Events até o job terminar.
+    """
+    job = get_sync_job_manager().get(job_id)
+    if job is None:
+        return jsonify({'status': 'error', 'message': 'Job de sincronização não encontrado.'}), 404
+
+    def events():
+        while True:
+            done = job.done
+            yield f"data: {json.dumps(job.to_dict())}\n\n"
+            if done:
+                break
+            time.sleep(1)
+
+    return Response(events(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
 
 @app.route('/dynamic_objects')
+@cached_page
 def dynamic_objects():
     with app.app_context():
         dynamic_objects = get_dynamic_objects()
         if dynamic_objects is None:
             flash("Objetos dinâmicos ainda não foram sincronizados. Por favor, sincronize.", 'warning')
             return redirect(url_for('homepage'))
+        usage = FP_Store.usage_counts('dynamic')
+        for obj in dynamic_objects:
+            obj['usage'] = usage.get(obj['id'])
         return render_template('dynamic_objects.html', dynamic_objects=dynamic_objects, csrf=csrf)  # Change here: pass csrf object
 
+@app.route('/csrf_token')
+def csrf_token():
+    """
+    Token CSRF da sessão, buscado pelas páginas em cache (que não podem trazer o token embutido).
+    """
+    response = jsonify({'csrf_token': generate_csrf()})
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+@app.route('/objects/<object_id>/where_used')
+def object_where_used(object_id):
+    """
+    Regras e políticas que usam um objeto (estático ou dinâmico), inclusive por meio de grupos aninhados.
+    """
+    found = [obj for obj in FP_Store.find_objects(object_id) if obj['object_id'] == object_id]
+    if not found:
+        flash(f"Objeto {object_id} não encontrado.", 'warning')
+        return redirect(url_for('dynamic_objects'))
+    results = FP_Store.where_used(object_id)
+    policies = sorted({result['policy'] for result in results})
+    rules = len({(result['policy'], result['position']) for result in results})
+    return render_template('object_usage.html', obj=found[0], results=results, policies=policies, rules=rules)
+
+@app.route('/objects/unused')
+def unused_objects():
+    kind = request.args.get('kind') or None
+    if kind not in (None, 'static', 'dynamic'):
+        kind = None
+    return render_template('unused_objects.html', objects=FP_Store.unused_objects(kind), kind=kind)
+
+
+@app.route('/snapshots')
+@cached_page
+def snapshots():
+    return render_template('snapshots.html', snapshots=FP_Snapshot.list_snapshots())
+
+def parse_snapshot_pair(args):
+    """
+    Snapshots a comparar (?old=&new=); por padrão, o mais recente e o anterior a ele.
+    Levanta ValueError se não houver o que comparar.
+    """
+    snapshot_ids = [snapshot['snapshot_id'] for snapshot in FP_Snapshot.list_snapshots()]
+    try:
+        new_id = int(args['new']) if args.get('new') else snapshot_ids[0]
+        old_id = int(args['old']) if args.get('old') else next(i for i in snapshot_ids if i < new_id)
+    except (IndexError, StopIteration):
+        raise ValueError("São necessários dois snapshots (duas sincronizações) para comparar.")
+    except ValueError:
+        raise ValueError("old e new devem ser ids de snapshot")
+    return old_id, new_id
+
+@app.route('/snapshots/diff')
+@cached_page
+def snapshot_diff():
+    """
+    O que mudou entre duas sincronizações: regras adicionadas, removidas, modificadas e movidas por política,
+    e objetos (inclusive membros de grupos e IPs de objetos dinâmicos). ?policy= limita a uma política.
+    """
+    diff, error = None, None
+    try:
+        old_id, new_id = parse_snapshot_pair(request.args)
+        diff = FP_Snapshot.diff_snapshots(old_id, new_id, request.args.get('policy') or None)
+    except ValueError as e:
+        error = str(e)
+    return render_template('snapshot_diff.html', diff=diff, error=error, snapshots=FP_Snapshot.list_snapshots(),
+                           policy=request.args.get('policy', ''))
+
+@app.route('/api/snapshots')
+def snapshots_api():
+    return jsonify({'snapshots': FP_Snapshot.list_snapshots()})
+
+@app.route('/api/snapshots/diff')
+@cached_page
+def snapshot_diff_api():
+    """
+    Mesma comparação de snapshot_diff, em JSON: ?old=&new=[&policy=].
+    """
+    try:
+        old_id, new_id = parse_snapshot_pair(request.args)
+        return jsonify(FP_Snapshot.diff_snapshots(old_id, new_id, request.args.get('policy') or None))
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+
+def parse_hit_count_query(args):
+    """
+    Parâmetros das páginas de hits: policy, days e n (só na de regras mais usadas).
+    Levanta ValueError para valores inválidos.
+    """
+    try:
+        days = float(args['days']) if args.get('days') else None
+        limit = min(max(int(args.get('n', FP_HitCount.TOP_RULES)), 1), MAX_RULES_PAGE_SIZE)
+    except ValueError:
+        raise ValueError("days e n devem ser números")
+    if days is not None and days <= 0:
+        raise ValueError("days deve ser maior que zero")
+    return {'policy': args.get('policy') or None, 'days': days, 'limit': limit}
+
+# As páginas de hits não usam cached_page: com ?days= o resultado depende da hora atual, não só da geração
+@app.route('/hitcounts/top')
+def top_hit_rules():
+    """
+    As regras com mais hits (?n=), no total ou nos últimos dias (?days=), de todas as políticas ou de uma (?policy=).
+    Com format=json, retorna o resultado em JSON.
+    """
+    return hit_count_page('top')
+
+@app.route('/hitcounts/zero')
+def zero_hit_rules():
+    """
+    As regras sem nenhum hit, de todas as políticas ou de uma (?policy=); com ?days=, só as zeradas há esses dias.
+    Com format=json, retorna o resultado em JSON.
+    """
+    return hit_count_page('zero')
+
+def hit_count_page(mode):
+    rules, error, query = [], None, {}
+    try:
+        query = parse_hit_count_query(request.args)
+        if mode == 'top':
+            rules = FP_HitCount.top_rules(query['limit'], query['policy'], query['days'])
+        else:
+            rules = FP_HitCount.zero_hit_rules(query['policy'], query['days'])
+    except ValueError as e:
+        error = str(e)
+    if request.args.get('format') == 'json':
+        if error:
+            return jsonify({'status': 'error', 'message': error}), 400
+        return jsonify(dict(query, mode=mode, collection=FP_HitCount.last_collection(), rules=rules))
+    return render_template('hit_counts.html', mode=mode, rules=rules, error=error, query=query,
+                           collection=FP_HitCount.last_collection(), policies=FP_Store.list_policies())
 
 
 if __name__ == '__main__':